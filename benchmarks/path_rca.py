@@ -0,0 +1,67 @@
+# coding=utf-8
+"""
+Arc formulation (rca.offline_rca) against the path formulation
+(path_rca.solve_offline_rca_path) on data/N1.graphml and on random graphs.
+
+    PYTHONPATH=. python benchmarks/path_rca.py
+"""
+import os
+import random
+import time
+
+import igraph
+from pulp import PULP_CBC_CMD, LpStatusOptimal, value
+
+from survivability.rca.rca import offline_rca
+from survivability.rca.path_rca import solve_offline_rca_path
+
+N1 = os.path.join(os.path.dirname(__file__), '..', 'survivability', 'data'
+                  , 'N1.graphml')
+
+
+def instance(graph, n_demands, seed):
+    rnd = random.Random(seed)
+    weights = [rnd.randint(1, 10) for _ in graph.es]
+    s = []
+    d = []
+    for _ in range(n_demands):
+        u, v = rnd.sample(range(len(graph.vs)), 2)
+        s.append(u)
+        d.append(v)
+    c = [rnd.randint(1, 3) for _ in range(n_demands)]
+    spare = [rnd.randint(6, 12) for _ in graph.es]
+    return s, d, c, weights, spare
+
+
+def run(name, graph, n_demands, seed=0):
+    s, d, c, weights, spare = instance(graph, n_demands, seed)
+
+    t = time.time()
+    prob = offline_rca(graph, s, d, c, weights, spare)
+    build = time.time() - t
+    prob.solve(PULP_CBC_CMD(msg=False))
+    arc_time = time.time() - t
+    arc_obj = value(prob.objective) if prob.status == LpStatusOptimal else None
+
+    t = time.time()
+    paths = solve_offline_rca_path(graph, s, d, c, weights, spare
+                                   , solver=PULP_CBC_CMD(msg=False))
+    path_time = time.time() - t
+    path_obj = None
+    if paths is not None:
+        path_obj = sum(weights[e_id] for epath in paths for e_id in epath)
+
+    print('%-16s %5d %5d %4d | arc %8.2fs (build %6.2fs) obj %-8s'
+          '| path %7.2fs obj %-8s'
+          % (name, len(graph.vs), len(graph.es), n_demands, arc_time, build
+             , arc_obj, path_time, path_obj))
+
+
+if __name__ == '__main__':
+    run('N1', igraph.Graph.Read_GraphML(N1), 20)
+    for n, m, k in [(30, 60, 30), (60, 150, 60), (100, 300, 60), (150, 450, 80)]:
+        random.seed(n)
+        graph = igraph.Graph.Erdos_Renyi(n=n, m=m)
+        while not graph.is_connected():
+            graph = igraph.Graph.Erdos_Renyi(n=n, m=m)
+        run('random', graph, k)
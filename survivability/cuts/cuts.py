@@ -1,9 +1,16 @@
 # coding=utf-8
-from itertools import combinations
+from heapq import heappush, heappop
+from math import exp, log
+
+import numpy as np
 
 
 def multilayer_cuts(entities, entities_av, relate, sregs=None, sregs_av=None):
     """
+    Enumerates the HLE cuts produced by every single and every pair of
+    low layer failure events (an LLE or an SRLG). Each LLE and each HLE
+    set is a bitmask (the LLE -> HLE relation is a bitmask row per LLE),
+    and the HLE cuts are grouped in a dict keyed by their bitmask.
 
     Args:
         entities: A list of Low Layer Entities (LLEs) indexes (all different).
@@ -15,13 +22,15 @@ def multilayer_cuts(entities, entities_av, relate, sregs=None, sregs_av=None):
         sregs_av: A list of SRLGs availability, no superposition
                   of LLE and SRLG is supposed.
 
-    Returns: ret_cuts, ret_cuts_times, ret_cuts_p
+    Returns: ret_cuts, ret_cuts_p, ret_cuts_times
 
-        ret_cuts: A list of HLE cuts, each element is a list of HLE
-                  indexes
-        ret_cuts_times: A list with the times each HLE cut is repeated
+        ret_cuts: A list of HLE cuts, each element is a sorted list of HLE
+                  indexes, in order of first appearance.
         ret_cuts_p: A list with the probability of each HLE cut, same
-                    order as ret_cuts.
+                    order as ret_cuts. A single event has probability
+                    1 - av, a pair of events the probability that both
+                    fail and every other event is available.
+        ret_cuts_times: A list with the times each HLE cut is repeated
 
     """
 
@@ -29,89 +38,235 @@ def multilayer_cuts(entities, entities_av, relate, sregs=None, sregs_av=None):
         sregs = []
         sregs_av = []
 
-    base = [[i] for i in entities] + sregs[:]
-    av = entities_av[:] + sregs_av[:]
+    position = dict((ent, pos) for pos, ent in enumerate(entities))
+    hles = sorted(set(hle for rel in relate for hle in rel))
+    hle_bit = dict((hle, pos) for pos, hle in enumerate(hles))
+    lle_mask = []
+    for rel in relate:
+        mask = 0
+        for hle in rel:
+            mask |= 1 << hle_bit[hle]
+        lle_mask.append(mask)
 
-    low_cuts = []
-    low_cuts_p = []
-    for comb in combinations(base, 2):
-        low_cuts.append(list(set(comb[0] + comb[1])))
-        prob = 1
-        for c_id, conduit in enumerate(base):
-            if conduit in low_cuts[-1]:
-                prob *= (1 - av[c_id])
-            else:
-                prob *= av[c_id]()
-        low_cuts_p.append(prob)
+    # HLE bitmask and HLE set of every failure event (LLE or SRLG)
+    base = [[ent] for ent in entities] + sregs[:]
+    av = entities_av[:] + sregs_av[:]
+    masks = []
+    hle_sets = []
+    for conduit in base:
+        mask = 0
+        hle_set = set()
+        for ent in conduit:
+            mask |= lle_mask[position[ent]]
+            hle_set.update(relate[position[ent]])
+        masks.append(mask)
+        hle_sets.append(hle_set)
 
-    low_cuts = base[:] + low_cuts[:]
-    low_cuts_p = [(1 - av_c) for av_c in av] + low_cuts_p
+    # Log-space probabilities: a pair fails with probability
+    # prod(av) * (1 - av_a) / av_a * (1 - av_b) / av_b, computed a row of
+    # pairs at a time. Events with av = 0 are counted apart so that the
+    # ratio is defined (any other one of them makes the pair impossible).
+    av_arr = np.array(av, dtype=float)
+    zero = av_arr <= 0
+    with np.errstate(divide='ignore'):
+        log_up = np.where(zero, 0., np.log(np.where(zero, 1., av_arr)))
+        log_down = np.log(1 - av_arr)
+    ratio = log_down - log_up
+    log_all = log_up.sum()
+    zeros = int(zero.sum())
 
-    high_cuts = []
-    high_cuts_p = []
-    for i, ots_cut in enumerate(low_cuts):
-        otu_cut = []
-        for ots in ots_cut:
-            otu_cut = otu_cut + relate[ots]
-        otu_cut = set(otu_cut)
+    # Each cut keeps [times, probability, a, b], with (a, b) the first
+    # pair of events giving it (a == b for the single events) to list its
+    # HLEs at the end.
+    found = {}
+    order = []
+    for c_id, mask in enumerate(masks):
+        entry = found.get(mask)
+        if entry is None:
+            entry = found[mask] = [0, 0, c_id, c_id]
+            order.append(entry)
+        entry[0] += 1
+        entry[1] += 1 - av[c_id]
 
-        high_cuts.append(otu_cut)
-        high_cuts_p.append(low_cuts_p[i])
+    n_base = len(base)
+    for a in range(n_base - 1):
+        mask_a = masks[a]
+        row = np.exp(log_all + ratio[a] + ratio[a + 1:])
+        others = zeros - zero[a] - zero[a + 1:]
+        row[others > 0] = 0.
+        for b, mask_b, prob in zip(range(a + 1, n_base), masks[a + 1:]
+                                   , row.tolist()):
+            mask = mask_a | mask_b
+            entry = found.get(mask)
+            if entry is None:
+                order.append([1, prob, a, b])
+                found[mask] = order[-1]
+            else:
+                entry[0] += 1
+                entry[1] += prob
 
     ret_cuts = []
     ret_cuts_p = []
     ret_cuts_times = []
-    for otu_cut in high_cuts:
-        if list(otu_cut) not in ret_cuts:
-            ret_cuts.append(list(otu_cut))
-            ret_cuts_times.append(high_cuts.count(otu_cut))
-
-            prob = 0
-            for i, otu_cut2 in enumerate(high_cuts):
-                if otu_cut == otu_cut2:
-                    prob += high_cuts_p[i]
-            ret_cuts_p.append(prob)
+    for times, prob, a, b in order:
+        ret_cuts.append(sorted(hle_sets[a] | hle_sets[b]))
+        ret_cuts_p.append(prob)
+        ret_cuts_times.append(times)
     return ret_cuts, ret_cuts_p, ret_cuts_times
 
 
 def inlayer_cuts(entities, entities_av, srlgs, srlgs_av):
     """
+    Enumerates the entity cuts produced by every pair of failure events (a
+    single entity or an SRLG). Each cut is keyed in a dict by the sorted
+    tuple of its entity positions, so a pair of single entities is keyed
+    without building any set.
+
     Args:
         entities: A list of single layer entities.
         entities_av: A lis of the availability of each entity
         srlgs: A list with srlgs, each srlg is a list of entities.
         srlgs_av: A list with srlgs availability.
-    Returns: ret_cuts, ret_cuts_times, ret_cuts_p
-        ret_cuts: A list of entity cuts, each element is a list of entities
-        ret_cuts_times: A list with the times each entities cut is repeated
+    Returns: ret_cuts, ret_cuts_p, ret_cuts_times
+        ret_cuts: A list of entity cuts, each element is a list of
+                  entities ordered as entities, in order of first
+                  appearance.
         ret_cuts_p: A list with the probability of each entity cut, same
-                    order as ret_cuts.
+                    order as ret_cuts. Each pair of events adds the product
+                    of their unavailabilities.
+        ret_cuts_times: A list with the times each entities cut is repeated
     """
 
-    cuts = []
-    cuts_p = []
-
-    base = [[ent] for ent in entities] + srlgs
+    position = dict((ent, pos) for pos, ent in enumerate(entities))
+    n_ent = len(entities)
+    base = [(pos,) for pos in range(n_ent)]
+    base += [tuple(sorted(set(position[ent] for ent in srlg)))
+             for srlg in srlgs]
     base_av = entities_av + srlgs_av
-    for comb in combinations(base, 2):
-        cut = []
-        prob = 1
-        for e_id in comb[0]+comb[1]:
-            cut.append(e_id)
-            prob *= (1 - base_av[base.index(e_id)])
-        cuts.append(set(cut))
-        cuts_p.append(prob)
-
-    ret_cuts = list(set(cuts))
+    with np.errstate(divide='ignore'):
+        log_down = np.log(1 - np.array(base_av, dtype=float))
+
+    # Each cut keeps [times, probability, key]
+    found = {}
+    order = []
+    n_base = len(base)
+    for a in range(n_base - 1):
+        row = np.exp(log_down[a] + log_down[a + 1:]).tolist()
+        if a < n_ent:
+            # Pairs of single entities
+            keys = [(a, b) for b in range(a + 1, n_ent)]
+        else:
+            keys = []
+        set_a = set(base[a])
+        for b in range(max(a + 1, n_ent), n_base):
+            keys.append(tuple(sorted(set_a.union(base[b]))))
+        for key, prob in zip(keys, row):
+            entry = found.get(key)
+            if entry is None:
+                order.append([1, prob, key])
+                found[key] = order[-1]
+            else:
+                entry[0] += 1
+                entry[1] += prob
+
+    ret_cuts = []
     ret_cuts_p = []
-    ret_cuts_times =[]
-
-    for cut in ret_cuts:
-        ret_cuts_times.append(cuts.count(cut))
-        p = 0
-        for c_id, cut2 in enumerate(cuts):
-            if cut2 == cut:
-                p += cuts_p[c_id]
-        ret_cuts_p.append(p)
+    ret_cuts_times = []
+    for times, prob, key in order:
+        ret_cuts.append([entities[pos] for pos in key])
+        ret_cuts_p.append(prob)
+        ret_cuts_times.append(times)
     return ret_cuts, ret_cuts_p, ret_cuts_times
 
+
+def failure_scenarios(entities, entities_av, srlgs=None, srlgs_av=None
+                      , relate=None, mass=None, threshold=None
+                      , max_order=None):
+    """
+    Lazily enumerates the failure states of independent failure events (a
+    single entity or an SRLG), of any order, in decreasing probability.
+
+    Every event starts in its most likely status (working when av >= 0.5)
+    and changing the status of event i multiplies the probability of the
+    state by rho(i) <= 1. With the events sorted by rho, the subsets of
+    changed events are enumerated best-first from a heap: the successors of
+    a subset with last event j add j + 1, or replace j by j + 1, so every
+    subset is reached once and after its predecessor. Memory grows with
+    the number of states yielded, not with the number of events.
+
+    Args:
+        entities: A list of single layer entities (all different).
+        entities_av: A list of the availability of each entity.
+        srlgs: A list with srlgs, each srlg is a list of entities, or None.
+        srlgs_av: A list with srlgs availability.
+        relate: A list with the High Layer Entities (HLEs) related to each
+                entity, ordered as entities, or None. When given the cuts
+                are HLE cuts (see multilayer_cuts).
+        mass: Stop once the yielded states add up to this probability, or
+              None.
+        threshold: Stop before the first state with probability lower
+                   than this, or None.
+        max_order: The maximum number of events out of their most likely
+                   status (the number of failed events when every
+                   availability is at least 0.5), or None.
+
+    Returns: A generator of (cut, p, uncovered) tuples
+        cut: A list with the failed entities ordered as entities (or the
+             failed HLEs, sorted, with relate). The first state has no
+             failures when every availability is at least 0.5. Different
+             event states can give the same cut.
+        p: The probability of the state.
+        uncovered: The probability of the states not yielded yet, 1 minus
+                   the probability of the states yielded so far.
+    """
+    if srlgs is None:
+        srlgs = []
+        srlgs_av = []
+
+    position = dict((ent, pos) for pos, ent in enumerate(entities))
+    base = [[ent] for ent in entities] + srlgs
+    av = list(entities_av) + list(srlgs_av)
+
+    # Most likely status of every event and the log ratio of changing it.
+    failed = set()
+    log_p = 0.
+    flips = []
+    for c_id, av_c in enumerate(av):
+        up, down = av_c, 1 - av_c
+        if down > up:
+            failed.add(c_id)
+            up, down = down, up
+        log_p += log(up)
+        if down > 0:
+            flips.append((log(down) - log(up), c_id))
+    flips.sort(key=lambda flip: -flip[0])
+
+    covered = 0.
+    heap = [(-log_p, ())]
+    while heap:
+        neg_log, changed = heappop(heap)
+        p = exp(-neg_log)
+        if threshold is not None and p < threshold:
+            return
+
+        state = failed.symmetric_difference(flips[i][1] for i in changed)
+        if relate is None:
+            cut = sorted(set(position[ent] for c_id in state
+                             for ent in base[c_id]))
+            cut = [entities[pos] for pos in cut]
+        else:
+            cut = sorted(set(hle for c_id in state for ent in base[c_id]
+                             for hle in relate[position[ent]]))
+        covered += p
+        yield cut, p, max(0., 1. - covered)
+        if mass is not None and covered >= mass:
+            return
+
+        last = changed[-1] if changed else -1
+        if last + 1 < len(flips):
+            log_next = flips[last + 1][0]
+            if max_order is None or len(changed) < max_order:
+                heappush(heap, (neg_log - log_next, changed + (last + 1,)))
+            if changed:
+                heappush(heap, (neg_log - log_next + flips[last][0]
+                                , changed[:-1] + (last + 1,)))
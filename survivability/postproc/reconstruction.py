@@ -1,54 +1,276 @@
 # coding=utf-8
+from heapq import heappush, heappop
 
-from survivability.utils.utils import _e2vpath
+import numpy as np
 
 
-def path_reconstruction(graph, variables, ei_index):
-    epsilon = 0.0000001
-    eids = []
+_EPSILON = 0.0000001
+
+
+def _walk(arcs):
+    """
+    Splits the selected arcs of a demand into paths, each arc read once.
+    Args:
+        arcs: A list of (i, j, e_id, units) tuples with the arcs whose flow
+              variable is selected and the units of flow on them.
+
+    Returns: A list with an epath per unit of flow leaving the source,
+             ordered from the source. Cycles are dropped.
+    """
+    out = {}
+    net = {}
+    for i, j, e_id, units in arcs:
+        out.setdefault(i, []).append([j, e_id, units])
+        net[i] = net.get(i, 0) + units
+        net[j] = net.get(j, 0) - units
+    sources = [i for i, value in net.items() if value > 0]
+    if len(sources) > 1:
+        raise IndexError("Not valid epath")
+
+    epaths = []
+    for source in sources:
+        for _ in range(net[source]):
+            vpath = [source]
+            epath = []
+            position = {source: 0}
+            i = source
+            while out.get(i):
+                arc = out[i][-1]
+                arc[2] -= 1
+                if not arc[2]:
+                    out[i].pop()
+                i = arc[0]
+                if i in position:
+                    # Cycle back to i, its arcs are dropped
+                    for v in vpath[position[i] + 1:]:
+                        del position[v]
+                    del vpath[position[i] + 1:]
+                    del epath[position[i]:]
+                    continue
+                position[i] = len(vpath)
+                vpath.append(i)
+                epath.append(arc[1])
+            if net[i] >= 0:
+                raise IndexError("Not valid epath")
+            epaths.append(epath)
+    return epaths
+
+
+def solution_values(prob):
+    """
+    Reads the solution of a solved pulp problem in a single pass.
+    Args:
+        prob: A solved pulp LpProblem instance.
+
+    Returns: A numpy array with the value of each variable, ordered as
+             prob.variables() (the columns of rca.builder.variable_index),
+             0 for the variables without value.
+    """
+    return np.array([var.varValue or 0. for var in prob.variables()]
+                    , dtype=float)
+
+
+def read_paths(values, index):
+    """
+    Rebuilds the epaths of every demand from a solved flow formulation,
+    walking the selected arcs of each demand through an adjacency dict, in
+    time linear in the number of selected arcs.
+    Args:
+        values: A numpy array with the value of each column, as returned by
+                solution_values or SparseModel.solve.
+        index: A dict (k,i,j,e) -> column of the flow variables, or
+               (i,j,e) -> column for the online formulations, as given by
+               the builders with index=True or SparseModel.index.
+
+    Returns: A list with the epaths of each demand k (of the single demand
+             for (i,j,e) keys). Each element is a list with an epath per
+             unit of flow leaving the source, ordered from it: one for the
+             RA/RCA formulations, two for the 1+1 ones where x(i,j,e) can
+             be 2 ([] if there is no flow).
+    """
+    keys = list(index)
+    columns = np.fromiter(index.values(), dtype=np.int64, count=len(keys))
+    units = np.rint(np.asarray(values, dtype=float)[columns]).astype(np.int64)
+    n_demands = 1
+    if keys and len(keys[0]) == 4:
+        n_demands = max(key[0] for key in keys) + 1
+    arcs = [[] for _ in range(n_demands)]
+    for pos in np.flatnonzero(units > 0).tolist():
+        key = keys[pos]
+        k = key[0] if len(key) == 4 else 0
+        arcs[k].append(key[-3:] + (int(units[pos]),))
+    return [_walk(arcs_k) for arcs_k in arcs]
+
+
+def _name_key(name):
+    # The integer key of a pulp variable name, 'x_(1,_2,_3)' -> [1, 2, 3].
+    name = name[name.find('_(') + 2:-1]
+    return [int(ki) for ki in name.split(",_")]
+
+
+def _parse(variables, ei_index, dem_index=None):
+    # Reads each variable name once. Returns the arcs (i, j, e_id, units)
+    # of the selected variables grouped by demand (None without dem_index),
+    # with every demand in variables.
+    arcs = {}
     for var in variables:
-        if var.varValue > epsilon:
-            s = var.name
-            s = s[s.find('_(') + 2:-1]
-            s = s.split(",_")
-            s = [int(si) for si in s]
-            eids.append(s[ei_index])
-    epath = [eids[0]]
-    eids = eids[1:]
-    while len(eids) != 0:
-        vpath = _e2vpath(graph, epath)
-        is_good = False
-        for ei in eids:
-            if (graph.es[ei].source == vpath[0]
-                    or graph.es[ei].target == vpath[0]):
-                epath = [ei] + epath
-                eids.remove(ei)
-                is_good = True
-                break
-            if (graph.es[ei].source == vpath[-1]
-                or graph.es[ei].target == vpath[-1]):
-                epath = epath + [ei]
-                eids.remove(ei)
-                is_good = True
-                break
-        if not is_good:
-            raise IndexError("Not valid epath")
-    return epath
+        key = _name_key(var.name)
+        k = None if dem_index is None else key[dem_index]
+        arcs_k = arcs.setdefault(k, [])
+        if var.varValue is None or var.varValue <= _EPSILON:
+            continue
+        i, j = [ki for n, ki in enumerate(key)
+                if n not in (dem_index, ei_index)]
+        units = max(int(round(var.varValue)), 1)
+        arcs_k.append((i, j, key[ei_index], units))
+    return arcs
+
+
+def path_reconstruction(graph, variables, ei_index):
+    """
+    Rebuilds the epath of a demand from its solved flow variables.
+    Args:
+        graph: A graph that represents the logical topology, or its Topology
+        variables: The solved flow variables x(i,j,e) of the demand.
+        ei_index: Position of the edge index in the variable key.
+
+    Returns: The epath ordered from the source (the first one when more
+             than a unit of flow leaves it, see read_paths).
+    """
+    epaths = _walk(_parse(variables, ei_index).get(None, []))
+    if not epaths:
+        raise IndexError("Not valid epath")
+    return epaths[0]
 
 
 def paths_reconstruction(graph, variables, ei_index, dem_index):
-    vars_k = {}
-    for var in variables:
-        s = var.name
-        s = s[s.find('_(') + 2:-1]
-        s = s.split(",_")
-        s = [int(si) for si in s]
-        if not vars_k.get(s[dem_index]):
-            vars_k[s[dem_index]] = []
-        vars_k[s[dem_index]].append(var)
-    paths = [[]] * len(vars_k)
-    for k in vars_k:
-        epath = path_reconstruction(graph, vars_k[k], ei_index)
-        paths[k] = epath[:]
+    """
+    Rebuilds the epath of every demand from the solved flow variables,
+    reading each variable name once.
+    Args:
+        graph: A graph that represents the logical topology, or its Topology
+        variables: The solved flow variables x(k,i,j,e).
+        ei_index: Position of the edge index in the variable key.
+        dem_index: Position of the demand index in the variable key.
+
+    Returns: A list with the epath of each demand, ordered from its source
+             (see path_reconstruction), [] for the demands without flow.
+    """
+    arcs = _parse(variables, ei_index, dem_index)
+    paths = [[]] * len(arcs)
+    for k, arcs_k in arcs.items():
+        epaths = _walk(arcs_k)
+        if epaths:
+            paths[k] = epaths[0]
     return paths
 
+
+def flow_disaggregation(graph, variables, s, d, c=None, o_index=0
+                        , ei_index=3):
+    """
+    Splits the flows of the source-aggregated formulations
+    (rca.offline_ra_agg, rca.offline_rca_agg) into one path per demand.
+    Demands are taken by decreasing capacity and each one follows the
+    path of its commodity with the largest remaining flow (widest path),
+    whose flow is then reduced by the demand capacity. The split is
+    greedy: when the widest path carries less than the demand capacity
+    the demand still takes it, and is reported as overloaded, since its
+    path uses more capacity than the solved flow.
+    Args:
+        graph: A graph that represents the logical topology, or its Topology
+        variables: The solved flow variables f(o,i,j,e).
+        s: A list of source indexes.
+        d: A list of destination indexes.
+        c: A list of capacities demanded, None for unit demands.
+        o_index: Position of the commodity (source) in the variable key.
+        ei_index: Position of the edge index in the variable key.
+
+    Returns: paths, overloaded
+        paths: A list with the epath of each demand, ordered from its
+               source ([] if s == d, None if no flow reaches d).
+        overloaded: A list with the demands whose path carries less solved
+                    flow than their capacity.
+    """
+    arcs = []
+    for var in variables:
+        if var.varValue is None or var.varValue <= _EPSILON:
+            continue
+        key = _name_key(var.name)
+        i, j = [ki for n, ki in enumerate(key)
+                if n not in (o_index, ei_index)]
+        arcs.append((key[o_index], i, j, key[ei_index], var.varValue))
+    return _disaggregate(arcs, s, d, c)
+
+
+def read_flows(values, index, s, d, c=None):
+    """
+    Same as flow_disaggregation, reading the solution by column.
+    Args:
+        values: A numpy array with the value of each column, as returned by
+                solution_values.
+        index: A dict (o,i,j,e) -> column of the flow variables, as given
+               by rca.offline_ra_agg / rca.offline_rca_agg with index=True
+               (index['f']).
+        s: A list of source indexes.
+        d: A list of destination indexes.
+        c: A list of capacities demanded, None for unit demands.
+
+    Returns: paths, overloaded, as flow_disaggregation.
+    """
+    keys = list(index)
+    columns = np.fromiter(index.values(), dtype=np.int64, count=len(keys))
+    flow = np.asarray(values, dtype=float)[columns]
+    arcs = [keys[pos] + (flow[pos],)
+            for pos in np.flatnonzero(flow > _EPSILON).tolist()]
+    return _disaggregate(arcs, s, d, c)
+
+
+def _disaggregate(arcs, s, d, c):
+    # arcs: (o, i, j, e_id, flow) tuples of the solved flows.
+    if c is None:
+        c = [1] * len(s)
+    # Remaining flow of each commodity, flows[o][i] = {(e_id, j): value}
+    flows = {}
+    for o, i, j, e_id, value in arcs:
+        out = flows.setdefault(o, {}).setdefault(i, {})
+        out[(e_id, j)] = out.get((e_id, j), 0) + value
+
+    paths = [None] * len(s)
+    overloaded = []
+    for k in sorted(range(len(s)), key=lambda k: -c[k]):
+        if s[k] == d[k]:
+            paths[k] = []
+            continue
+        flow = flows.get(s[k], {})
+        # Widest path over the remaining flow.
+        width = {s[k]: float('inf')}
+        pred = {}
+        done = set()
+        heap = [(-width[s[k]], s[k])]
+        while heap:
+            w_i, i = heappop(heap)
+            if i in done:
+                continue
+            done.add(i)
+            if i == d[k]:
+                break
+            for (e_id, j), value in flow.get(i, {}).items():
+                w_j = min(-w_i, value)
+                if (value > _EPSILON and j not in done
+                        and w_j > width.get(j, 0)):
+                    width[j] = w_j
+                    pred[j] = (i, e_id)
+                    heappush(heap, (-w_j, j))
+        if d[k] not in done:
+            continue
+        if width[d[k]] < c[k] - _EPSILON:
+            overloaded.append(k)
+        epath = []
+        j = d[k]
+        while j != s[k]:
+            i, e_id = pred[j]
+            flow[i][(e_id, j)] = max(flow[i][(e_id, j)] - c[k], 0)
+            epath.append(e_id)
+            j = i
+        paths[k] = epath[::-1]
+    return paths, sorted(overloaded)
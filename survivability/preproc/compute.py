@@ -1,5 +1,11 @@
 # coding=utf-8
-from survivability.utils.utils import _e2vpath
+import numpy as np
+
+from survivability.utils.demands import as_demands
+from survivability.utils.scenarios import ScenarioSet
+from survivability.utils.shortest import dijkstra
+from survivability.utils.topology import (as_topology, block_path
+                                          , block_tree, label_components)
 
 
 def compute_ks(scenarios, demands):
@@ -10,6 +16,7 @@ def compute_ks(scenarios, demands):
                    de la lista (escenario) es una lista con los inidices de
                    arco, e_ids, de aquellos arcos que están cortados. La
                    posición en la lista representa el número de escenario.
+                   También puede ser un ScenarioSet (ver utils.scenarios).
 
         demands: Es una lista de demandas. Cada demanda es una tupla de dos
                  elementos, donde el primero es la capacidad demandada y el
@@ -17,6 +24,7 @@ def compute_ks(scenarios, demands):
                  a los caminos de working y protección dedicada del servicio.
                  [(3,[[0],[2,1]]),(2,[[23],[21,13],[45,20]]),(4,[[43]]),
                     ...,(cap,[epath0,epath1])]
+                 También puede ser un DemandSet (ver utils.demands).
     Returns:
             Ks: Es una lista que contiene las demandas que deben ser ruteadas en
             cada escenario. Es decir, cada elemento de Ks es una lista con los
@@ -25,39 +33,117 @@ def compute_ks(scenarios, demands):
             ser restauradas.
 
     """
-    # Genero la lista de demandas que deberían ser ruteadas
+    # Genero la lista de demandas que deberían ser ruteadas. Para cada
+    # escenario, los caminos cortados son la unión (or) de los bitsets de
+    # sus arcos, y una demanda es afectada si todos sus caminos lo están.
+    index = demand_index(demands)
+    slots = index['slots']
+    first = index['first']
+    full = index['full']
+    always = index['no_paths']
+    by_edge = index['by_edge']
+
     ks = []
-    for g, g_list in enumerate(scenarios):
+    for g_list in scenarios:
+        hit = 0
+        for e_id in set(g_list):
+            hit |= by_edge.get(e_id, 0)
         kg = []
-        for k, dem in enumerate(demands):
-            cuts = 0
-            for p_id, p in enumerate(dem[1]):
-                for e_id in g_list:
-                    if e_id in p:
-                        cuts += 1
-                        break
-            if cuts == len(dem[1]):
+        pending = hit & first
+        while pending:
+            low = pending & -pending
+            k = slots[low.bit_length() - 1]
+            if hit & full[k] == full[k]:
                 kg.append(k)
+            pending ^= low
+        if always:
+            kg = sorted(kg + always)
         ks.append(kg)
     return ks
 
 
-def compute_kp(graph, scenarios, demands):
+def demand_index(demands):
+    """
+    Indice invertido arco -> caminos de las demandas que lo usan. Cada
+    camino de cada demanda ocupa un bit (slot), numerados en orden de
+    demanda y de camino, y los conjuntos de caminos son enteros de Python
+    usados como bitsets.
+    Args:
+        demands: Es una lista de demandas. Cada demanda es una tupla de dos
+                 elementos, donde el primero es la capacidad demandada y el
+                 segundo es una lista de caminos. También puede ser un
+                 DemandSet, que guarda el índice para los siguientes usos.
+
+    Returns: Un diccionario con:
+        by_edge: e_id -> bitset de los slots de los caminos que usan el arco.
+        working: e_id -> bitset de los slots de los caminos working (el
+                 primero de cada demanda) que usan el arco.
+        slots: Lista con la demanda de cada slot.
+        first: Bitset con el slot del primer camino de cada demanda.
+        full: Lista con el bitset de todos los slots de cada demanda.
+        no_paths: Lista de las demandas sin caminos.
+    """
+    demands = as_demands(demands)
+    if demands.index is not None:
+        return demands.index
+    path_ptr = demands.path_ptr.tolist()
+    edge_ptr = demands.edge_ptr.tolist()
+    edges = demands.edges.tolist()
+
+    by_edge = {}
+    working = {}
+    slots = []
+    first = 0
+    full = []
+    no_paths = []
+    for k in range(len(demands)):
+        if path_ptr[k] == path_ptr[k + 1]:
+            no_paths.append(k)
+        full_k = 0
+        for p in range(path_ptr[k], path_ptr[k + 1]):
+            bit = 1 << p
+            slots.append(k)
+            full_k |= bit
+            if p == path_ptr[k]:
+                first |= bit
+            for e_id in set(edges[edge_ptr[p]:edge_ptr[p + 1]]):
+                by_edge[e_id] = by_edge.get(e_id, 0) | bit
+                if p == path_ptr[k]:
+                    working[e_id] = working.get(e_id, 0) | bit
+        full.append(full_k)
+    demands.index = {'by_edge': by_edge, 'working': working, 'slots': slots
+                     , 'first': first, 'full': full, 'no_paths': no_paths}
+    return demands.index
+
+
+def compute_kp(graph, scenarios, demands, union_find=False):
     """
+    Las componentes conexas se calculan una vez sobre los arcos que no se
+    cortan en ningún escenario (grafo base); en cada escenario solo se
+    agregan los arcos candidatos a corte que sobreviven, sobre el grafo
+    base contraído, y cada demanda se evalua comparando las etiquetas de
+    sus extremos.
 
     Args:
-        graph: Un grafo de igraph que representa la topología sobre la que
-               se rutean las demandas de servicio.
+        graph: Un grafo de igraph (o su Topology) que representa la
+               topología sobre la que se rutean las demandas de servicio.
         scenarios: Es una lista de escenarios de corte. Donde cada elemento
                    de la lista (escenario) es una lista con los inidices de
                    arco, e_ids, de aquellos arcos que están cortados. La
                    posición en la lista representa el número de escenario.
+                   También puede ser un ScenarioSet (ver utils.scenarios).
         demands: Es una lista de demandas. Cada demanda es una tupla de dos
                  elementos, donde el primero es la capacidad demandada y el
                  segundo es una lista de caminos. Estos caminos representan
                  a los caminos de working y protección dedicada del servicio.
                  [(3,[[0],[2,1]]),(2,[[23],[21,13],[45,20]]),(4,[[43]]),
                     ...,(cap,[epath0,epath1])]
+                 También puede ser un DemandSet (ver utils.demands).
+        union_find: Si es True se usa un union-find con deshacer: los
+                    escenarios se ordenan por los arcos candidatos que
+                    sobreviven y las uniones del prefijo comun con el
+                    escenario anterior se reutilizan. Conviene con muchos
+                    escenarios parecidos (por ejemplo cortes simples).
 
     Returns:
         Kp: Es una lista que contiene las demandas que pueden ser ruteadas en
@@ -66,30 +152,129 @@ def compute_kp(graph, scenarios, demands):
             escenario que corresponde con la psoción de la lista en Kp.
 
     """
-    # Creacion de listas origen y destino para cada demanda.
-    s = []
-    d = []
-    for dem in demands:
-        vpath = _e2vpath(graph, dem[1][0])
-        s.append(vpath[0])
-        d.append(vpath[-1])
+    if union_find:
+        return _kp_union_find(scenarios, *_kp_prepare(graph, scenarios
+                                                      , demands))
 
     # Genero lista de demandas que tienen al menos un camino disponible por
-    # subgrafo
-    Kp = []
+    # subgrafo.
+    return [np.flatnonzero(row).tolist()
+            for row in kp_rows(graph, scenarios, demands)]
+
+
+def _kp_prepare(graph, scenarios, demands):
+    # Arcos candidatos a corte (los de algún escenario), extremos de cada
+    # uno y de cada demanda en el grafo base contraído (sin los candidatos).
+    topology = as_topology(graph)
+    s, d = compute_sides(topology, demands)
+    if isinstance(scenarios, ScenarioSet):
+        cand = scenarios.edge_ids()
+    else:
+        cand = sorted(set(e_id for cuts in scenarios for e_id in cuts))
+    base_mask = np.ones(topology.n_edges, dtype=bool)
+    base_mask[cand] = False
+    base = topology.components(base_mask)
+    cand = np.array(cand, dtype=np.int64)
+    cand_u = base[topology.source[cand]]
+    cand_v = base[topology.target[cand]]
+    s = base[np.array(s, dtype=np.int64)]
+    d = base[np.array(d, dtype=np.int64)]
+    return topology.n_vertices, cand, cand_u, cand_v, s, d
+
+
+def kp_rows(graph, scenarios, demands):
+    """
+    Versión por filas de compute_kp, sin armar las listas: genera un
+    escenario por vez. En lugar de copiar el grafo, se etiquetan las
+    componentes del grafo base contraído con los arcos candidatos que
+    sobreviven.
+
+    Args:
+        graph: Un grafo de igraph (o su Topology) que representa la
+               topología sobre la que se rutean las demandas de servicio.
+        scenarios: La lista de escenarios de corte, como en compute_kp.
+        demands: La lista de demandas, como en compute_kp.
+
+    Returns: Un generador con un array de booleanos por escenario, con un
+             elemento por demanda (True si la demanda tiene al menos un
+             camino entre su origen y destino en el escenario).
+    """
+    n_vertices, cand, cand_u, cand_v, s, d = _kp_prepare(graph, scenarios
+                                                         , demands)
+    for cuts in scenarios:
+        alive = ~np.isin(cand, list(cuts))
+        labels = label_components(n_vertices, cand_u[alive], cand_v[alive])
+        yield labels[s] == labels[d]
+
+
+class _RollbackDSU(object):
+    # Union-find con union por tamaño y sin compresión de caminos, para
+    # poder deshacer las últimas uniones.
+    def __init__(self, n):
+        self.parent = list(range(n))
+        self.size = [1] * n
+        self.history = []
+
+    def find(self, i):
+        parent = self.parent
+        while parent[i] != i:
+            i = parent[i]
+        return i
+
+    def union(self, i, j):
+        i, j = self.find(i), self.find(j)
+        if i != j and self.size[i] < self.size[j]:
+            i, j = j, i
+        if i != j:
+            self.parent[j] = i
+            self.size[i] += self.size[j]
+        self.history.append(j if i != j else None)
+
+    def rollback(self, n):
+        # Deshace uniones hasta dejar n en la historia.
+        while len(self.history) > n:
+            j = self.history.pop()
+            if j is not None:
+                i = self.parent[j]
+                self.parent[j] = j
+                self.size[i] -= self.size[j]
+
+
+def _kp_union_find(scenarios, n_vertices, cand, cand_u, cand_v, s, d):
+    position = {e_id: pos for pos, e_id in enumerate(cand.tolist())}
+    cand_u = cand_u.tolist()
+    cand_v = cand_v.tolist()
+    s = s.tolist()
+    d = d.tolist()
+
+    # Arcos candidatos que sobreviven en cada escenario, en orden, y
+    # escenarios ordenados para que los consecutivos compartan prefijos.
+    alive = []
     for cuts in scenarios:
-        Kp.append([])
-        g2 = graph.copy()
-        g2.delete_edges(cuts)
-        for i, source in enumerate(s):
-            res = g2.get_all_shortest_paths(source, to=d[i], mode=3)
-            if res:
-                Kp[-1].append(i)
+        cut = set(position[e_id] for e_id in cuts)
+        alive.append([pos for pos in range(len(cand_u)) if pos not in cut])
+    order = sorted(range(len(scenarios)), key=lambda g: alive[g])
+
+    dsu = _RollbackDSU(n_vertices)
+    applied = []
+    Kp = [None] * len(scenarios)
+    for g in order:
+        common = 0
+        limit = min(len(applied), len(alive[g]))
+        while common < limit and applied[common] == alive[g][common]:
+            common += 1
+        dsu.rollback(common)
+        del applied[common:]
+        for pos in alive[g][common:]:
+            dsu.union(cand_u[pos], cand_v[pos])
+            applied.append(pos)
+        find = dsu.find
+        Kp[g] = [k for k in range(len(s)) if find(s[k]) == find(d[k])]
 
     return Kp
 
 
-def compute_sp(scenarios, demands, inst_s):
+def compute_sp(scenarios, demands, inst_s, once=False):
     """
 
     Args:
@@ -97,14 +282,20 @@ def compute_sp(scenarios, demands, inst_s):
                    de la lista (escenario) es una lista con los inidices de
                    arco, e_ids, de aquellos arcos que están cortados. La
                    posición en la lista representa el número de escenario.
+                   También puede ser un ScenarioSet (ver utils.scenarios).
         demands: Es una lista de demandas. Cada demanda es una tupla de dos
                  elementos, donde el primero es la capacidad demandada y el
                  segundo es una lista de caminos. Estos caminos representan
                  a los caminos de working y protección dedicada del servicio.
                  [(3,[[0],[2,1]]),(2,[[23],[21,13],[45,20]]),(4,[[43]]),
                     ...,(cap,[epath0,epath1])]
+                 También puede ser un DemandSet (ver utils.demands).
         inst_s: Representa a la capacidad spare pre-instalada. Puede ser una
                 lista o un label para un atributo de los arcos del grafo.
+        once: Si es False, una demanda cuyo camino working es cortado
+              libera su capacidad una vez por cada arco cortado del camino
+              (como siempre lo hizo compute_sp). Si es True la libera una
+              sola vez por escenario.
 
     Returns:
         Sp: Es una lista que contiene las capacidades disponibles en cada arco
@@ -113,42 +304,337 @@ def compute_sp(scenarios, demands, inst_s):
             len(graph.es) que contiene las capacidades disponibles (remanente
             + liberadas por servicios)
     """
-    # Generación de la lista Sp
-    sp =[]
+    # Generación de la lista Sp. Las demandas cuyo camino working es
+    # cortado liberan su capacidad en todos los arcos del camino, una vez
+    # por cada arco cortado del camino (o una sola vez con once). La matriz
+    # escenarios x arcos se arma en una sola pasada de NumPy.
+    demands = as_demands(demands)
+    index = demand_index(demands)
+    working = index['working']
+    slots = index['slots']
+    n_edges = len(inst_s)
+
+    pairs_g = []
+    pairs_k = []
+    times = []
     for g, g_list in enumerate(scenarios):
-        sg = inst_s[:]
-        for k, dem in enumerate(demands):
-            #for p_id, p in enumerate(dem[1]):
-                for e_id in g_list:
-                    if e_id in dem[1][0]:
-                        for e_id in dem[1][0]:
-                            sg[e_id] += dem[0]
-        sp.append(sg)
-    return sp
+        if once:
+            hits = [0]
+            for e_id in set(g_list):
+                hits[0] |= working.get(e_id, 0)
+        else:
+            hits = [working.get(e_id, 0) for e_id in g_list]
+        released_g = {}
+        for hit in hits:
+            while hit:
+                low = hit & -hit
+                k = slots[low.bit_length() - 1]
+                released_g[k] = released_g.get(k, 0) + 1
+                hit ^= low
+        for k, n in released_g.items():
+            pairs_g.append(g)
+            pairs_k.append(k)
+            times.append(n)
+
+    # Caminos working en formato CSR
+    lengths, offsets, values = demands.working()
+    caps = demands.caps
+
+    pairs_g = np.array(pairs_g, dtype=np.int64)
+    pairs_k = np.array(pairs_k, dtype=np.int64)
+    times = np.array(times, dtype=np.int64)
+    counts = lengths[pairs_k]
+    rows = np.repeat(pairs_g, counts)
+    starts = np.repeat(offsets[pairs_k] - np.cumsum(counts) + counts, counts)
+    cols = values[starts + np.arange(counts.sum(), dtype=np.int64)]
+    released = np.bincount(rows * n_edges + cols
+                           , weights=np.repeat(caps[pairs_k] * times
+                                               , counts)
+                           , minlength=len(scenarios) * n_edges)
+
+    dtype = np.array(inst_s).dtype
+    if len(caps):
+        dtype = np.result_type(dtype, caps)
+    sp = np.tile(np.array(inst_s, dtype=dtype), (len(scenarios), 1))
+    sp += released.reshape(len(scenarios), n_edges).astype(dtype)
+    return sp.tolist()
 
 
 def compute_sides(graph, demands):
     """
 
     Args:
-        graph: Un grafo de igraph que representa la topología sobre la que
-               se rutean las demandas de servicio.
+        graph: Un grafo de igraph (o su Topology) que representa la
+               topología sobre la que se rutean las demandas de servicio.
         demands: Es una lista de demandas. Cada demanda es una tupla de dos
                  elementos, donde el primero es la capacidad demandada y el
                  segundo es una lista de caminos. Estos caminos representan
                  a los caminos de working y protección dedicada del servicio.
                  [(3,[[0],[2,1]]),(2,[[23],[21,13],[45,20]]),(4,[[43]]),
                     ...,(cap,[epath0,epath1])]
+                 También puede ser un DemandSet (ver utils.demands).
     Returns:
         s:  Es una lista ordenada de los origenes de las demandas.
         d:  Es una lista ordenada de los destinos de las demandas.
     """
-    # Creacion de listas origen y destino para cada demanda.
-    s = []
-    d = []
-    for dem in demands:
-        vpath = _e2vpath(graph, dem[1][0])
-        s.append(vpath[0])
-        d.append(vpath[-1])
-    return s, d
+    # Creacion de listas origen y destino para cada demanda, con los
+    # caminos de working convertidos en un solo lote (o los guardados en
+    # el DemandSet).
+    s, d = as_demands(demands).sides(graph)
+    return s.tolist(), d.tolist()
+
+
+def reduce_scenarios(graph, scenarios, demands, inst_s='s'):
+    """
+    Reduce la lista de escenarios antes de armar el problema de SCA:
+    agrupa los escenarios equivalentes (mismo conjunto de arcos cortados),
+    descarta los que no requieren restauración y los dominados. Un
+    escenario g es dominado por h si los arcos cortados de g están
+    incluidos en los de h, las demandas a rutear en g (kp ∩ ks) también se
+    rutean en h, en cada arco que sobrevive en h la capacidad disponible
+    de g no es menor a la de h, y en los arcos que sobreviven en g pero no
+    en h no es negativa (solo puede serlo con inst_s negativa). Así
+    cualquier ruteo de restauración de h sirve para g con la misma
+    capacidad spare, y el óptimo no cambia.
+
+    Args:
+        graph: Un grafo de igraph (o su Topology) que representa la
+               topología sobre la que se rutean las demandas de servicio.
+        scenarios: Es una lista de escenarios de corte. Donde cada elemento
+                   de la lista (escenario) es una lista con los inidices de
+                   arco, e_ids, de aquellos arcos que están cortados. La
+                   posición en la lista representa el número de escenario.
+                   También puede ser un ScenarioSet (ver utils.scenarios).
+        demands: Es una lista de demandas. Cada demanda es una tupla de dos
+                 elementos, donde el primero es la capacidad demandada y el
+                 segundo es una lista de caminos. Estos caminos representan
+                 a los caminos de working y protección dedicada del servicio.
+                 [(3,[[0],[2,1]]),(2,[[23],[21,13],[45,20]]),(4,[[43]]),
+                    ...,(cap,[epath0,epath1])]
+                 También puede ser un DemandSet (ver utils.demands).
+        inst_s: Representa a la capacidad spare pre-instalada. Puede ser una
+                lista o un label para un atributo de los arcos del grafo.
+
+    Returns: reduced, mapping
+        reduced: La lista de escenarios que quedan, en el orden original
+                 (un ScenarioSet si scenarios lo es).
+        mapping: Una lista con un elemento por escenario original, la
+                 posición en reduced del escenario que lo cubre (él mismo,
+                 uno equivalente o uno que lo domina), o None si el
+                 escenario no requiere restauración.
+    """
+    topology = as_topology(graph)
+    demands = as_demands(demands, topology)
+    if isinstance(inst_s, str):
+        inst_s = topology.attribute(inst_s)
+
+    kp = compute_kp(topology, scenarios, demands)
+    ks = compute_ks(scenarios, demands)
+    sp = compute_sp(scenarios, demands, inst_s)
+    keep, mapping = reduce_indices(scenarios, kp, ks, sp, len(inst_s))
+    if isinstance(scenarios, ScenarioSet):
+        return scenarios.take(keep), mapping
+    return [scenarios[g] for g in keep], mapping
+
+
+def reduce_indices(scenarios, kp, ks, sp, n_edges):
+    """
+    La reducción de reduce_scenarios a partir de las listas ya calculadas,
+    sin armar la lista reducida.
+
+    Args:
+        scenarios: La lista de escenarios de corte (o un ScenarioSet).
+        kp: La lista Kp de compute_kp.
+        ks: La lista Ks de compute_ks.
+        sp: La lista Sp de compute_sp.
+        n_edges: Cantidad de arcos del grafo.
+
+    Returns: keep, mapping
+        keep: Lista ordenada con los indices de los escenarios que quedan.
+        mapping: Una lista con un elemento por escenario, la posición en
+                 keep del escenario que lo cubre, o None (como en
+                 reduce_scenarios).
+    """
+    sp = np.array(sp, dtype=float).reshape(len(scenarios), n_edges)
+
+    # Demandas a rutear por escenario como bitsets
+    routed = []
+    for g in range(len(scenarios)):
+        bits = 0
+        for k in set(kp[g]) & set(ks[g]):
+            bits |= 1 << k
+        routed.append(bits)
+
+    def alive_mask(cut):
+        mask = np.ones(n_edges, dtype=bool)
+        mask[list(cut)] = False
+        return mask
+
+    # Escenarios equivalentes y escenarios sin demandas a rutear (solo se
+    # descartan si no imponen capacidad, sp >= 0 en los arcos que
+    # sobreviven).
+    cuts = {}
+    cover = [None] * len(scenarios)
+    reps = []
+    for g, g_list in enumerate(scenarios):
+        cut = frozenset(g_list)
+        if not routed[g] and np.all(sp[g][alive_mask(cut)] >= 0):
+            continue
+        if cut not in cuts:
+            cuts[cut] = g
+            reps.append(g)
+        cover[g] = cuts[cut]
+
+    # Dominancia: se recorren los representantes de mayor a menor cantidad
+    # de arcos cortados, y cada uno se compara con los ya conservados que
+    # cortan todos sus arcos (indice invertido arco -> bitset de
+    # conservados).
+    reps.sort(key=lambda g: -len(set(scenarios[g])))
+    kept = []
+    masks = []
+    by_edge = {}
+    dominated = {}
+    for g in reps:
+        cut = set(scenarios[g])
+        mask_g = alive_mask(cut)
+        cand = (1 << len(kept)) - 1
+        for e_id in cut:
+            cand &= by_edge.get(e_id, 0)
+            if not cand:
+                break
+        while cand:
+            low = cand & -cand
+            pos = low.bit_length() - 1
+            h = kept[pos]
+            mask = masks[pos]
+            # Los arcos que sobreviven en g pero no en h no los usa el
+            # ruteo de h, solo se exige que no impongan capacidad.
+            if (not routed[g] & ~routed[h]
+                    and np.all(sp[g][mask] >= sp[h][mask])
+                    and np.all(sp[g][mask_g & ~mask] >= 0)):
+                dominated[g] = h
+                break
+            cand ^= low
+        if g in dominated:
+            continue
+        bit = 1 << len(kept)
+        kept.append(g)
+        masks.append(mask_g)
+        for e_id in cut:
+            by_edge[e_id] = by_edge.get(e_id, 0) | bit
+
+    keep = sorted(kept)
+    position = {g: pos for pos, g in enumerate(keep)}
+    mapping = []
+    for g in range(len(scenarios)):
+        h = cover[g]
+        if h is None:
+            mapping.append(None)
+        else:
+            mapping.append(position[dominated.get(h, h)])
+    return keep, mapping
+
+
+def compute_reachable(graph, scenarios, demands, routed=None, max_length=None
+                      , e_length=None):
+    """
+    Este metodo construye, para cada escenario y cada demanda a rutear, el
+    conjunto de arcos que pueden formar parte de algún camino simple entre
+    el origen y el destino de la demanda. Son los arcos de los bloques
+    (componentes biconexas) que están en el camino entre origen y destino
+    del árbol de bloques y vértices de corte del grafo sin los arcos
+    cortados. Los demás arcos (ramas sin salida, otras componentes) no
+    pueden ser usados por ningún camino de restauración.
+
+    Args:
+        graph: Un grafo de igraph (o su Topology) que representa la
+               topología sobre la que se rutean las demandas de servicio.
+        scenarios: Es una lista de escenarios de corte. Donde cada elemento
+                   de la lista (escenario) es una lista con los inidices de
+                   arco, e_ids, de aquellos arcos que están cortados. La
+                   posición en la lista representa el número de escenario.
+                   También puede ser un ScenarioSet (ver utils.scenarios).
+        demands: Es una lista de demandas. Cada demanda es una tupla de dos
+                 elementos, donde el primero es la capacidad demandada y el
+                 segundo es una lista de caminos. Estos caminos representan
+                 a los caminos de working y protección dedicada del servicio.
+                 [(3,[[0],[2,1]]),(2,[[23],[21,13],[45,20]]),(4,[[43]]),
+                    ...,(cap,[epath0,epath1])]
+                 También puede ser un DemandSet (ver utils.demands).
+        routed: Una lista con las demandas a considerar en cada escenario,
+                o None para todas las demandas de Kp ∩ Ks.
+        max_length: Longitud máxima de los caminos, o None. Si se da, un
+                    arco (u,v) solo se conserva si la distancia de origen a
+                    u, más su longitud, más la distancia de v a destino (en
+                    algún sentido) no la supera. Esto restringe el problema
+                    y puede cambiar su óptimo.
+        e_length: La longitud de cada arco para max_length. Puede ser una
+                  lista, un label para un atributo de los arcos del grafo o
+                  None (cantidad de saltos).
+
+    Returns:
+        Kr: Es una lista con un elemento por escenario. Cada elemento es un
+            diccionario demanda -> lista ordenada de e_ids de los arcos que
+            pueden usarse para rutear la demanda en el escenario.
+    """
+    topology = as_topology(graph)
+    demands = as_demands(demands, topology)
+    n = topology.n_vertices
+    edges = topology.edges
+    sources, destinations = compute_sides(topology, demands)
+
+    if routed is None:
+        kp = compute_kp(topology, scenarios, demands)
+        ks = compute_ks(scenarios, demands)
+        routed = [sorted(set(kp[g]) & set(ks[g])) for g in range(len(ks))]
+
+    if max_length is not None:
+        if isinstance(e_length, str):
+            e_length = topology.attribute(e_length)
+        elif e_length is None:
+            e_length = [1] * topology.n_edges
+        indptr = topology.indptr.tolist()
+        pairs = list(zip(topology.indices.tolist()
+                         , topology.neighbors.tolist()))
+        inc = [pairs[indptr[i]:indptr[i + 1]] for i in range(n)]
+
+    Kr = []
+    for g, g_list in enumerate(scenarios):
+        kr = {}
+        Kr.append(kr)
+        if not routed[g]:
+            continue
+        mask = np.ones(topology.n_edges, dtype=bool)
+        mask[list(g_list)] = False
+        blocks = topology.blocks(mask)
+
+        tree = block_tree(n, edges, blocks)
+
+        dist = {}
+        if max_length is not None:
+            allowed = mask.tolist()
+            for k in routed[g]:
+                for v in (sources[k], destinations[k]):
+                    if v not in dist:
+                        dist[v] = dijkstra(inc, e_length, v
+                                           , allowed=allowed)[0]
 
+        for k in routed[g]:
+            path = block_path(tree, sources[k], destinations[k])
+            if not path:
+                kr[k] = []
+                continue
+            e_ids = sorted(e_id for node in path if node >= n
+                           for e_id in blocks[node - n])
+            if max_length is not None:
+                dist_s = dist[sources[k]]
+                dist_d = dist[destinations[k]]
+                keep = []
+                for e_id in e_ids:
+                    u, v = edges[e_id]
+                    length = min(dist_s[u] + dist_d[v], dist_s[v] + dist_d[u])
+                    if length + e_length[e_id] <= max_length:
+                        keep.append(e_id)
+                e_ids = keep
+            kr[k] = e_ids
+    return Kr
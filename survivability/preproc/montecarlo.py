@@ -0,0 +1,226 @@
+# coding=utf-8
+import os
+from concurrent.futures import ProcessPoolExecutor
+from statistics import NormalDist
+
+import numpy as np
+
+from survivability.preproc.compute import compute_sides
+from survivability.utils.demands import as_demands
+from survivability.utils.topology import as_topology, label_components
+
+_model = None
+
+
+def _init_worker(model):
+    global _model
+    _model = model
+
+
+def _csr(lists):
+    # Lista de listas de enteros en formato CSR (indptr, values).
+    indptr = np.zeros(len(lists) + 1, dtype=np.int64)
+    indptr[1:] = np.cumsum([len(values) for values in lists])
+    values = np.array([v for values in lists for v in values], dtype=np.int64)
+    return indptr, values
+
+
+def _any_rows(matrix, indptr, values):
+    # Para cada fila de matrix (muestras) y cada grupo g del CSR, True si
+    # alguna columna values[indptr[g]:indptr[g+1]] es True.
+    n_groups = len(indptr) - 1
+    out = np.zeros((matrix.shape[0], n_groups), dtype=bool)
+    has = np.flatnonzero(indptr[1:] > indptr[:-1])
+    if len(has):
+        gathered = matrix[:, values]
+        out[:, has] = np.logical_or.reduceat(gathered, indptr[has], axis=1)
+    return out
+
+
+def _sample_batch(task, model=None):
+    """
+    Muestrea un lote de estados de falla y evalúa las demandas.
+
+    Args:
+        task: Tupla (seed, size) con la semilla del lote (una
+              numpy.random.SeedSequence) y la cantidad de muestras.
+        model: El modelo armado por sample_availability, o None para usar
+               el del proceso (ver _init_worker).
+
+    Returns: size, s1, s2
+        s1: Array con la suma por demanda de los pesos de las muestras en
+            las que la demanda no sobrevive.
+        s2: Array con la suma de los cuadrados de esos pesos.
+    """
+    if model is None:
+        model = _model
+    seed, size = task
+    rng = np.random.default_rng(seed)
+
+    # Fallas en formato disperso (muestra, evento): la cantidad de muestras
+    # en las que falla cada evento es binomial, y se eligen cuáles.
+    counts = rng.binomial(size, model['q_sample'])
+    events = np.flatnonzero(counts)
+    rows = [rng.choice(size, counts[c_id], replace=False) for c_id in events]
+    rows = np.concatenate(rows) if rows else np.zeros(0, dtype=np.int64)
+    events = np.repeat(events, counts[events])
+
+    if model['delta'] is None:
+        weight = np.ones(size)
+    else:
+        weight = np.exp(model['log_c'] + np.bincount(
+            rows, weights=model['delta'][events], minlength=size))
+
+    # Arcos caídos: los de cada evento que falló
+    ev_ptr = model['event_ptr']
+    lengths = ev_ptr[events + 1] - ev_ptr[events]
+    starts = np.repeat(ev_ptr[events] - np.cumsum(lengths) + lengths, lengths)
+    links = model['event_links'][starts + np.arange(lengths.sum())]
+    down = np.zeros((size, model['n_edges']), dtype=bool)
+    down[np.repeat(rows, lengths), links] = True
+
+    if model['protection']:
+        # La demanda sobrevive si alguno de sus caminos no tiene arcos
+        # caídos.
+        path_down = _any_rows(down, model['path_ptr'], model['path_links'])
+        up = _any_rows(~path_down, model['dem_ptr'], model['dem_paths'])
+    else:
+        # La demanda sobrevive si origen y destino siguen conectados: se
+        # etiquetan las componentes de una copia del grafo por muestra (solo
+        # de las muestras con algún arco caído).
+        n = model['n_vertices']
+        hit = np.flatnonzero(down.any(axis=1))
+        up = np.ones((size, len(model['s'])), dtype=bool)
+        rows, e_ids = np.nonzero(~down[hit])
+        labels = label_components(n * len(hit)
+                                  , model['source'][e_ids] + rows * n
+                                  , model['target'][e_ids] + rows * n)
+        labels = labels.reshape(len(hit), n)
+        up[hit] = labels[:, model['s']] == labels[:, model['d']]
+
+    lost = np.where(up, 0., weight[:, None])
+    return size, lost.sum(axis=0), (lost * lost).sum(axis=0)
+
+
+def sample_availability(graph, demands, entities, entities_av, relate=None
+                        , srlgs=None, srlgs_av=None, n_samples=100000
+                        , batch=4096, seed=None, bias=None, protection=False
+                        , confidence=0.95, workers=None):
+    """
+    Estima la disponibilidad de cada demanda por Monte Carlo: se muestrean
+    por lotes las fallas independientes de las entidades y de los SRLGs,
+    se pasan a fallas de arcos con la relación entidad -> arcos (la misma
+    de multilayer_cuts) y se evalúan todas las demandas de todas las
+    muestras del lote con operaciones de NumPy.
+
+    Args:
+        graph: Un grafo de igraph (o su Topology) que representa la
+               topología sobre la que se rutean las demandas de servicio.
+        demands: Es una lista de demandas. Cada demanda es una tupla de dos
+                 elementos, donde el primero es la capacidad demandada y el
+                 segundo es una lista de caminos. Estos caminos representan
+                 a los caminos de working y protección dedicada del servicio.
+                 [(3,[[0],[2,1]]),(2,[[23],[21,13],[45,20]]),(4,[[43]]),
+                    ...,(cap,[epath0,epath1])]
+                 También puede ser un DemandSet (ver utils.demands).
+        entities: Una lista con las entidades de la capa física (todas
+                  distintas).
+        entities_av: Una lista con la disponibilidad de cada entidad.
+        relate: Una lista con los arcos del grafo (e_ids) relacionados con
+                cada entidad, en el orden de entities, o None si las
+                entidades son los propios arcos del grafo.
+        srlgs: Una lista de SRLGs, cada SRLG es una lista de entidades, o
+               None.
+        srlgs_av: Una lista con la disponibilidad de cada SRLG.
+        n_samples: Cantidad de muestras.
+        batch: Cantidad de muestras por lote.
+        seed: Semilla (entero) o None. Cada lote usa una semilla derivada,
+              así el resultado no depende de workers.
+        bias: Factor de muestreo por importancia, o None. Cada evento se
+              muestrea con probabilidad de falla min(bias * q, 0.5) (q si
+              q >= 0.5) y las muestras se pesan por la razón de
+              verosimilitud. Con pocos eventos de fallas raras reduce la
+              varianza; con muchos eventos un factor grande la aumenta
+              (los pesos se degeneran).
+        protection: Si es True una demanda sobrevive si alguno de sus
+                    caminos no tiene arcos caídos (protección dedicada), si
+                    es False si origen y destino siguen conectados
+                    (restauración, como en compute_kp).
+        confidence: Nivel de confianza de los intervalos.
+        workers: Cantidad de procesos, None para uno por CPU. Con 1 todo se
+                 calcula en el proceso que llama.
+
+    Returns: dem_av, dem_ci
+        dem_av: Lista con la disponibilidad estimada de cada demanda.
+        dem_ci: Lista con la semiamplitud del intervalo de confianza de
+                cada estimación (aproximación normal).
+    """
+    topology = as_topology(graph)
+    if srlgs is None:
+        srlgs = []
+        srlgs_av = []
+    if relate is None:
+        relate = [[ent] for ent in entities]
+
+    position = dict((ent, pos) for pos, ent in enumerate(entities))
+    events = [[ent] for ent in entities] + list(srlgs)
+    q = 1 - np.array(list(entities_av) + list(srlgs_av), dtype=float)
+
+    # Relación evento (entidad o SRLG) -> arcos en formato CSR
+    event_links = [sorted(set(e_id for ent in event
+                              for e_id in relate[position[ent]]))
+                   for event in events]
+    event_ptr, event_values = _csr(event_links)
+
+    # Muestreo por importancia: log w = log_c + x . delta
+    delta = None
+    log_c = 0.
+    q_sample = q
+    if bias is not None:
+        q_sample = np.where(q < 0.5, np.minimum(q * bias, 0.5), q)
+        keep = (q_sample == q) | (q <= 0)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            up = np.log((1 - q) / (1 - q_sample))
+            down = np.log(q / q_sample)
+        up = np.where(keep, 0., up)
+        down = np.where(keep, 0., down)
+        log_c = up.sum()
+        delta = down - up
+
+    demands = as_demands(demands, topology)
+    s, d = compute_sides(topology, demands)
+    model = {'q_sample': q_sample, 'delta': delta, 'log_c': log_c
+             , 'event_ptr': event_ptr, 'event_links': event_values
+             , 'n_edges': topology.n_edges
+             , 'protection': protection, 'n_vertices': topology.n_vertices
+             , 'source': topology.source, 'target': topology.target
+             , 's': np.array(s, dtype=np.int64)
+             , 'd': np.array(d, dtype=np.int64)
+             , 'path_ptr': demands.edge_ptr, 'path_links': demands.edges
+             , 'dem_ptr': demands.path_ptr
+             , 'dem_paths': np.arange(demands.path_ptr[-1], dtype=np.int64)}
+
+    sizes = [batch] * (n_samples // batch)
+    if n_samples % batch:
+        sizes.append(n_samples % batch)
+    seeds = np.random.SeedSequence(seed).spawn(len(sizes))
+    tasks = list(zip(seeds, sizes))
+
+    if workers is None:
+        workers = os.cpu_count() or 1
+    if workers > 1 and len(tasks) > 1:
+        with ProcessPoolExecutor(max_workers=workers
+                                 , initializer=_init_worker
+                                 , initargs=(model,)) as pool:
+            results = list(pool.map(_sample_batch, tasks))
+    else:
+        results = [_sample_batch(task, model) for task in tasks]
+
+    n = sum(size for size, s1, s2 in results)
+    s1 = sum(s1 for size, s1, s2 in results)
+    s2 = sum(s2 for size, s1, s2 in results)
+    unav = s1 / n
+    var = np.maximum(s2 / n - unav * unav, 0.) * n / max(n - 1, 1)
+    z = NormalDist().inv_cdf(0.5 + confidence / 2.)
+    half = z * np.sqrt(var / n)
+    return (1 - unav).tolist(), half.tolist()
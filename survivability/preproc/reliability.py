@@ -0,0 +1,291 @@
+# coding=utf-8
+import numpy as np
+
+from survivability.preproc.compute import compute_sides
+from survivability.utils.topology import as_topology, block_path, block_tree
+
+
+def _simplify(edges, s, t):
+    """
+    Reducciones que no cambian la confiabilidad s-t: bucles, arcos en
+    paralelo, vértices colgantes y vértices de grado 2 en serie (salvo s y
+    t), y componentes que no contienen a s.
+
+    Args:
+        edges: Lista de tuplas (u, v, p) con la disponibilidad p del arco.
+        s, t: Los terminales.
+
+    Returns: La lista de arcos reducida, o None si s y t no están
+             conectados.
+    """
+    while True:
+        # Bucles y arcos en paralelo
+        merged = {}
+        for u, v, p in edges:
+            if u == v:
+                continue
+            key = (u, v) if u < v else (v, u)
+            q = merged.get(key)
+            merged[key] = p if q is None else 1 - (1 - q) * (1 - p)
+        changed = len(merged) != len(edges)
+        edges = [(u, v, p) for (u, v), p in merged.items()]
+
+        # Vértices colgantes y en serie
+        inc = {}
+        for i, (u, v, p) in enumerate(edges):
+            inc.setdefault(u, []).append(i)
+            inc.setdefault(v, []).append(i)
+        removed = set()
+        added = []
+        for x, inc_x in inc.items():
+            if x == s or x == t or any(i in removed for i in inc_x):
+                continue
+            if len(inc_x) == 1:
+                removed.add(inc_x[0])
+            elif len(inc_x) == 2:
+                i, j = inc_x
+                u = edges[i][0] if edges[i][1] == x else edges[i][1]
+                w = edges[j][0] if edges[j][1] == x else edges[j][1]
+                removed.update((i, j))
+                added.append((u, w, edges[i][2] * edges[j][2]))
+        if removed:
+            changed = True
+            edges = [e for i, e in enumerate(edges) if i not in removed]
+            edges += added
+
+        if not changed:
+            break
+
+    # Componente de s
+    adj = {}
+    for u, v, p in edges:
+        adj.setdefault(u, []).append(v)
+        adj.setdefault(v, []).append(u)
+    seen = {s}
+    queue = [s]
+    for x in queue:
+        for y in adj.get(x, ()):
+            if y not in seen:
+                seen.add(y)
+                queue.append(y)
+    if t not in seen:
+        return None
+    return [(u, v, p) for u, v, p in edges if u in seen]
+
+
+def _bfs_order(adj, start):
+    # Vértices alcanzables desde start en orden BFS, los vecinos de menor
+    # grado primero.
+    order = [start]
+    seen = {start}
+    for x in order:
+        for y in sorted(adj[x] - seen, key=lambda y: (len(adj[y]), y)):
+            seen.add(y)
+            order.append(y)
+    return order
+
+
+def _canonical(labels):
+    # Renumera las etiquetas por orden de primera aparición.
+    seen = {}
+    return tuple(seen.setdefault(label, len(seen)) for label in labels)
+
+
+def two_terminal(edges, s, t):
+    """
+    Confiabilidad dos terminales exacta (probabilidad de que s y t estén
+    conectados) con arcos que fallan en forma independiente.
+
+    Después de las reducciones serie y paralelo se arma el diagrama de
+    decisión binario (BDD) de la conectividad por niveles: los arcos se
+    recorren en un orden de ancho de banda chico (Cuthill-McKee) y el nodo
+    de cada nivel es la partición en componentes de la frontera (los
+    vértices ya alcanzados con arcos por recorrer, más s y t). Los nodos
+    con la misma partición se unen, así el tamaño del diagrama depende del
+    ancho de la frontera y no de la cantidad de estados de falla; las
+    probabilidades se propagan nivel por nivel hasta el terminal 1 (s y t
+    en la misma componente).
+
+    Args:
+        edges: Lista de tuplas (u, v, p) con la disponibilidad p de cada
+               arco.
+        s, t: Los terminales.
+
+    Returns: La probabilidad de que s y t estén conectados.
+    """
+    if s == t:
+        return 1.
+    edges = _simplify([(u, v, p) for u, v, p in edges if p > 0], s, t)
+    if edges is None:
+        return 0.
+
+    # Orden de los vértices (Cuthill-McKee desde un vértice
+    # pseudo-periférico, para una frontera angosta) y de los arcos (por su
+    # extremo más tardío)
+    adj = {}
+    for u, v, p in edges:
+        adj.setdefault(u, set()).add(v)
+        adj.setdefault(v, set()).add(u)
+    start = s
+    for _ in range(2):
+        order = _bfs_order(adj, start)
+        start = order[-1]
+    order = dict((x, pos) for pos, x in enumerate(_bfs_order(adj, start)))
+    edges.sort(key=lambda e: (max(order[e[0]], order[e[1]])
+                              , min(order[e[0]], order[e[1]])))
+    last = {}
+    for i, (u, v, p) in enumerate(edges):
+        last[u] = last[v] = i
+
+    front = []
+    states = {(): 1.}
+    reached = 0.
+    for i, (u, v, p) in enumerate(edges):
+        for x in (u, v):
+            if x not in front:
+                front.append(x)
+                states = dict((st + (max(st) + 1 if st else 0,), w)
+                              for st, w in states.items())
+        iu, iv = front.index(u), front.index(v)
+        keep = [j for j, x in enumerate(front)
+                if last[x] > i or x == s or x == t]
+        front = [front[j] for j in keep]
+        ends = [front.index(x) for x in (s, t) if x in front]
+        # Vértices de la frontera que siguen teniendo arcos por recorrer
+        open_ = [j for j, x in enumerate(front) if last[x] > i]
+
+        new = {}
+        for st, w in states.items():
+            la, lb = st[iu], st[iv]
+            branches = [(st, w * (1 - p))]
+            if la == lb:
+                branches = [(st, w)]
+            else:
+                merged = tuple(la if label == lb else label for label in st)
+                branches.append((merged, w * p))
+            for labels, w_b in branches:
+                labels = _canonical([labels[j] for j in keep])
+                if len(ends) == 2 and labels[ends[0]] == labels[ends[1]]:
+                    reached += w_b
+                    continue
+                # Sin salida: la componente de s (o de t) ya no puede crecer
+                alive = set(labels[j] for j in open_)
+                if any(labels[j] not in alive for j in ends):
+                    continue
+                new[labels] = new.get(labels, 0.) + w_b
+        states = new
+    return reached
+
+
+def exact_dem_av(graph, demands, e_av='av', srlgs=None, srlgs_av=None
+                 , cache=None):
+    """
+    Disponibilidad exacta de cada demanda (probabilidad de que origen y
+    destino sigan conectados, como en compute_kp) con fallas
+    independientes de los arcos y, opcionalmente, de SRLGs, sin enumerar
+    escenarios.
+
+    La confiabilidad de una demanda es el producto de la de los bloques
+    (componentes biconexas) del camino entre origen y destino del árbol de
+    bloques, entre los vértices por los que el camino entra y sale de cada
+    uno. Cada bloque se resuelve con two_terminal y el resultado se guarda
+    por su contenido (arcos, disponibilidades y terminales), de modo que
+    los bloques que comparten las demandas se resuelven una sola vez. Con
+    SRLGs se factoriza además sobre el estado de los SRLGs que tocan los
+    bloques del camino de la demanda: a R(G) + (1 - a) R(G sin el SRLG).
+
+    Args:
+        graph: Un grafo de igraph (o su Topology) que representa la
+               topología sobre la que se rutean las demandas de servicio.
+        demands: Es una lista de demandas. Cada demanda es una tupla de dos
+                 elementos, donde el primero es la capacidad demandada y el
+                 segundo es una lista de caminos. Estos caminos representan
+                 a los caminos de working y protección dedicada del servicio.
+                 [(3,[[0],[2,1]]),(2,[[23],[21,13],[45,20]]),(4,[[43]]),
+                    ...,(cap,[epath0,epath1])]
+                 También puede ser un DemandSet (ver utils.demands).
+        e_av: Representa a la disponibilidad de cada arco. Puede ser una
+              lista o un label para un atributo de los arcos del grafo.
+        srlgs: Una lista de SRLGs, cada SRLG es una lista de e_ids que
+               fallan juntos, o None.
+        srlgs_av: Una lista con la disponibilidad de cada SRLG.
+        cache: Diccionario de subproblemas resueltos para compartir entre
+               llamadas con el mismo grafo (aunque cambien e_av o los
+               SRLGs), o None.
+
+    Returns: Una lista con la disponibilidad de cada demanda.
+    """
+    topology = as_topology(graph)
+    if isinstance(e_av, str):
+        e_av = topology.attribute(e_av)
+    if srlgs is None:
+        srlgs = []
+        srlgs_av = []
+    if cache is None:
+        cache = {}
+    # Los resultados con SRLGs dependen de todas las disponibilidades de
+    # arco: cada e_av distinto recibe un número en el cache.
+    av_ids = cache.setdefault('e_av', {})
+    av_id = av_ids.setdefault(tuple(e_av), len(av_ids))
+    n = topology.n_vertices
+    edges = topology.edges
+    sources, destinations = compute_sides(topology, demands)
+
+    structures = {}
+
+    def structure(removed):
+        # Bloques y árbol de bloques del grafo sin los arcos de removed ni
+        # los que nunca están disponibles.
+        if removed not in structures:
+            mask = np.array(e_av, dtype=float) > 0
+            mask[list(removed)] = False
+            blocks = topology.blocks(mask)
+            structures[removed] = blocks, block_tree(n, edges, blocks)
+        return structures[removed]
+
+    def links_only(removed, s, t):
+        blocks, tree = structure(removed)
+        path = block_path(tree, s, t)
+        if not path:
+            return 1. if s == t else 0.
+        value = 1.
+        for i in range(1, len(path) - 1, 2):
+            block = blocks[path[i] - n]
+            a, b = path[i - 1], path[i + 1]
+            block_edges = tuple(edges[e_id] + (e_av[e_id],) for e_id in block)
+            key = ('block', block_edges, min(a, b), max(a, b))
+            if key not in cache:
+                cache[key] = two_terminal(list(block_edges), a, b)
+            value *= cache[key]
+        return value
+
+    def with_srlgs(relevant, removed, s, t):
+        # Factorización sobre el estado de los SRLGs relevantes.
+        if not relevant:
+            return links_only(removed, s, t)
+        key = ('srlg', tuple((frozenset(srlgs[g_id]), srlgs_av[g_id])
+                             for g_id in relevant)
+               , av_id, removed, min(s, t), max(s, t))
+        if key not in cache:
+            g_id = relevant[0]
+            av_g = srlgs_av[g_id]
+            value = av_g * with_srlgs(relevant[1:], removed, s, t)
+            if av_g < 1:
+                value += (1 - av_g) * with_srlgs(
+                    relevant[1:], removed | frozenset(srlgs[g_id]), s, t)
+            cache[key] = value
+        return cache[key]
+
+    none = frozenset()
+    dem_av = []
+    for k in range(len(demands)):
+        s, t = sources[k], destinations[k]
+        relevant = ()
+        if srlgs:
+            blocks, tree = structure(none)
+            used = set(e_id for node in block_path(tree, s, t) if node >= n
+                       for e_id in blocks[node - n])
+            relevant = tuple(g_id for g_id, srlg in enumerate(srlgs)
+                             if used.intersection(srlg))
+        dem_av.append(with_srlgs(relevant, none, s, t))
+    return dem_av
@@ -1,48 +1,202 @@
 # coding=utf-8
+import numpy as np
+
+from survivability.preproc.compute import kp_rows
+
+# Cantidad de bits en 1 de cada byte
+_POPCOUNT = np.array([bin(i).count('1') for i in range(256)], dtype=np.int64)
+
+
+class SurvivalMatrix(object):
+    """
+    Matriz escenarios x demandas de supervivencia (True si la demanda tiene
+    al menos un camino en el escenario, como en Kp), guardada con un bit por
+    elemento (numpy.packbits por filas). Las métricas se calculan por
+    bloques de filas, con reducciones de NumPy.
+
+    Atributos:
+        packed: Array de uint8 de n_scenarios x ceil(n_demands / 8).
+        n_scenarios: Cantidad de escenarios.
+        n_demands: Cantidad de demandas.
+    """
+
+    __slots__ = ('packed', 'n_scenarios', 'n_demands')
+
+    # Cantidad de elementos desempaquetados por bloque de filas
+    block = 1 << 22
+
+    def __init__(self, packed, n_demands):
+        """
+        Args:
+            packed: Array de uint8 con las filas empaquetadas.
+            n_demands: Cantidad de demandas.
+        """
+        self.packed = packed
+        self.n_scenarios = packed.shape[0]
+        self.n_demands = n_demands
+
+    @classmethod
+    def from_rows(cls, rows, n_scenarios, n_demands):
+        """
+        Args:
+            rows: Un iterable de arrays de booleanos por demanda, uno por
+                  escenario.
+            n_scenarios: Cantidad de escenarios.
+            n_demands: Cantidad de demandas.
+
+        Returns: Un SurvivalMatrix.
+        """
+        packed = np.zeros((n_scenarios, (n_demands + 7) // 8), dtype=np.uint8)
+        for g, row in enumerate(rows):
+            packed[g] = np.packbits(row)
+        return cls(packed, n_demands)
+
+    @classmethod
+    def from_kp(cls, kp, n_demands):
+        """
+        Args:
+            kp: La lista Kp (ver compute_kp).
+            n_demands: Cantidad de demandas.
+
+        Returns: Un SurvivalMatrix.
+        """
+        def rows():
+            for kp_g in kp:
+                row = np.zeros(n_demands, dtype=bool)
+                row[list(kp_g)] = True
+                yield row
+        return cls.from_rows(rows(), len(kp), n_demands)
+
+    @classmethod
+    def from_scenarios(cls, graph, scenarios, demands):
+        """
+        Construye la matriz directamente de las componentes conexas de cada
+        escenario (como compute_kp), sin armar Kp.
+
+        Args:
+            graph: Un grafo de igraph (o su Topology).
+            scenarios: Es una lista de escenarios de corte (ver compute_kp).
+            demands: Es una lista de demandas (ver compute_kp).
+
+        Returns: Un SurvivalMatrix.
+        """
+        return cls.from_rows(kp_rows(graph, scenarios, demands)
+                             , len(scenarios), len(demands))
+
+    def _blocks(self):
+        # Bloques de filas desempaquetadas: (inicio, array de booleanos).
+        step = max(1, self.block // max(1, self.n_demands))
+        for start in range(0, self.n_scenarios, step):
+            rows = np.unpackbits(self.packed[start:start + step], axis=1
+                                 , count=self.n_demands)
+            yield start, rows.astype(bool)
+
+    def survives(self, g, k):
+        """
+        Returns: True si la demanda k sobrevive en el escenario g.
+        """
+        return bool(self.packed[g, k >> 3] & (0x80 >> (k & 7)))
+
+    def kp(self):
+        """
+        Returns: La lista Kp equivalente.
+        """
+        kp = []
+        for start, rows in self._blocks():
+            kp.extend(np.flatnonzero(row).tolist() for row in rows)
+        return kp
+
+    def survived(self):
+        """
+        Returns: Array con la cantidad de demandas que sobreviven en cada
+                 escenario.
+        """
+        step = max(1, self.block // max(1, self.packed.shape[1]))
+        counts = np.zeros(self.n_scenarios, dtype=np.int64)
+        for start in range(0, self.n_scenarios, step):
+            packed = self.packed[start:start + step]
+            counts[start:start + step] = _POPCOUNT[packed].sum(axis=1)
+        return counts
+
+    def failed(self):
+        """
+        Returns: Array con la cantidad de demandas que no sobreviven en cada
+                 escenario.
+        """
+        return self.n_demands - self.survived()
+
+    def all_survived(self, scenarios_p=None):
+        """
+        Args:
+            scenarios_p: La probabilidad de cada escenario, o None.
+
+        Returns: La fracción de escenarios en los que sobreviven todas las
+                 demandas, o su probabilidad si se da scenarios_p.
+        """
+        full = self.survived() == self.n_demands
+        if scenarios_p is None:
+            return full.sum() / float(self.n_scenarios)
+        return float(np.dot(np.asarray(scenarios_p, dtype=float), full))
+
+    def demand_scenarios(self):
+        """
+        Returns: Una lista con, para cada demanda, la lista de escenarios en
+                 los que sobrevive.
+        """
+        parts = [[] for _ in range(self.n_demands)]
+        for start, rows in self._blocks():
+            k_ids, g_ids = np.nonzero(rows.T)
+            bounds = np.searchsorted(k_ids, np.arange(self.n_demands + 1))
+            g_ids += start
+            for k in range(self.n_demands):
+                if bounds[k + 1] > bounds[k]:
+                    parts[k].append(g_ids[bounds[k]:bounds[k + 1]])
+        return [np.concatenate(p).tolist() if p else [] for p in parts]
+
+    def availability(self, scenarios_p):
+        """
+        Args:
+            scenarios_p: La probabilidad de cada escenario.
+
+        Returns: Array con la disponibilidad de cada demanda: 1 menos la
+                 probabilidad de los escenarios en los que no sobrevive.
+        """
+        p = np.asarray(scenarios_p, dtype=float)
+        up = np.zeros(self.n_demands)
+        for start, rows in self._blocks():
+            up += p[start:start + len(rows)] @ rows
+        return 1 - (p.sum() - up)
+
+
+def _as_matrix(kp, n_demands):
+    if isinstance(kp, SurvivalMatrix):
+        return kp
+    return SurvivalMatrix.from_kp(kp, n_demands)
 
 
 def global_survived(kp, demands):
-    s = 0
-    for K in kp:
-        if len(K) == len(demands):
-            s += 1
-    return s / float(len(kp))
+    return _as_matrix(kp, len(demands)).all_survived()
 
 
 def survived_dem(kp):
-    sk = []
-    for k in kp:
-        sk.append(len(k))
-    return sk
+    if isinstance(kp, SurvivalMatrix):
+        return kp.survived().tolist()
+    return [len(k) for k in kp]
 
 
 def failed_dem(kp, demands):
-    fk = []
-    for k in kp:
-        fk.append(len(demands) - len(k))
-    return fk
+    return _as_matrix(kp, len(demands)).failed().tolist()
 
 
 def dem_survival(kp, demands):
-    dem_s = []
-    for k in range(demands):
-        gss = []
-        for g_i in range(kp):
-            if k in kp[g_i]:
-                gss.append(g_i)
-        dem_s.append(gss)
-    return dem_s
-
-
-def compute_dem_av(Kp, demands, scenarios, scenarios_p):
-    dem_av = []
-    for k in range(len(demands)):
-        k_p = 0
-        for g_i in range(scenarios):
-            if k not in Kp[g_i]:
-                k_p += scenarios_p[g_i]
-        dem_av.append(1 - k_p)
-    return dem_av
+    return _as_matrix(kp, len(demands)).demand_scenarios()
+
+
+def compute_dem_av(Kp, demands, scenarios, scenarios_p=None):
+    if scenarios_p is None:
+        # Las probabilidades del ScenarioSet
+        scenarios_p = scenarios.p
+    return _as_matrix(Kp, len(demands)).availability(scenarios_p).tolist()
 
 
 def print_scenario(graph, scenario, scenario_p=None, scenario_rep=None, e_lbl='label'):
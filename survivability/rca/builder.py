@@ -0,0 +1,191 @@
+# coding=utf-8
+from pulp import *
+
+from survivability.utils.topology import Topology
+
+
+def edge_values(graph, values, default):
+    """
+    Per edge values of a formulation parameter.
+    Args:
+        graph: A graph that represents the logical topology, or its Topology
+        values: A list of edge values, a label for edge attribute or None
+        default: The value given to every edge when values is None
+
+    Returns: A list of values ordered as graph.es
+
+    """
+    if isinstance(values, str):
+        if isinstance(graph, Topology):
+            return graph.attribute(values)
+        return graph.es[values][:]
+    elif isinstance(values, list):
+        return values[:]
+    else:
+        return [default] * graph.ecount()
+
+
+def incidence(graph):
+    """
+    Node to incident-edge index of a graph, computed once and shared by all
+    the constraints of a formulation.
+    Args:
+        graph: A graph that represents the logical topology, or its Topology
+
+    Returns: edges, inc
+
+        edges: A list of (source, target) tuples ordered as graph.es
+        inc: A list with an element per vertex, each element is a list of
+             (e_id, neighbour) tuples ordered by e_id. Self-loops are
+             listed once.
+
+    """
+    edges = graph.get_edgelist()
+    inc = [[] for _ in range(graph.vcount())]
+    for e_id, (u, v) in enumerate(edges):
+        inc[u].append((e_id, v))
+        if v != u:
+            inc[v].append((e_id, u))
+    return edges, inc
+
+
+def _key(k, i, j, e_id):
+    if k is None:
+        return i, j, e_id
+    return k, i, j, e_id
+
+
+def arc_keys(edges, k=None):
+    """
+    Args:
+        edges: A list of (source, target) tuples as returned by incidence
+        k: A demand index to prefix the keys with, or None
+
+    Returns: A list with both arcs (i,j,e) and (j,i,e) of every edge, with
+             the (k,i,j,e) form when k is given.
+
+    """
+    keys = []
+    for e_id, (u, v) in enumerate(edges):
+        keys.append(_key(k, u, v, e_id))
+        keys.append(_key(k, v, u, e_id))
+    return keys
+
+
+def arc_costs(x, edges, weight, k=None, coefs=None):
+    """
+    Args:
+        x: A dict of flow variables keyed as arc_keys
+        edges: A list of (source, target) tuples as returned by incidence
+        weight: A list of edge weights
+        k: The demand index of the keys, or None
+        coefs: A dict of variable coefficients to accumulate on, or None
+
+    Returns: A dict of variable coefficients sum w(e) * (x(i,j,e) + x(j,i,e))
+
+    """
+    if coefs is None:
+        coefs = {}
+    for e_id, (u, v) in enumerate(edges):
+        for var in (x[_key(k, u, v, e_id)], x[_key(k, v, u, e_id)]):
+            coefs[var] = coefs.get(var, 0) + weight[e_id]
+    return coefs
+
+
+def conservation(x, inc, s, d, rhs=1, k=None):
+    """
+    Flow continuity constraints, one per vertex with incident edges, built
+    in O(E) from the incidence index.
+    Args:
+        x: A dict of flow variables keyed as arc_keys
+        inc: The incidence index as returned by incidence
+        s: source index.
+        d: destination index.
+        rhs: The flow leaving s (and entering d).
+        k: The demand index of the keys, or None
+
+    Returns: A list of LpConstraint ordered by vertex index
+
+    """
+    supply = {d: -rhs}
+    supply[s] = rhs
+    return balance(x, inc, supply, k)
+
+
+def balance(x, inc, supply, k=None):
+    """
+    Flow balance constraints (out - in = supply), one per vertex with
+    incident edges.
+    Args:
+        x: A dict of flow variables keyed as arc_keys
+        inc: The incidence index as returned by incidence
+        supply: A dict with the net flow leaving each vertex, missing
+                vertices have 0.
+        k: The demand (or commodity) index of the keys, or None
+
+    Returns: A list of LpConstraint ordered by vertex index
+
+    """
+    constraints = []
+    for i, inc_i in enumerate(inc):
+        if not inc_i:
+            continue
+        coefs = {}
+        for e_id, j in inc_i:
+            out_var = x[_key(k, i, j, e_id)]
+            in_var = x[_key(k, j, i, e_id)]
+            coefs[out_var] = coefs.get(out_var, 0) + 1
+            coefs[in_var] = coefs.get(in_var, 0) - 1
+        constraints.append(LpConstraint(LpAffineExpression(coefs)
+                                        , LpConstraintEQ
+                                        , rhs=supply.get(i, 0)))
+    return constraints
+
+
+def edge_load(x, edge, e_id, caps, ks=None):
+    """
+    Args:
+        x: A dict of flow variables keyed as arc_keys
+        edge: The (source, target) tuple of the edge
+        e_id: The edge index
+        caps: The capacity of each demand, or a single capacity when ks is
+              None
+        ks: A list of demand indexes, or None for (i,j,e) keys
+
+    Returns: An LpAffineExpression with the capacity used on the edge
+
+    """
+    u, v = edge
+    coefs = {}
+    if ks is None:
+        for var in (x[(u, v, e_id)], x[(v, u, e_id)]):
+            coefs[var] = coefs.get(var, 0) + caps
+    else:
+        for k in ks:
+            for var in (x[(k, u, v, e_id)], x[(k, v, u, e_id)]):
+                coefs[var] = coefs.get(var, 0) + caps[k]
+    return LpAffineExpression(coefs)
+
+
+def variable_index(prob, **families):
+    """
+    Column index of the variables of a formulation, so that a solution can
+    be read back without parsing variable names.
+    Args:
+        prob: A pulp LpProblem instance.
+        families: The dicts of pulp variables (as LpVariable.dicts) of the
+                  formulation, by family name (x=x, j=j, ...).
+
+    Returns: A dict family name -> dict key tuple -> column, where column
+             is the position of the variable in prob.variables() (see
+             postproc.reconstruction.solution_values). Variables that are
+             not in prob are left out. Columns are valid while prob is not
+             modified.
+    """
+    columns = dict((var.name, col) for col, var in enumerate(prob.variables()))
+    index = {}
+    for name, variables in families.items():
+        index[name] = dict((key, columns[var.name])
+                           for key, var in variables.items()
+                           if var.name in columns)
+    return index
@@ -0,0 +1,189 @@
+# coding=utf-8
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+from survivability.utils.topology import as_topology
+from survivability.rca.builder import edge_values
+from survivability.rca.paths import ShortestPaths
+
+_engine = None
+
+
+def _init_worker(graph):
+    global _engine
+    _engine = ShortestPaths(graph)
+
+
+def _solve_chunk(chunk, weight, penalty, sp, protection, engine=None):
+    """
+    Solves the per demand subproblems of a chunk of demands: a shortest
+    path (or a link-disjoint pair with protection) with edge weights
+    weight(e) + c(k) * penalty(e), over the edges with spare(e) >= c(k).
+
+    Returns: A list of (k, epaths, cost) with epaths None when the demand
+             can not be routed.
+    """
+    if engine is None:
+        engine = _engine
+    results = []
+    for k, s_k, d_k, c_k in chunk:
+        engine.weight = [w_e + c_k * p_e for w_e, p_e in zip(weight, penalty)]
+        allowed = None if sp is None else [sp_e >= c_k for sp_e in sp]
+        if protection:
+            epaths = engine.disjoint_pair(s_k, d_k, allowed)
+        else:
+            epath = engine.route(s_k, d_k, allowed)
+            epaths = None if epath is None else (epath,)
+        if epaths is None:
+            results.append((k, None, None))
+        else:
+            cost = sum(engine.weight[e_id] for p in epaths for e_id in p)
+            results.append((k, epaths, cost))
+    return results
+
+
+def _loads(epaths, c, n_edges):
+    load = [0] * n_edges
+    for k, paths_k in enumerate(epaths):
+        for epath in paths_k:
+            for e_id in epath:
+                load[e_id] += c[k]
+    return load
+
+
+def _repair(engine, s, d, c, weight, penalty, sp, protection, epaths):
+    # Keeps the subproblem solutions that fit in the remaining spare
+    # capacity (largest demands first) and reroutes the others over it.
+    residual = sp[:]
+    repaired = [None] * len(s)
+    for k in sorted(range(len(s)), key=lambda k: -c[k]):
+        paths_k = epaths[k]
+        if any(residual[e_id] < c[k] for epath in paths_k for e_id in epath):
+            chunk = [(k, s[k], d[k], c[k])]
+            paths_k = _solve_chunk(chunk, weight, penalty, residual
+                                   , protection, engine)[0][1]
+            if paths_k is None:
+                return None
+        for epath in paths_k:
+            for e_id in epath:
+                residual[e_id] -= c[k]
+        repaired[k] = paths_k
+    return repaired
+
+
+def solve_offline_decomposed(graph, s, d, c, weights=None, spare=None
+                             , protection=False, workers=None, max_iter=50
+                             , step=1.0, tol=0.001):
+    """
+    Solves the Offline Route and Capacity Assignment (rca.offline_rca, or
+    with protection a working/protection link-disjoint pair per demand)
+    by per demand subproblems solved in a process pool.
+
+    Without spare, or when the capacities are not binding for the
+    independent solutions, the subproblems are the whole problem. Otherwise
+    the capacity rows are relaxed with Lagrangian multipliers, updated by
+    subgradient steps, and every iteration a feasible solution is built by
+    routing the demands in sequence over the remaining spare capacity.
+    Args:
+        graph: A graph that represents the logical topology, or its Topology
+        s: A list of source indexes.
+        d: A list of destination indexes.
+        c: A list of capacities demanded
+        weights: A list of edge weights, a label for edge attribute or None
+        spare: A list of edge spare capacity, a label for edge attribute
+               or None (No capacity constraint)
+        protection: Route a link-disjoint pair per demand (1+1).
+        workers: The number of worker processes, None for one per CPU.
+                 With 1 everything runs in the calling process.
+        max_iter: The maximum number of subgradient iterations.
+        step: The subgradient step factor (Polyak step).
+        tol: The relative gap at which the iterations stop.
+
+    Returns: epaths, history
+        epaths: A list with a tuple of epaths per demand (one epath, or
+                working and protection), the best feasible solution
+                found, or None.
+        history: A list of (lower bound, upper bound) per iteration.
+    """
+
+    graph = as_topology(graph)
+
+    weight = edge_values(graph, weights, 1)
+    sp = None if spare is None else edge_values(graph, spare, 0)
+    n_edges = len(weight)
+    if workers is None:
+        workers = os.cpu_count() or 1
+
+    demands = [(k, s[k], d[k], c[k]) for k in range(len(s))]
+    n_chunks = max(1, min(len(demands), 4 * workers))
+    chunks = [demands[i::n_chunks] for i in range(n_chunks)]
+
+    engine = ShortestPaths(graph)
+    pool = None
+    if workers > 1:
+        pool = ProcessPoolExecutor(max_workers=workers
+                                   , initializer=_init_worker
+                                   , initargs=(graph,))
+
+    def solve_all(penalty):
+        results = [None] * len(s)
+        if pool is None:
+            parts = [_solve_chunk(chunk, weight, penalty, sp, protection
+                                  , engine) for chunk in chunks]
+        else:
+            parts = pool.map(_solve_chunk, chunks
+                             , [weight] * n_chunks, [penalty] * n_chunks
+                             , [sp] * n_chunks, [protection] * n_chunks)
+        for part in parts:
+            for k, paths_k, cost in part:
+                results[k] = (paths_k, cost)
+        return results
+
+    def true_cost(epaths):
+        return sum(weight[e_id] for paths_k in epaths for epath in paths_k
+                   for e_id in epath)
+
+    try:
+        penalty = [0.] * n_edges
+        best = None
+        upper = float('inf')
+        history = []
+        for _ in range(max(1, max_iter)):
+            results = solve_all(penalty)
+            if any(paths_k is None for paths_k, cost in results):
+                return None, history
+            epaths = [paths_k for paths_k, cost in results]
+            load = _loads(epaths, c, n_edges)
+
+            lower = sum(cost for paths_k, cost in results)
+            if sp is not None:
+                lower -= sum(p_e * sp_e for p_e, sp_e in zip(penalty, sp))
+
+            if sp is None or all(l_e <= sp_e for l_e, sp_e in zip(load, sp)):
+                # Independent solutions are feasible
+                if true_cost(epaths) < upper:
+                    best, upper = epaths, true_cost(epaths)
+            else:
+                repaired = _repair(engine, s, d, c, weight, penalty, sp
+                                   , protection, epaths)
+                if repaired is not None and true_cost(repaired) < upper:
+                    best, upper = repaired, true_cost(repaired)
+            history.append((lower, upper))
+
+            if sp is None or (upper < float('inf')
+                              and upper - lower <= tol * max(1., abs(upper))):
+                break
+
+            # Subgradient step
+            grad = [l_e - sp_e for l_e, sp_e in zip(load, sp)]
+            norm = sum(g_e * g_e for g_e in grad)
+            if norm == 0:
+                break
+            gap = upper - lower if upper < float('inf') else abs(lower) + 1
+            theta = step * gap / norm
+            penalty = [max(0., p_e + theta * g_e)
+                       for p_e, g_e in zip(penalty, grad)]
+        return best, history
+    finally:
+        if pool is not None:
+            pool.shutdown()
@@ -0,0 +1,155 @@
+# coding=utf-8
+from pulp import *
+
+from survivability.utils.topology import as_topology
+from survivability.rca.builder import (edge_values, incidence, arc_keys
+                                       , arc_costs, conservation, edge_load)
+from survivability.rca.paths import ShortestPaths
+
+
+class OnlineRCA(object):
+    """
+    Online Route and Capacity Assignment for a stream of demands.
+
+    The model of rca.online_rca is built once per topology. Each request
+    only changes the right-hand sides of the continuity rows of its source
+    and destination and of the capacity rows, which are kept as
+    x(i,j,e) + x(j,i,e) <= spare(e) / c (same feasible set as
+    c * (x(i,j,e) + x(j,i,e)) <= spare(e)). The solver is warm started with
+    the shortest path over the edges with enough spare capacity, and the
+    capacity used by every accepted demand is taken from the spare
+    capacity of its edges.
+    """
+
+    def __init__(self, graph, weights=None, spare=None, solver=None
+                 , instance_name="NN"):
+        """
+        Args:
+            graph: A graph that represents the logical topology, or its Topology
+            weights: A list of edge weights, a label for edge attribute or
+                     None
+            spare: A list of edge spare capacity, a label for edge attribute
+                   or None (No capacity constraint)
+            solver: A pulp solver, None for CBC with warm start.
+            instance_name: a name for the instance (LPproblem)
+        """
+
+        graph = as_topology(graph)
+
+        self.weight = edge_values(graph, weights, 1)
+        self.spare = None if spare is None else edge_values(graph, spare, 0)
+        if solver is None:
+            solver = PULP_CBC_CMD(msg=False, warmStart=True)
+        self.solver = solver
+
+        self.edges, self.inc = incidence(graph)
+        self.paths = ShortestPaths(graph, self.weight)
+
+        self.prob = LpProblem('OnRCA instance: %s' % instance_name
+                              , LpMinimize)
+
+        # Flow variables Xij
+        self.x = LpVariable.dicts('flow variables x(i,j,e)'
+                                  , arc_keys(self.edges), lowBound=0
+                                  , upBound=1, cat=LpInteger)
+
+        # Minimize sum of flow variables
+        self.prob += LpAffineExpression(arc_costs(self.x, self.edges
+                                                  , self.weight))
+
+        # Flow continuity constraint, one row per vertex with edges.
+        self.rows = {}
+        vertices = [i for i, inc_i in enumerate(self.inc) if inc_i]
+        for i, constraint in zip(vertices, conservation(self.x, self.inc
+                                                        , None, None)):
+            self.rows[i] = constraint
+            self.prob += constraint
+
+        # Capacity constraint, right-hand sides set on each request.
+        self.cap_rows = []
+        if self.spare is not None:
+            for e_id, edge in enumerate(self.edges):
+                self.cap_rows.append(edge_load(self.x, edge, e_id, 1) <= 0)
+                self.prob += self.cap_rows[-1]
+
+        self._sides = ()
+
+    def route(self, s, d, c):
+        """
+        Routes a demand and, if it is accepted, reserves its capacity.
+        Args:
+            s: source index.
+            d: destination index.
+            c: capacities demanded
+
+        Returns: The epath from s to d, or None if the demand is rejected
+                 (also when s or d has no edges).
+        """
+        if s not in self.rows or d not in self.rows:
+            return None
+        for i in self._sides:
+            self.rows[i].changeRHS(0)
+        self.rows[d].changeRHS(-1)
+        self.rows[s].changeRHS(1)
+        self._sides = (s, d)
+
+        allowed = None
+        if self.spare is not None and c > 0:
+            allowed = [sp_e >= c for sp_e in self.spare]
+            for e_id, row in enumerate(self.cap_rows):
+                row.changeRHS(self.spare[e_id] / float(c))
+        else:
+            # No capacity is used, both directions of every edge may be used.
+            for row in self.cap_rows:
+                row.changeRHS(2)
+
+        # Warm start
+        for var in self.x.values():
+            var.setInitialValue(0)
+        start = self.paths.route(s, d, allowed)
+        if start is not None:
+            v = s
+            for e_id in start:
+                u, w = self.edges[e_id]
+                nxt = w if u == v else u
+                self.x[(v, nxt, e_id)].setInitialValue(1)
+                v = nxt
+
+        self.prob.solve(self.solver)
+        if self.prob.status != LpStatusOptimal:
+            return None
+
+        out = {}
+        for (i, j, e_id), var in self.x.items():
+            if var.varValue is not None and var.varValue > 0.5:
+                out.setdefault(i, []).append((e_id, j))
+        # Each arc is used once. Zero cost cycles in the solution are
+        # dropped when the walk gets back to a vertex already in the path.
+        epath = []
+        position = {s: 0}
+        v = s
+        while v != d:
+            e_id, v = out[v].pop()
+            if v in position:
+                del epath[position[v]:]
+                position = {u: k for u, k in position.items()
+                            if k <= position[v]}
+            else:
+                epath.append(e_id)
+                position[v] = len(epath)
+
+        if self.spare is not None:
+            for e_id in epath:
+                self.spare[e_id] -= c
+        return epath
+
+    def release(self, epath, c):
+        """
+        Gives back the capacity of a departing demand.
+        Args:
+            epath: The epath of the demand.
+            c: The capacity of the demand.
+        """
+        if self.spare is not None:
+            for e_id in epath:
+                self.spare[e_id] += c
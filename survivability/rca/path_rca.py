@@ -0,0 +1,230 @@
+# coding=utf-8
+from pulp import *
+
+from survivability.utils.topology import as_topology
+from survivability.utils.shortest import dijkstra, tree_path
+from survivability.rca.builder import edge_values
+from survivability.rca.paths import ShortestPaths
+
+
+def candidate_paths(graph, s, d, c, n_paths=3, weights=None, spare=None
+                    , max_length=None, max_hops=None):
+    """
+    Candidate paths of each demand, its k shortest paths over the edges
+    with enough spare capacity.
+    Args:
+        graph: A graph that represents the logical topology, or its Topology
+        s: A list of source indexes.
+        d: A list of destination indexes.
+        c: A list of capacities demanded
+        n_paths: The number of candidate paths per demand.
+        weights: A list of edge weights, a label for edge attribute or None
+        spare: A list of edge spare capacity, a label for edge attribute
+               or None (No capacity constraint)
+        max_length: Longer paths are not candidates, or None.
+        max_hops: Paths with more edges are not candidates, or None.
+
+    Returns: A list with a list of epaths per demand.
+    """
+    engine = ShortestPaths(graph, weights)
+    sp = None if spare is None else edge_values(graph, spare, 0)
+    paths = []
+    for k in range(len(s)):
+        allowed = None if sp is None else [sp_e >= c[k] for sp_e in sp]
+        paths.append(engine.k_shortest(s[k], d[k], n_paths, allowed
+                                       , max_length, max_hops))
+    return paths
+
+
+def _path_model(s, c, paths, weight, sp, relax, artificial
+                , instance_name):
+    prob = LpProblem('Path RCA instance: %s' % instance_name, LpMinimize)
+
+    y_combs = []
+    for k in range(len(s)):
+        for p_id in range(len(paths[k])):
+            y_combs.append((k, p_id))
+
+    y = LpVariable.dicts('path variables y(k,p)', y_combs, lowBound=0
+                         , upBound=1
+                         , cat=LpContinuous if relax else LpInteger)
+
+    # Minimize the length of the selected paths
+    coefs = {}
+    for k, p_id in y_combs:
+        coefs[y[(k, p_id)]] = sum(weight[e_id] for e_id in paths[k][p_id])
+
+    # Unrouted demand variables, so that the relaxation is always feasible.
+    a = {}
+    if artificial:
+        big_num = 10. * (sum(weight) + 1) * max(len(s), 1)
+        a = LpVariable.dicts('unrouted variables a(k)', range(len(s))
+                             , lowBound=0, upBound=1, cat=LpContinuous)
+        for k in range(len(s)):
+            coefs[a[k]] = big_num
+    prob += LpAffineExpression(coefs)
+
+    # A path per demand
+    dem_rows = []
+    for k in range(len(s)):
+        row = {y[(k, p_id)]: 1 for p_id in range(len(paths[k]))}
+        if artificial:
+            row[a[k]] = 1
+        dem_rows.append(LpConstraint(LpAffineExpression(row), LpConstraintEQ
+                                     , rhs=1))
+        prob += dem_rows[-1]
+
+    # Capacity constraint, only for the edges of some candidate path
+    cap_rows = {}
+    if sp is not None:
+        loads = {}
+        for k, p_id in y_combs:
+            for e_id in paths[k][p_id]:
+                load = loads.setdefault(e_id, {})
+                var = y[(k, p_id)]
+                load[var] = load.get(var, 0) + c[k]
+        for e_id in sorted(loads):
+            cap_rows[e_id] = LpConstraint(LpAffineExpression(loads[e_id])
+                                          , LpConstraintLE, rhs=sp[e_id])
+            prob += cap_rows[e_id]
+
+    return prob, y, dem_rows, cap_rows
+
+
+def offline_rca_path(graph, s, d, c, paths, weights=None, spare=None
+                     , relax=False, instance_name="NN"):
+    """
+    Path based Offline Route and Capacity Assignment, selects one of the
+    candidate paths of each demand.
+    Args:
+        graph: A graph that represents the logical topology, or its Topology
+        s: A list of source indexes.
+        d: A list of destination indexes.
+        c: A list of capacities demanded
+        paths: A list with the candidate epaths of each demand (see
+               candidate_paths)
+        weights: A list of edge weights, a label for edge attribute or None
+        spare: A list of edge spare capacity, a label for edge attribute
+               or None (No capacity constraint)
+        relax: Continuous path variables (LP relaxation).
+        instance_name: a name for the instance (LPproblem)
+
+    Returns: A Pulp LpProblem instance, with path variables y(k,p) where p
+             indexes paths[k].
+
+    """
+
+    graph = as_topology(graph)
+
+    weight = edge_values(graph, weights, 1)
+    sp = None if spare is None else edge_values(graph, spare, 0)
+    return _path_model(s, c, paths, weight, sp, relax, False
+                       , instance_name)[0]
+
+
+def solve_offline_rca_path(graph, s, d, c, weights=None, spare=None
+                           , n_paths=3, max_length=None, max_hops=None
+                           , pricing=True, max_iter=20, max_paths=48
+                           , solver=None, lp_solver=None
+                           , instance_name="NN"):
+    """
+    Solves the Offline Route and Capacity Assignment with the path based
+    formulation. Candidate paths come from candidate_paths and, with
+    pricing, columns with negative reduced cost in the LP relaxation are
+    added before solving the integer problem over all the columns. If
+    that problem is infeasible the number of k shortest candidates is
+    doubled, up to max_paths (price and branch, so the result can be
+    worse than the optimum of rca.offline_rca).
+    Args:
+        graph: A graph that represents the logical topology, or its Topology
+        s: A list of source indexes.
+        d: A list of destination indexes.
+        c: A list of capacities demanded
+        weights: A list of edge weights, a label for edge attribute or None
+        spare: A list of edge spare capacity, a label for edge attribute
+               or None (No capacity constraint)
+        n_paths: The number of initial candidate paths per demand.
+        max_length: Longer paths are not candidates, or None.
+        max_hops: Paths with more edges are not candidates, or None.
+        pricing: Add columns by reduced cost (only with spare).
+        max_iter: The maximum number of pricing rounds.
+        max_paths: The maximum number of k shortest candidates per demand.
+        solver: A pulp solver, or None.
+        lp_solver: A pulp solver for the LP relaxations of the pricing
+                   rounds, or None to use solver (CBC without messages if
+                   both are None).
+        instance_name: a name for the instance (LPproblem)
+
+    Returns: A list with the epath of each demand, as paths_reconstruction,
+             or None if no feasible selection was found.
+    """
+
+    graph = as_topology(graph)
+
+    weight = edge_values(graph, weights, 1)
+    sp = None if spare is None else edge_values(graph, spare, 0)
+    paths = candidate_paths(graph, s, d, c, n_paths, weight, sp, max_length
+                            , max_hops)
+
+    if pricing and sp is not None:
+        if lp_solver is None:
+            lp_solver = solver
+        if lp_solver is None:
+            lp_solver = PULP_CBC_CMD(msg=False)
+        engine = ShortestPaths(graph, weight)
+        known = [set(tuple(p) for p in paths_k) for paths_k in paths]
+        for _ in range(max_iter):
+            prob, y, dem_rows, cap_rows = _path_model(s, c, paths, weight, sp
+                                                      , True, True
+                                                      , instance_name)
+            prob.solve(lp_solver)
+            if prob.status != LpStatusOptimal:
+                break
+            added = 0
+            for k in range(len(s)):
+                # Reduced cost of a path: its length minus the dual of the
+                # demand row minus c(k) times the capacity duals (<= 0).
+                k_weight = weight[:]
+                for e_id, row in cap_rows.items():
+                    k_weight[e_id] -= c[k] * min(row.pi or 0, 0)
+                allowed = [sp_e >= c[k] for sp_e in sp]
+                dist, pred = dijkstra(engine.inc, k_weight, s[k]
+                                      , targets=[d[k]], allowed=allowed)
+                if d[k] not in dist or dist[d[k]] >= (dem_rows[k].pi or 0) - 1e-9:
+                    continue
+                epath = tree_path(engine.edges, pred, s[k], d[k])
+                length = sum(weight[e_id] for e_id in epath)
+                if ((max_hops is not None and len(epath) > max_hops)
+                        or (max_length is not None and length > max_length)
+                        or tuple(epath) in known[k]):
+                    continue
+                known[k].add(tuple(epath))
+                paths[k].append(epath)
+                added += 1
+            if not added:
+                break
+
+    # The generated columns may not hold an integer solution, in that case
+    # more candidates are added until max_paths per demand.
+    while True:
+        prob, y, dem_rows, cap_rows = _path_model(s, c, paths, weight, sp
+                                                  , False, False
+                                                  , instance_name)
+        prob.solve(solver)
+        if prob.status == LpStatusOptimal:
+            break
+        if n_paths >= max_paths:
+            return None
+        n_paths = min(2 * n_paths, max_paths)
+        more = candidate_paths(graph, s, d, c, n_paths, weight, sp
+                               , max_length, max_hops)
+        for k in range(len(s)):
+            known_k = set(tuple(p) for p in paths[k])
+            paths[k] += [p for p in more[k] if tuple(p) not in known_k]
+    chosen = []
+    for k in range(len(s)):
+        for p_id in range(len(paths[k])):
+            if y[(k, p_id)].varValue > 0.5:
+                chosen.append(paths[k][p_id])
+                break
+    return chosen
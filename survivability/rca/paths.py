@@ -0,0 +1,308 @@
+# coding=utf-8
+from heapq import heappush, heappop
+
+from pulp import LpStatusOptimal
+
+from survivability.utils.shortest import dijkstra, tree_path
+from survivability.rca.builder import edge_values, incidence
+from survivability.rca.rca import online_1p1_rca_2
+from survivability.postproc.reconstruction import (solution_values
+                                                   , read_paths)
+
+
+class ShortestPaths(object):
+    """
+    Solver free Route Assignment. Keeps the incidence index and the edge
+    weights of a graph so that every query is a single Dijkstra run.
+    """
+
+    def __init__(self, graph, weights=None):
+        """
+        Args:
+            graph: A graph that represents the logical topology, or its Topology
+            weights: A list of edge weights, a label for edge attribute or
+                     None
+        """
+        self.weight = edge_values(graph, weights, 1)
+        self.edges, self.inc = incidence(graph)
+
+    def route(self, s, d, allowed=None):
+        """
+        Online Route Assignment, same optimum as rca.online_ra.
+        Args:
+            s: source index.
+            d: destination index.
+            allowed: A list of booleans, ordered as the edges, False for
+                     the edges that can not be used, or None.
+
+        Returns: The epath from s to d, or None if d is not reachable.
+        """
+        return self.routes(s, [d], allowed)[0]
+
+    def routes(self, s, ds, allowed=None):
+        """
+        Routes from one source to many destinations with a single search.
+        Args:
+            s: source index.
+            ds: A list of destination indexes.
+            allowed: A list of booleans, ordered as the edges, False for
+                     the edges that can not be used, or None.
+
+        Returns: A list with the epath to each destination (None for the
+                 unreachable ones).
+        """
+        dist, pred = dijkstra(self.inc, self.weight, s, targets=ds
+                              , allowed=allowed)
+        return [tree_path(self.edges, pred, s, d) if d in dist else None
+                for d in ds]
+
+    def offline_routes(self, s, d):
+        """
+        Offline Route Assignment without capacities, same optimum as
+        rca.offline_ra. Demands sharing a source share a search.
+        Args:
+            s: A list of source indexes.
+            d: A list of destination indexes.
+
+        Returns: A list with the epath of each demand (None for the
+                 unreachable ones).
+        """
+        by_source = {}
+        for k, source in enumerate(s):
+            by_source.setdefault(source, []).append(k)
+        paths = [None] * len(s)
+        for source, ks in by_source.items():
+            for k, epath in zip(ks, self.routes(source, [d[k] for k in ks])):
+                paths[k] = epath
+        return paths
+
+    def disjoint_pair(self, s, d, allowed=None):
+        """
+        Minimum cost pair of link-disjoint paths (Suurballe/Bhandari).
+        Args:
+            s: source index.
+            d: destination index.
+            allowed: A list of booleans, ordered as the edges, False for
+                     the edges that can not be used, or None.
+
+        Returns: (working, protection), the two epaths ordered from s with
+                 the cheapest one first, or None if there is no pair of
+                 link-disjoint paths.
+        """
+        if s == d:
+            return [], []
+        edges, inc, weight = self.edges, self.inc, self.weight
+        dist, pred = dijkstra(inc, weight, s, allowed=allowed)
+        if d not in dist:
+            return None
+
+        # The first path, with the direction each edge is traversed in.
+        first = {}
+        v = s
+        for e_id in tree_path(edges, pred, s, d):
+            u, w = edges[e_id]
+            first[e_id] = (v, w if u == v else u)
+            v = first[e_id][1]
+
+        # Second search over the residual graph, with reduced costs: the
+        # edges of the first path can only be used backwards, at no cost.
+        done = set()
+        pred2 = {s: None}
+        best = {s: 0}
+        heap = [(0, s)]
+        while heap:
+            dist_i, i = heappop(heap)
+            if i in done:
+                continue
+            done.add(i)
+            if i == d:
+                break
+            for e_id, j in inc[i]:
+                if j == i or j in done:
+                    continue
+                if allowed is not None and not allowed[e_id]:
+                    continue
+                if e_id in first:
+                    if first[e_id] != (j, i):
+                        continue
+                    cost = 0
+                else:
+                    cost = max(0, weight[e_id] + dist[i] - dist[j])
+                if j not in best or dist_i + cost < best[j]:
+                    best[j] = dist_i + cost
+                    pred2[j] = (e_id, i)
+                    heappush(heap, (dist_i + cost, j))
+        if d not in done:
+            return None
+
+        # Union of both paths, dropping the edges used in both directions.
+        arcs = dict(first)
+        v = d
+        while v != s:
+            e_id, u = pred2[v]
+            if e_id in arcs:
+                del arcs[e_id]
+            else:
+                arcs[e_id] = (u, v)
+            v = u
+        out = {}
+        for e_id, (u, v) in arcs.items():
+            out.setdefault(u, []).append((e_id, v))
+        pair = []
+        for _ in range(2):
+            epath = []
+            v = s
+            while v != d:
+                e_id, v = out[v].pop()
+                epath.append(e_id)
+            pair.append(epath)
+        pair.sort(key=lambda p: sum(weight[e_id] for e_id in p))
+        return tuple(pair)
+
+    def k_shortest(self, s, d, n, allowed=None, max_length=None
+                   , max_hops=None):
+        """
+        Loopless k shortest paths (Yen).
+        Args:
+            s: source index.
+            d: destination index.
+            n: The maximum number of paths.
+            allowed: A list of booleans, ordered as the edges, False for
+                     the edges that can not be used, or None.
+            max_length: Paths longer than this are not returned, or None.
+            max_hops: Paths with more edges than this are not returned, or
+                      None.
+
+        Returns: A list with up to n epaths ordered by length.
+        """
+        edges, inc, weight = self.edges, self.inc, self.weight
+        if allowed is None:
+            allowed = [True] * len(edges)
+        first = self.route(s, d, allowed)
+        if first is None:
+            return []
+
+        found = [first]
+        vpaths = [self._vpath(s, first)]
+        candidates = []
+        seen = {tuple(first)}
+        # Every path taken from the candidates, even the ones with too many
+        # hops: their spurs must be blocked too, or the detours behind them
+        # are never generated.
+        popped = []
+        paths = []
+        while found:
+            epath = found.pop()
+            vpath = vpaths.pop()
+            length = sum(weight[e_id] for e_id in epath)
+            if max_length is not None and length > max_length:
+                break
+            popped.append(epath)
+            if max_hops is None or len(epath) <= max_hops:
+                paths.append(epath)
+                if len(paths) == n:
+                    break
+            for i in range(len(epath)):
+                root = epath[:i]
+                spur_allowed = allowed[:]
+                for p in popped:
+                    if p[:i] == root and len(p) > i:
+                        spur_allowed[p[i]] = False
+                for v in vpath[:i]:
+                    for e_id, _ in inc[v]:
+                        spur_allowed[e_id] = False
+                spur = self.route(vpath[i], d, spur_allowed)
+                if spur is None:
+                    continue
+                new = root + spur
+                if tuple(new) not in seen:
+                    seen.add(tuple(new))
+                    heappush(candidates, (sum(weight[e_id] for e_id in new)
+                                          , len(seen), new))
+            if candidates:
+                new = heappop(candidates)[2]
+                found.append(new)
+                vpaths.append(self._vpath(s, new))
+        return paths
+
+    def _vpath(self, s, epath):
+        vpath = [s]
+        for e_id in epath:
+            u, w = self.edges[e_id]
+            vpath.append(w if u == vpath[-1] else u)
+        return vpath
+
+
+def online_ra_path(graph, s, d, weights=None):
+    """
+    Online Route Assignment solved as a shortest path.
+    Args:
+        graph: A graph that represents the logical topology, or its Topology
+        s: source index.
+        d: destination index.
+        weights: A list of edge weights, a label for edge attribute or None
+
+    Returns: The epath from s to d, or None if d is not reachable.
+    """
+    return ShortestPaths(graph, weights).route(s, d)
+
+
+def offline_ra_paths(graph, s, d, weights=None):
+    """
+    Offline Route Assignment (no capacities) solved as K shortest paths.
+    Args:
+        graph: A graph that represents the logical topology, or its Topology
+        s: A list of source indexes.
+        d: A list of destination indexes.
+        weights: A list of edge weights, a label for edge attribute or None
+
+    Returns: A list with the epath of each demand (None for the
+             unreachable ones).
+    """
+    return ShortestPaths(graph, weights).offline_routes(s, d)
+
+
+def online_1p1_paths(graph, s, d, c, weights=None, spare=None, fallback=True
+                     , solver=None, instance_name="NN"):
+    """
+    Online 1+1 Route and Capacity Assignment. Edges whose spare capacity
+    is below c are pruned and the minimum cost link-disjoint pair is found
+    with Suurballe's algorithm. Only when there is no such pair the
+    rca.online_1p1_rca_2 ILP is solved.
+    Args:
+        graph: A graph that represents the logical topology, or its Topology
+        s: source index.
+        d: destination index.
+        c: capacities demanded
+        weights: A list of edge weights, a label for edge attribute or None
+        spare: A list of edge spare capacity, a label for edge attribute
+               or None
+        fallback: Solve the ILP when there is no link-disjoint pair.
+        solver: A pulp solver for the fallback ILP, or None.
+        instance_name: a name for the fallback instance (LPproblem)
+
+    Returns: working, protection, disjoint
+        working: The working epath.
+        protection: The protection epath.
+        disjoint: True if both paths are link-disjoint. False if they come
+                  from the ILP fallback and share at least one link.
+        None is returned if there is no solution (or no disjoint pair and
+        fallback is False).
+    """
+    sp = edge_values(graph, spare, c)
+    allowed = [sp_e >= c for sp_e in sp]
+    pair = ShortestPaths(graph, weights).disjoint_pair(s, d, allowed)
+    if pair is not None:
+        return pair[0], pair[1], True
+    if not fallback:
+        return None
+
+    prob, index = online_1p1_rca_2(graph, s, d, c, weights, spare
+                                   , instance_name, index=True)
+    prob.solve(solver)
+    if prob.status != LpStatusOptimal:
+        return None
+    values = solution_values(prob)
+    working = read_paths(values, index['x'])[0][0]
+    protection = read_paths(values, index['y'])[0][0]
+    return working, protection, not set(working) & set(protection)
@@ -1,151 +1,106 @@
 # coding=utf-8
 from pulp import *
-import igraph
 
+from survivability.utils.topology import as_topology
+from survivability.rca.builder import (edge_values, incidence, arc_keys
+                                       , arc_costs, conservation, balance
+                                       , edge_load, variable_index)
 
-def online_ra(graph, s, d, weights=None, instance_name="NN"):
+
+def online_ra(graph, s, d, weights=None, instance_name="NN", index=False):
     """
     Online Route Assignment
     Args:
-        graph: A graph that represents the logical topology
+        graph: A graph that represents the logical topology, or its Topology
         s: source index.
         d: destination index.
         weights: A list of edge weights, a label for edge attribute or None
         instance_name: a name for the instance (LPproblem)
+        index: Also return the column index of the variables (see
+               builder.variable_index), as (prob, index).
 
     Returns: A Pulp LpProblem instance
 
     """
 
-    if isinstance(weights, str):
-        weight = graph.es[weights][:]
-    elif isinstance(weights, list):
-        weight = weights[:]
-    else:
-        weight = [1] * len(graph.es)
+    weight = edge_values(graph, weights, 1)
+
+    graph = as_topology(graph)
 
-    assert isinstance(graph, igraph.Graph)
+    edges, inc = incidence(graph)
 
     prob = LpProblem('RA instance: %s' % instance_name, LpMinimize)
 
     # Flow variables Xij
-    x_combs = []
-    for e_id, e in enumerate(graph.es):
-        x_combs.append((e.source, e.target, e_id))
-        x_combs.append((e.target, e.source, e_id))
-
-    x = LpVariable.dicts('flow variables x(i,j,e)', x_combs, lowBound=0
-                         , upBound=1, cat=LpInteger)
+    x = LpVariable.dicts('flow variables x(i,j,e)', arc_keys(edges)
+                         , lowBound=0, upBound=1, cat=LpInteger)
 
     # Minimize sum of flow variables
-    constr = ""
-    for e_id, e in enumerate(graph.es):
-        constr += ' + %f*x[(%d,%d,%d)]' % (weight[e_id], e.source
-                                           , e.target, e_id)
-        constr += ' + %f*x[(%d,%d,%d)]' % (weight[e_id], e.target
-                                           , e.source, e_id)
-    prob += eval(constr)
-
+    prob += LpAffineExpression(arc_costs(x, edges, weight))
 
     # Flow continuity constraint
-    for i in range(len(graph.vs)):
-        constraint = ""
-        for e_id, e in enumerate(graph.es):
-            if e.source == i:
-                constraint += ' + x[(%d,%d,%d)]' % (i, e.target, e_id)
-                constraint += ' - x[(%d,%d,%d)]' % (e.target, i, e_id)
-            elif e.target == i:
-                constraint += ' + x[(%d,%d,%d)]' % (i, e.source, e_id)
-                constraint += ' - x[(%d,%d,%d)]' % (e.source, i, e_id)
-        if constraint:
-            if i == s:
-                constraint += ' == 1'
-            elif i == d:
-                constraint += ' == -1'
-            else:
-                constraint += ' == 0'
-            prob += eval(constraint)
+    for constraint in conservation(x, inc, s, d):
+        prob += constraint
 
+    if index:
+        return prob, variable_index(prob, x=x)
     return prob
 
 
-def offline_ra(graph, s, d, weights=None, instance_name="NN"):
+def offline_ra(graph, s, d, weights=None, instance_name="NN", index=False):
     """
     Offline Route Assignment
     Args:
-        graph: A graph that represents the logical topology
+        graph: A graph that represents the logical topology, or its Topology
         s: A list of source indexes.
         d: A list of destination indexes.
         weights: A list of edge weights, a label for edge attribute or None
         instance_name: a name for the instance (LPproblem)
+        index: Also return the column index of the variables (see
+               builder.variable_index), as (prob, index).
 
     Returns: A Pulp LpProblem instance
 
     """
 
-    if isinstance(weights, str):
-        weight = graph.es[weights][:]
-    elif isinstance(weights, list):
-        weight = weights[:]
-    else:
-        weight = [1] * len(graph.es)
+    weight = edge_values(graph, weights, 1)
+
+    graph = as_topology(graph)
 
-    assert isinstance(graph, igraph.Graph)
+    edges, inc = incidence(graph)
 
     prob = LpProblem('RA instance: %s' % instance_name, LpMinimize)
 
     # Flow variables Xij
     x_combs = []
     for k in range(len(s)):
-        for e_id, e in enumerate(graph.es):
-            x_combs.append((k, e.source, e.target, e_id))
-            x_combs.append((k, e.target, e.source, e_id))
+        x_combs += arc_keys(edges, k)
 
     x = LpVariable.dicts('flow variables x(k,i,j,e)', x_combs, lowBound=0
                          , upBound=1, cat=LpInteger)
 
     # Minimize sum of flow variables
-    constr = ""
+    coefs = {}
     for k in range(len(s)):
-        for e_id, e in enumerate(graph.es):
-            constr += ' + %f*x[(%d,%d,%d,%d)]' % (weight[e_id], k, e.source
-                                                  , e.target, e_id)
-            constr += ' + %f*x[(%d,%d,%d,%d)]' % (weight[e_id], k, e.target
-                                                  , e.source, e_id)
-    prob += eval(constr)
+        arc_costs(x, edges, weight, k, coefs)
+    prob += LpAffineExpression(coefs)
 
     # Flow continuity constraint
     for k in range(len(s)):
-        for i in range(len(graph.vs)):
-            constraint = ""
-            for e_id, e in enumerate(graph.es):
-                if e.source == i:
-                    constraint += ' + x[(%d,%d,%d,%d)]' % (k, i, e.target
-                                                           , e_id)
-                    constraint += ' - x[(%d,%d,%d,%d)]' % (k, e.target, i
-                                                           , e_id)
-                elif e.target == i:
-                    constraint += ' + x[(%d,%d,%d,%d)]' % (k, i, e.source
-                                                           , e_id)
-                    constraint += ' - x[(%d,%d,%d,%d)]' % (k, e.source, i
-                                                           , e_id)
-            if constraint:
-                if i == s[k]:
-                    constraint += ' == 1'
-                elif i == d[k]:
-                    constraint += ' == -1'
-                else:
-                    constraint += ' == 0'
-                prob += eval(constraint)
+        for constraint in conservation(x, inc, s[k], d[k], k=k):
+            prob += constraint
 
+    if index:
+        return prob, variable_index(prob, x=x)
     return prob
 
 
-def online_rca(graph, s, d, c, weights=None, spare=None, instance_name="NN"):
+def online_rca(graph, s, d, c, weights=None, spare=None, instance_name="NN"
+              , index=False):
     """
     Online Route and Capacity Assignment
     Args:
-        graph: A graph that represents the logical topology
+        graph: A graph that represents the logical topology, or its Topology
         s: source index.
         d: destination index.
         c: capacities demanded
@@ -153,78 +108,47 @@ def online_rca(graph, s, d, c, weights=None, spare=None, instance_name="NN"):
         spare: A list of edge spare capacity, a label for edge attribute
                or None (No capacity constraint)
         instance_name: a name for the instance (LPproblem)
+        index: Also return the column index of the variables (see
+               builder.variable_index), as (prob, index).
 
     Returns: A Pulp LpProblem instance
 
     """
 
-    assert isinstance(graph, igraph.Graph)
+    graph = as_topology(graph)
 
-    if isinstance(weights, str):
-        weight = graph.es[weights][:]
-    elif isinstance(weights, list):
-        weight = weights[:]
-    else:
-        weight = [1] * len(graph.es)
+    weight = edge_values(graph, weights, 1)
+    sp = edge_values(graph, spare, c)
 
-    if isinstance(spare, str):
-        sp = graph.es[spare][:]
-    elif isinstance(spare, list):
-        sp = spare[:]
-    else:
-        sp = [c] * len(graph.es)
+    edges, inc = incidence(graph)
 
     prob = LpProblem('OnRCA instance: %s' % instance_name, LpMinimize)
 
     # Flow variables Xij
-    x_combs = []
-    for e_id, e in enumerate(graph.es):
-        x_combs.append((e.source, e.target, e_id))
-        x_combs.append((e.target, e.source, e_id))
-
-    x = LpVariable.dicts('flow variables x(i,j,e)', x_combs, lowBound=0
-                         , upBound=1, cat=LpInteger)
+    x = LpVariable.dicts('flow variables x(i,j,e)', arc_keys(edges)
+                         , lowBound=0, upBound=1, cat=LpInteger)
 
     # Minimize sum of flow variables
-    constr = ""
-    for e_id, e in enumerate(graph.es):
-        constr += ' + %f*x[(%d,%d,%d)]' % (weight[e_id], e.source, e.target
-                                           , e_id)
-        constr += ' + %f*x[(%d,%d,%d)]' % (weight[e_id], e.target, e.source
-                                           , e_id)
-    prob += eval(constr)
+    prob += LpAffineExpression(arc_costs(x, edges, weight))
 
     # Flow continuity constraint
-    for i in range(len(graph.vs)):
-        constraint = ""
-        for e_id, e in enumerate(graph.es):
-            if e.source == i:
-                constraint += ' + x[(%d,%d,%d)]' % (i, e.target, e_id)
-                constraint += ' - x[(%d,%d,%d)]' % (e.target, i, e_id)
-            elif e.target == i:
-                constraint += ' + x[(%d,%d,%d)]' % (i, e.source, e_id)
-                constraint += ' - x[(%d,%d,%d)]' % (e.source, i, e_id)
-        if constraint:
-            if i == s:
-                constraint += ' == 1'
-            elif i == d:
-                constraint += ' == -1'
-            else:
-                constraint += ' == 0'
-            prob += eval(constraint)
-
-    for e_id, e in enumerate(graph.es):
-        prob += (c * x[(e.source, e.target, e_id)]
-                 + c * x[(e.target, e.source, e_id)]) <= sp[e_id]
+    for constraint in conservation(x, inc, s, d):
+        prob += constraint
 
+    for e_id, edge in enumerate(edges):
+        prob += edge_load(x, edge, e_id, c) <= sp[e_id]
+
+    if index:
+        return prob, variable_index(prob, x=x)
     return prob
 
 
-def offline_rca(graph, s, d, c, weights=None, spare=None, instance_name="NN"):
+def offline_rca(graph, s, d, c, weights=None, spare=None, instance_name="NN"
+               , index=False):
     """
     Offline Route and Capacity Assignment
     Args:
-        graph: A graph that represents the logical topology
+        graph: A graph that represents the logical topology, or its Topology
         s: A list of source indexes.
         d: A list of destination indexes.
         c: A list of capacities demanded
@@ -232,91 +156,56 @@ def offline_rca(graph, s, d, c, weights=None, spare=None, instance_name="NN"):
         spare: A list of edge spare capacity, a label for edge attribute
                or None (No capacity constraint)
         instance_name: a name for the instance (LPproblem)
+        index: Also return the column index of the variables (see
+               builder.variable_index), as (prob, index).
 
     Returns: A Pulp LpProblem instance
 
     """
 
-    if isinstance(weights, str):
-        weight = graph.es[weights][:]
-    elif isinstance(weights, list):
-        weight = weights[:]
-    else:
-        weight = [1] * len(graph.es)
+    weight = edge_values(graph, weights, 1)
+    sp = edge_values(graph, spare, sum(c))
 
-    if isinstance(spare, str):
-        sp = graph.es[spare][:]
-    elif isinstance(spare, list):
-        sp = spare[:]
-    else:
-        sp = [sum(c)] * len(graph.es)
+    graph = as_topology(graph)
 
-    assert isinstance(graph, igraph.Graph)
+    edges, inc = incidence(graph)
 
     prob = LpProblem('RA instance: %s' % instance_name, LpMinimize)
 
     # Flow variables Xij
     x_combs = []
     for k in range(len(s)):
-        for e_id, e in enumerate(graph.es):
-            x_combs.append((k, e.source, e.target, e_id))
-            x_combs.append((k, e.target, e.source, e_id))
+        x_combs += arc_keys(edges, k)
 
     x = LpVariable.dicts('flow variables x(k,i,j,e)', x_combs, lowBound=0
                          , upBound=1, cat=LpInteger)
 
     # Minimize sum of flow variables
-    constr = ""
+    coefs = {}
     for k in range(len(s)):
-        for e_id, e in enumerate(graph.es):
-            constr += ' + %f*x[(%d,%d,%d,%d)]' % (weight[e_id], k, e.source
-                                                  , e.target, e_id)
-            constr += ' + %f*x[(%d,%d,%d,%d)]' % (weight[e_id], k, e.target
-                                                  , e.source, e_id)
-    prob += eval(constr)
+        arc_costs(x, edges, weight, k, coefs)
+    prob += LpAffineExpression(coefs)
 
     # Flow continuity constraint
     for k in range(len(s)):
-        for i in range(len(graph.vs)):
-            constraint = ""
-            for e_id, e in enumerate(graph.es):
-                if e.source == i:
-                    constraint += ' + x[(%d,%d,%d,%d)]' % (k, i, e.target
-                                                           , e_id)
-                    constraint += ' - x[(%d,%d,%d,%d)]' % (k, e.target, i
-                                                           , e_id)
-                elif e.target == i:
-                    constraint += ' + x[(%d,%d,%d,%d)]' % (k, i, e.source
-                                                           , e_id)
-                    constraint += ' - x[(%d,%d,%d,%d)]' % (k, e.source, i
-                                                           , e_id)
-            if constraint:
-                if i == s[k]:
-                    constraint += ' == 1'
-                elif i == d[k]:
-                    constraint += ' == -1'
-                else:
-                    constraint += ' == 0'
-                prob += eval(constraint)
-
-    for e_id, e in enumerate(graph.es):
-        constr = ""
-        for k in range(len(s)):
-            constr += ' + %f*x[(%d,%d,%d,%d)]' % (c[k], k, e.source
-                                                  , e.target, e_id)
-            constr += ' + %f*x[(%d,%d,%d,%d)]' % (c[k], k, e.target
-                                                  , e.source, e_id)
-        constr += ' <= %f' % (sp[e_id])
-        prob += eval(constr)
+        for constraint in conservation(x, inc, s[k], d[k], k=k):
+            prob += constraint
+
+    ks = range(len(s))
+    for e_id, edge in enumerate(edges):
+        prob += edge_load(x, edge, e_id, c, ks) <= sp[e_id]
 
+    if index:
+        return prob, variable_index(prob, x=x)
     return prob
 
 
-def online_1p1_rca(graph, s, d, c, weights=None, spare=None, instance_name="NN"):
+def online_1p1_rca(graph, s, d, c, weights=None, spare=None, instance_name="NN"
+                  , index=False):
     """
     Online 1+1 Route and Capacity Assignment
     Args:
-        graph: A graph that represents the logical topology
+        graph: A graph that represents the logical topology, or its Topology
         s: source index.
         d: destination index.
         c: capacities demanded
@@ -324,93 +213,62 @@ def online_1p1_rca(graph, s, d, c, weights=None, spare=None, instance_name="NN")
         spare: A list of edge spare capacity, a label for edge attribute
                or None
         instance_name: a name for the instance (LPproblem)
+        index: Also return the column index of the variables (see
+               builder.variable_index), as (prob, index).
 
     Returns: A Pulp LpProblem instance
 
     """
 
-    assert isinstance(graph, igraph.Graph)
-
-    if isinstance(weights, str):
-        weight = graph.es[weights][:]
-    elif isinstance(weights, list):
-        weight = weights[:]
-    else:
-        weight = [1] * len(graph.es)
+    graph = as_topology(graph)
 
-    if isinstance(spare, str):
-        sp = graph.es[spare][:]
-    elif isinstance(spare, list):
-        sp = spare[:]
-    else:
-        sp = [c] * len(graph.es)
+    weight = edge_values(graph, weights, 1)
+    sp = edge_values(graph, spare, c)
 
     big_num = 2 * sum(weight)
 
+    edges, inc = incidence(graph)
+
     prob = LpProblem('OnRCA 1+1 instance: %s' % instance_name, LpMinimize)
 
     # Flow variables Xij
-    x_combs = []
-    for e_id, e in enumerate(graph.es):
-        x_combs.append((e.source, e.target, e_id))
-        x_combs.append((e.target, e.source, e_id))
-
-    x = LpVariable.dicts('flow variables x(i,j,e)', x_combs, lowBound=0
-                         , upBound=2, cat=LpInteger)
+    x = LpVariable.dicts('flow variables x(i,j,e)', arc_keys(edges)
+                         , lowBound=0, upBound=2, cat=LpInteger)
 
     j_combs = []
-    for e_id, e in enumerate(graph.es):
-        j_combs.append((e.source, e.target, e_id))
+    for e_id, (u, v) in enumerate(edges):
+        j_combs.append((u, v, e_id))
 
     j = LpVariable.dicts('jointness variables j(i,j,e)', j_combs, lowBound=0
                          , upBound=1, cat=LpInteger)
 
     # Minimize sum of flow variables
-    constr = ""
-    for e_id, e in enumerate(graph.es):
-        constr += ' + %f*j[(%d,%d,%d)]' % (big_num, e.source, e.target
-                                           , e_id)
-        constr += ' + %f*x[(%d,%d,%d)]' % (weight[e_id], e.source, e.target
-                                           , e_id)
-        constr += ' + %f*x[(%d,%d,%d)]' % (weight[e_id], e.target, e.source
-                                           , e_id)
-    prob += eval(constr)
+    coefs = {}
+    for key in j_combs:
+        coefs[j[key]] = big_num
+    prob += LpAffineExpression(arc_costs(x, edges, weight, coefs=coefs))
 
     # Flow continuity constraint
-    for i in range(len(graph.vs)):
-        constraint = ""
-        for e_id, e in enumerate(graph.es):
-            if e.source == i:
-                constraint += ' + x[(%d,%d,%d)]' % (i, e.target, e_id)
-                constraint += ' - x[(%d,%d,%d)]' % (e.target, i, e_id)
-            elif e.target == i:
-                constraint += ' + x[(%d,%d,%d)]' % (i, e.source, e_id)
-                constraint += ' - x[(%d,%d,%d)]' % (e.source, i, e_id)
-        if constraint:
-            if i == s:
-                constraint += ' == 2'
-            elif i == d:
-                constraint += ' == -2'
-            else:
-                constraint += ' == 0'
-            prob += eval(constraint)
-
-    for e_id, e in enumerate(graph.es):
-        prob += (c * x[(e.source, e.target, e_id)]
-                 + c * x[(e.target, e.source, e_id)]) <= sp[e_id]
-
-    for e_id, e in enumerate(graph.es):
-        prob += (x[(e.source, e.target, e_id)]
-                 + x[(e.target, e.source, e_id)]) - j[(e.source, e.target, e_id)] <= 1
+    for constraint in conservation(x, inc, s, d, rhs=2):
+        prob += constraint
+
+    for e_id, edge in enumerate(edges):
+        prob += edge_load(x, edge, e_id, c) <= sp[e_id]
+
+    for e_id, edge in enumerate(edges):
+        prob += edge_load(x, edge, e_id, 1) - j[j_combs[e_id]] <= 1
 
+    if index:
+        return prob, variable_index(prob, x=x, j=j)
     return prob
 
 
-def online_1p1_rca_2(graph, s, d, c, weights=None, spare=None, instance_name="NN"):
+def online_1p1_rca_2(graph, s, d, c, weights=None, spare=None, instance_name="NN"
+                    , index=False):
     """
     Online 1+1 Route and Capacity Assignment
     Args:
-        graph: A graph that represents the logical topology
+        graph: A graph that represents the logical topology, or its Topology
         s: source index.
         d: destination index.
         c: capacities demanded
@@ -418,130 +276,73 @@ def online_1p1_rca_2(graph, s, d, c, weights=None, spare=None, instance_name="NN
         spare: A list of edge spare capacity, a label for edge attribute
                or None
         instance_name: a name for the instance (LPproblem)
+        index: Also return the column index of the variables (see
+               builder.variable_index), as (prob, index).
 
     Returns: A Pulp LpProblem instance
 
     """
 
-    assert isinstance(graph, igraph.Graph)
+    graph = as_topology(graph)
 
-    if isinstance(weights, str):
-        weight = graph.es[weights][:]
-    elif isinstance(weights, list):
-        weight = weights[:]
-    else:
-        weight = [1] * len(graph.es)
-
-    if isinstance(spare, str):
-        sp = graph.es[spare][:]
-    elif isinstance(spare, list):
-        sp = spare[:]
-    else:
-        sp = [c] * len(graph.es)
+    weight = edge_values(graph, weights, 1)
+    sp = edge_values(graph, spare, c)
 
     big_num = 20 * sum(weight)
 
+    edges, inc = incidence(graph)
+
     prob = LpProblem('OnRCA 1+1 instance: %s' % instance_name, LpMinimize)
 
     # Flow variables Xij
-    x_combs = []
-    for e_id, e in enumerate(graph.es):
-        x_combs.append((e.source, e.target, e_id))
-        x_combs.append((e.target, e.source, e_id))
-
-    x = LpVariable.dicts('flow variables x(i,j,e)', x_combs, lowBound=0
-                         , upBound=1, cat=LpInteger)
-
-    y_combs = []
-    for e_id, e in enumerate(graph.es):
-        y_combs.append((e.source, e.target, e_id))
-        y_combs.append((e.target, e.source, e_id))
-
-    y = LpVariable.dicts('flow variables y(i,j,e)', y_combs, lowBound=0
-                         , upBound=1, cat=LpInteger)
+    x = LpVariable.dicts('flow variables x(i,j,e)', arc_keys(edges)
+                         , lowBound=0, upBound=1, cat=LpInteger)
 
+    y = LpVariable.dicts('flow variables y(i,j,e)', arc_keys(edges)
+                         , lowBound=0, upBound=1, cat=LpInteger)
 
     j_combs = []
-    for e_id, e in enumerate(graph.es):
-        j_combs.append((e.source, e.target, e_id))
+    for e_id, (u, v) in enumerate(edges):
+        j_combs.append((u, v, e_id))
 
     j = LpVariable.dicts('jointness variables j(i,j,e)', j_combs, lowBound=0
                          , upBound=1, cat=LpInteger)
 
     # Minimize sum of flow variables
-    constr = ""
-    for e_id, e in enumerate(graph.es):
-        constr += ' + %f*j[(%d,%d,%d)]' % (big_num, e.source, e.target
-                                           , e_id)
-        constr += ' + %f*x[(%d,%d,%d)]' % (weight[e_id], e.source, e.target
-                                           , e_id)
-        constr += ' + %f*x[(%d,%d,%d)]' % (weight[e_id], e.target, e.source
-                                           , e_id)
-        constr += ' + %f*y[(%d,%d,%d)]' % (weight[e_id], e.source, e.target
-                                           , e_id)
-        constr += ' + %f*y[(%d,%d,%d)]' % (weight[e_id], e.target, e.source
-                                           , e_id)
-    prob += eval(constr)
+    coefs = {}
+    for key in j_combs:
+        coefs[j[key]] = big_num
+    arc_costs(x, edges, weight, coefs=coefs)
+    arc_costs(y, edges, weight, coefs=coefs)
+    prob += LpAffineExpression(coefs)
 
     # Flow continuity constraint X
-    for i in range(len(graph.vs)):
-        constraint = ""
-        for e_id, e in enumerate(graph.es):
-            if e.source == i:
-                constraint += ' + x[(%d,%d,%d)]' % (i, e.target, e_id)
-                constraint += ' - x[(%d,%d,%d)]' % (e.target, i, e_id)
-            elif e.target == i:
-                constraint += ' + x[(%d,%d,%d)]' % (i, e.source, e_id)
-                constraint += ' - x[(%d,%d,%d)]' % (e.source, i, e_id)
-        if constraint:
-            if i == s:
-                constraint += ' == 1'
-            elif i == d:
-                constraint += ' == -1'
-            else:
-                constraint += ' == 0'
-            prob += eval(constraint)
+    for constraint in conservation(x, inc, s, d):
+        prob += constraint
 
     # Flow continuity constraint  y
-    for i in range(len(graph.vs)):
-        constraint = ""
-        for e_id, e in enumerate(graph.es):
-            if e.source == i:
-                constraint += ' + y[(%d,%d,%d)]' % (i, e.target, e_id)
-                constraint += ' - y[(%d,%d,%d)]' % (e.target, i, e_id)
-            elif e.target == i:
-                constraint += ' + y[(%d,%d,%d)]' % (i, e.source, e_id)
-                constraint += ' - y[(%d,%d,%d)]' % (e.source, i, e_id)
-        if constraint:
-            if i == s:
-                constraint += ' == 1'
-            elif i == d:
-                constraint += ' == -1'
-            else:
-                constraint += ' == 0'
-            prob += eval(constraint)
-
-
-    for e_id, e in enumerate(graph.es):
-        prob += (c * x[(e.source, e.target, e_id)]
-                 + c * x[(e.target, e.source, e_id)]
-                 + c * y[(e.source, e.target, e_id)]
-                 + c * y[(e.target, e.source, e_id)]) <= sp[e_id]
-
-    for e_id, e in enumerate(graph.es):
-        prob += (x[(e.source, e.target, e_id)]
-                 + x[(e.target, e.source, e_id)]
-                 + y[(e.source, e.target, e_id)]
-                 + y[(e.target, e.source, e_id)]) - j[(e.source, e.target, e_id)] <= 1
+    for constraint in conservation(y, inc, s, d):
+        prob += constraint
+
+    for e_id, edge in enumerate(edges):
+        prob += (edge_load(x, edge, e_id, c)
+                 + edge_load(y, edge, e_id, c)) <= sp[e_id]
 
+    for e_id, edge in enumerate(edges):
+        prob += (edge_load(x, edge, e_id, 1) + edge_load(y, edge, e_id, 1)
+                 - j[j_combs[e_id]]) <= 1
+
+    if index:
+        return prob, variable_index(prob, x=x, y=y, j=j)
     return prob
 
 
-def offline_1p1_rca(graph, s, d, c, weights=None, spare=None, instance_name="NN"):
+def offline_1p1_rca(graph, s, d, c, weights=None, spare=None, instance_name="NN"
+                   , index=False):
     """
     Offline 1+1 Route and Capacity Assignment
     Args:
-        graph: A graph that represents the logical topology
+        graph: A graph that represents the logical topology, or its Topology
         s: A list of source indexes.
         d: A list of destination indexes.
         c: A list of capacities demanded
@@ -549,97 +350,163 @@ def offline_1p1_rca(graph, s, d, c, weights=None, spare=None, instance_name="NN"
         spare: A list of edge spare capacity, a label for edge attribute
                or None (No capacity constraint)
         instance_name: a name for the instance (LPproblem)
+        index: Also return the column index of the variables (see
+               builder.variable_index), as (prob, index).
 
     Returns: A Pulp LpProblem instance
 
     """
 
-    if isinstance(weights, str):
-        weight = graph.es[weights][:]
-    elif isinstance(weights, list):
-        weight = weights[:]
-    else:
-        weight = [1] * len(graph.es)
-
-    if isinstance(spare, str):
-        sp = graph.es[spare][:]
-    elif isinstance(spare, list):
-        sp = spare[:]
-    else:
-        sp = [sum(c)] * len(graph.es)
+    weight = edge_values(graph, weights, 1)
+    sp = edge_values(graph, spare, sum(c))
 
-    assert isinstance(graph, igraph.Graph)
+    graph = as_topology(graph)
 
     B = 10. * len(s) * sum(weight)
 
+    edges, inc = incidence(graph)
+
     prob = LpProblem('RA instance: %s' % instance_name, LpMinimize)
 
     # Flow variables Xij
     x_combs = []
     for k in range(len(s)):
-        for e_id, e in enumerate(graph.es):
-            x_combs.append((k, e.source, e.target, e_id))
-            x_combs.append((k, e.target, e.source, e_id))
+        x_combs += arc_keys(edges, k)
 
     x = LpVariable.dicts('flow variables x(k,i,j,e)', x_combs, lowBound=0
                          , upBound=2, cat=LpInteger)
 
     j_combs = []
     for k in range(len(s)):
-        for e_id, e in enumerate(graph.es):
-            j_combs.append((k, e.source, e.target, e_id))
+        for e_id, (u, v) in enumerate(edges):
+            j_combs.append((k, u, v, e_id))
 
     j = LpVariable.dicts('jointness variables j(k,i,j,e)', j_combs, lowBound=0
                          , upBound=1, cat=LpInteger)
     # Minimize sum of flow variables
-    constr = ""
+    coefs = {}
     for k in range(len(s)):
-        for e_id, e in enumerate(graph.es):
-            constr += ' + %f*x[(%d,%d,%d,%d)]' % (weight[e_id], k, e.source
-                                                  , e.target, e_id)
-            constr += ' + %f*x[(%d,%d,%d,%d)]' % (weight[e_id], k, e.target
-                                                  , e.source, e_id)
-            constr += ' + %f*j[(%d,%d,%d,%d)]' % (B, k, e.source, e.target
-                                                  , e_id)
-    prob += eval(constr)
+        arc_costs(x, edges, weight, k, coefs)
+    for key in j_combs:
+        coefs[j[key]] = B
+    prob += LpAffineExpression(coefs)
 
     # Flow continuity constraint
     for k in range(len(s)):
-        for i in range(len(graph.vs)):
-            constraint = ""
-            for e_id, e in enumerate(graph.es):
-                if e.source == i:
-                    constraint += ' + x[(%d,%d,%d,%d)]' % (k, i, e.target
-                                                           , e_id)
-                    constraint += ' - x[(%d,%d,%d,%d)]' % (k, e.target, i
-                                                           , e_id)
-                elif e.target == i:
-                    constraint += ' + x[(%d,%d,%d,%d)]' % (k, i, e.source
-                                                           , e_id)
-                    constraint += ' - x[(%d,%d,%d,%d)]' % (k, e.source, i
-                                                           , e_id)
-            if constraint:
-                if i == s[k]:
-                    constraint += ' == 1'
-                elif i == d[k]:
-                    constraint += ' == -1'
-                else:
-                    constraint += ' == 0'
-                prob += eval(constraint)
-
-    for e_id, e in enumerate(graph.es):
-        constr = ""
-        for k in range(len(s)):
-            constr += ' + %f*x[(%d,%d,%d,%d)]' % (c[k], k, e.source
-                                                  , e.target, e_id)
-            constr += ' + %f*x[(%d,%d,%d,%d)]' % (c[k], k, e.target
-                                                  , e.source, e_id)
-        constr += ' <= %f' % (sp[e_id])
-        prob += eval(constr)
+        for constraint in conservation(x, inc, s[k], d[k], k=k):
+            prob += constraint
 
-    for k in range(len(s)):
-        for e_id, e in enumerate(graph.es):
-            prob += j[(k, e.source, e.target, e_id)] - x[(k, e.source, e.target, e_id)] - [(k, e.target, e.source, e_id)] >= -1
+    ks = range(len(s))
+    for e_id, edge in enumerate(edges):
+        prob += edge_load(x, edge, e_id, c, ks) <= sp[e_id]
+
+    for k, u, v, e_id in j_combs:
+        prob += j[(k, u, v, e_id)] - x[(k, u, v, e_id)] - x[(k, v, u, e_id)] >= -1
 
+    if index:
+        return prob, variable_index(prob, x=x, j=j)
     return prob
 
+
+def offline_ra_agg(graph, s, d, weights=None, relax=True, instance_name="NN"
+                  , index=False):
+    """
+    Offline Route Assignment aggregated by source. Demands sharing a
+    source are a single commodity, so there are O(V*E) flow variables
+    and continuity rows instead of O(K*E). Each demand is a unit of flow,
+    the optimum is the one of offline_ra when flows may be split (or for
+    the LP relaxation). Use postproc.reconstruction.flow_disaggregation
+    (or read_flows, with index) to get a path per demand.
+    Args:
+        graph: A graph that represents the logical topology, or its Topology
+        s: A list of source indexes.
+        d: A list of destination indexes.
+        weights: A list of edge weights, a label for edge attribute or None
+        relax: Continuous (True) or integer (False) flow variables.
+        instance_name: a name for the instance (LPproblem)
+        index: Also return the column index of the variables (see
+               builder.variable_index), as (prob, index).
+
+    Returns: A Pulp LpProblem instance, with flow variables f(o,i,j,e)
+             where o is the source of the commodity.
+
+    """
+
+    return offline_rca_agg(graph, s, d, [1] * len(s), weights, None, relax
+                           , instance_name, index)
+
+
+def offline_rca_agg(graph, s, d, c, weights=None, spare=None, relax=True
+                    , instance_name="NN", index=False):
+    """
+    Offline Route and Capacity Assignment aggregated by source. Demands
+    sharing a source are a single commodity of sum(c) units, so there are
+    O(V*E) flow variables and continuity rows instead of O(K*E). The
+    objective weights the length of each demand by its capacity, which
+    is the objective of offline_rca when all the capacities are equal.
+    Use postproc.reconstruction.flow_disaggregation (or read_flows, with
+    index) to get a path per demand.
+    Args:
+        graph: A graph that represents the logical topology, or its Topology
+        s: A list of source indexes.
+        d: A list of destination indexes.
+        c: A list of capacities demanded
+        weights: A list of edge weights, a label for edge attribute or None
+        spare: A list of edge spare capacity, a label for edge attribute
+               or None (No capacity constraint)
+        relax: Continuous (True) or integer (False) flow variables.
+        instance_name: a name for the instance (LPproblem)
+        index: Also return the column index of the variables (see
+               builder.variable_index), as (prob, index).
+
+    Returns: A Pulp LpProblem instance, with flow variables f(o,i,j,e)
+             where o is the source of the commodity.
+
+    """
+
+    weight = edge_values(graph, weights, 1)
+    sp = None if spare is None else edge_values(graph, spare, 0)
+
+    graph = as_topology(graph)
+
+    edges, inc = incidence(graph)
+
+    # Supply of each commodity
+    supply = {}
+    for k in range(len(s)):
+        if s[k] == d[k]:
+            continue
+        supply_o = supply.setdefault(s[k], {})
+        supply_o[s[k]] = supply_o.get(s[k], 0) + c[k]
+        supply_o[d[k]] = supply_o.get(d[k], 0) - c[k]
+    origins = sorted(supply)
+
+    prob = LpProblem('RA instance: %s' % instance_name, LpMinimize)
+
+    # Flow variables Fij
+    f_combs = []
+    for o in origins:
+        f_combs += arc_keys(edges, o)
+
+    f = LpVariable.dicts('flow variables f(o,i,j,e)', f_combs, lowBound=0
+                         , cat=LpContinuous if relax else LpInteger)
+
+    # Minimize sum of flow variables
+    coefs = {}
+    for o in origins:
+        arc_costs(f, edges, weight, o, coefs)
+    prob += LpAffineExpression(coefs)
+
+    # Flow continuity constraint
+    for o in origins:
+        for constraint in balance(f, inc, supply[o], o):
+            prob += constraint
+
+    if sp is not None:
+        ones = dict((o, 1) for o in origins)
+        for e_id, edge in enumerate(edges):
+            prob += edge_load(f, edge, e_id, ones, origins) <= sp[e_id]
+
+    if index:
+        return prob, variable_index(prob, f=f)
+    return prob
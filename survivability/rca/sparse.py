@@ -0,0 +1,436 @@
+# coding=utf-8
+import os
+import shutil
+import subprocess
+import tempfile
+
+import numpy as np
+from pulp import PULP_CBC_CMD
+
+from survivability.utils.topology import as_topology
+from survivability.rca.builder import edge_values
+
+_ILLEGAL_CHARS = str.maketrans('-+[] ->/', '________')
+
+
+def _lp_name(name):
+    # Same character replacement PuLP applies to variable names.
+    return name.translate(_ILLEGAL_CHARS)
+
+
+class SolvedVariable(object):
+    """
+    Minimal stand-in of a solved pulp.LpVariable (name and varValue), so
+    the postproc functions can read solutions of a SparseModel.
+    """
+    __slots__ = ('name', 'varValue')
+
+    def __init__(self, name, value):
+        self.name = name
+        self.varValue = value
+
+
+class SparseModel(object):
+    """
+    A minimization MIP stored as sparse COO arrays, indexed by (k, arc).
+
+    Flow columns are laid out as k * n_arcs + a, where a indexes the arcs
+    (i,j,e) and (j,i,e) of every edge (self-loops have a single arc, as in
+    the pulp formulations). Extra families of columns (jointness) follow
+    the flow columns, each one with a (k,i,j,e) key per edge and demand.
+    Row names _C1, _C2, ... and column names match the ones of the
+    equivalent pulp model, so solutions and files are interchangeable.
+    """
+
+    def __init__(self, name, n_demands, arc_e, arc_tail, arc_head, edges):
+        self.name = name
+        self.n_demands = n_demands
+        self.arc_e = arc_e
+        self.arc_tail = arc_tail
+        self.arc_head = arc_head
+        self.edges = edges
+        self.families = []  # (prefix, first column, n columns, per-arc)
+        self.obj = None
+        self.lb = None
+        self.ub = None
+        self.integer = None
+        self.rows = None
+        self.cols = None
+        self.coefs = None
+        self.sense = None  # 'E', 'L' or 'G' per row
+        self.rhs = None
+
+    @property
+    def n_cols(self):
+        return len(self.obj)
+
+    @property
+    def n_rows(self):
+        return len(self.rhs)
+
+    def key(self, col):
+        """
+        Args:
+            col: A column index.
+
+        Returns: prefix, key
+            prefix: The pulp name prefix of the column family.
+            key: The (k,i,j,e) tuple of the column.
+        """
+        for prefix, first, n, per_arc in self.families:
+            if first <= col < first + n:
+                col -= first
+                if per_arc:
+                    k, a = divmod(col, len(self.arc_e))
+                    return prefix, (k, int(self.arc_tail[a])
+                                    , int(self.arc_head[a]), int(self.arc_e[a]))
+                k, e_id = divmod(col, len(self.edges))
+                u, v = self.edges[e_id]
+                return prefix, (k, u, v, e_id)
+        raise IndexError("Not valid column")
+
+    def column(self, key, family=0):
+        """
+        Args:
+            key: A (k,i,j,e) tuple.
+            family: The index of the column family (0 are the flow columns).
+
+        Returns: The column index of the variable keyed by key.
+        """
+        prefix, first, n, per_arc = self.families[family]
+        k, i, j, e_id = key
+        if not per_arc:
+            return first + k * len(self.edges) + e_id
+        a = int(np.searchsorted(self.arc_e, e_id))
+        if self.arc_tail[a] != i:
+            a += 1
+        return first + k * len(self.arc_e) + a
+
+    def index(self, family=0):
+        """
+        Args:
+            family: The index of the column family (0 are the flow columns).
+
+        Returns: A dict (k,i,j,e) -> column with every column of the family,
+                 as the ones of builder.variable_index, to read the values
+                 returned by solve with postproc.reconstruction.read_paths.
+        """
+        prefix, first, n, per_arc = self.families[family]
+        if per_arc:
+            ends = list(zip(self.arc_tail.tolist(), self.arc_head.tolist()
+                            , self.arc_e.tolist()))
+        else:
+            ends = [(u, v, e_id) for e_id, (u, v) in enumerate(self.edges)]
+        keys = [(k,) + end for k in range(self.n_demands) for end in ends]
+        return dict(zip(keys, range(first, first + n)))
+
+    def col_name(self, col):
+        prefix, key = self.key(col)
+        return _lp_name('%s_%s' % (prefix, str(key)))
+
+    def col_names(self, family=None):
+        """
+        Args:
+            family: The index of a column family, or None for all of them.
+
+        Returns: A generator of the column names, in column order.
+        """
+        families = self.families
+        if family is not None:
+            families = [families[family]]
+        arc_names = ['_%d,_%d,_%d)' % (t, h, e_id) for t, h, e_id
+                     in zip(self.arc_tail, self.arc_head, self.arc_e)]
+        edge_names = ['_%d,_%d,_%d)' % (u, v, e_id) for e_id, (u, v)
+                      in enumerate(self.edges)]
+        for prefix, first, n, per_arc in families:
+            prefix = _lp_name(prefix)
+            names = arc_names if per_arc else edge_names
+            for k in range(self.n_demands):
+                head = '%s_(%d,' % (prefix, k)
+                for name in names:
+                    yield head + name
+
+    def to_csr(self):
+        """
+        Returns: indptr, indices, data
+            The constraint matrix in CSR form (row major).
+        """
+        return _compress(self.rows, self.cols, self.coefs, self.n_rows)
+
+    def to_csc(self):
+        """
+        Returns: indptr, indices, data
+            The constraint matrix in CSC form (column major).
+        """
+        return _compress(self.cols, self.rows, self.coefs, self.n_cols)
+
+    def write_mps(self, filename):
+        """
+        Writes the model to filename in (free) MPS format, one column at a
+        time, without building any pulp object.
+        """
+        indptr, indices, data = self.to_csc()
+        with open(filename, 'w') as f:
+            f.write('*SENSE:Minimize\n')
+            f.write('NAME          %s\n' % _lp_name(self.name))
+            f.write('ROWS\n')
+            f.write(' N  OBJ\n')
+            for r, sense in enumerate(self.sense):
+                f.write(' %s  _C%d\n' % (sense, r + 1))
+            f.write('COLUMNS\n')
+            in_int = False
+            for col, name in enumerate(self.col_names()):
+                if self.integer[col] and not in_int:
+                    f.write("    MARK      'MARKER'                 'INTORG'\n")
+                    in_int = True
+                elif not self.integer[col] and in_int:
+                    f.write("    MARK      'MARKER'                 'INTEND'\n")
+                    in_int = False
+                lines = []
+                for p in range(indptr[col], indptr[col + 1]):
+                    lines.append('    %s  _C%d  %.12e\n'
+                                 % (name, indices[p] + 1, data[p]))
+                if self.obj[col] != 0 or not lines:
+                    lines.append('    %s  OBJ  %.12e\n' % (name, self.obj[col]))
+                f.write(''.join(lines))
+            if in_int:
+                f.write("    MARK      'MARKER'                 'INTEND'\n")
+            f.write('RHS\n')
+            for r in range(self.n_rows):
+                f.write('    RHS       _C%d  %.12e\n' % (r + 1, self.rhs[r]))
+            f.write('BOUNDS\n')
+            for col, name in enumerate(self.col_names()):
+                if self.lb[col] != 0:
+                    f.write(' LO BND       %s  %.12e\n' % (name, self.lb[col]))
+                if np.isfinite(self.ub[col]):
+                    f.write(' UP BND       %s  %.12e\n' % (name, self.ub[col]))
+            f.write('ENDATA\n')
+
+    def solve(self, path=None, msg=False, options=None):
+        """
+        Writes the model as MPS and solves it straight with the CBC binary
+        shipped with pulp.
+        Args:
+            path: The CBC executable, None for the one bundled with pulp.
+            msg: Show the solver log.
+            options: A list of extra CBC command line options.
+
+        Returns: status, values
+            status: The first line of the CBC solution file.
+            values: A numpy array with the value of each column.
+        """
+        if path is None:
+            path = PULP_CBC_CMD().path
+        tmp_dir = tempfile.mkdtemp()
+        try:
+            mps_file = os.path.join(tmp_dir, 'model.mps')
+            sol_file = os.path.join(tmp_dir, 'model.sol')
+            self.write_mps(mps_file)
+            cmd = [path, mps_file] + (options or []) + ['solve', 'solu'
+                                                        , sol_file]
+            out = None if msg else subprocess.DEVNULL
+            subprocess.check_call(cmd, stdout=out, stderr=out)
+            return self.read_solution(sol_file)
+        finally:
+            shutil.rmtree(tmp_dir)
+
+    def read_solution(self, filename):
+        """
+        Reads a CBC solution file of this model.
+
+        Returns: status, values (see solve)
+        """
+        names = {}
+        for col, name in enumerate(self.col_names()):
+            names[name] = col
+        values = np.zeros(self.n_cols)
+        with open(filename) as f:
+            status = f.readline().strip()
+            for line in f:
+                line = line.split()
+                if line and line[0] == '**':
+                    line = line[1:]
+                if len(line) >= 3 and line[1] in names:
+                    values[names[line[1]]] = float(line[2])
+        return status, values
+
+    def variables(self, values, family=0):
+        """
+        Args:
+            values: A sequence with the value of each column.
+            family: The index of the column family (0 are the flow columns).
+
+        Returns: A list of SolvedVariable, one per column of the family,
+                 that paths_reconstruction can take in place of the
+                 pulp variables.
+        """
+        prefix, first, n, per_arc = self.families[family]
+        return [SolvedVariable(name, float(values[first + col]))
+                for col, name in enumerate(self.col_names(family))]
+
+
+def _compress(major, minor, data, n):
+    order = np.lexsort((minor, major))
+    indptr = np.zeros(n + 1, dtype=np.int64)
+    np.cumsum(np.bincount(major, minlength=n), out=indptr[1:])
+    return indptr, minor[order], data[order]
+
+
+def _arcs(graph):
+    # Both arcs of every edge, in edge order, a single one for self-loops.
+    loop = graph.source == graph.target
+    arc_e = np.repeat(np.arange(graph.n_edges, dtype=np.int64)
+                      , np.where(loop, 1, 2))
+    first = np.ones(len(arc_e), dtype=bool)
+    first[1:] = arc_e[1:] != arc_e[:-1]
+    arc_tail = np.where(first, graph.source[arc_e], graph.target[arc_e])
+    arc_head = np.where(first, graph.target[arc_e], graph.source[arc_e])
+    return graph.get_edgelist(), arc_e, arc_tail, arc_head
+
+
+def _flow_model(graph, s, d, c, weights, spare, upper, instance_name):
+    weight = np.array(edge_values(graph, weights, 1), dtype=float)
+    sp = np.array(edge_values(graph, spare, sum(c)), dtype=float)
+    cap = np.array(c, dtype=float)
+
+    edges, arc_e, arc_tail, arc_head = _arcs(graph)
+    model = SparseModel('RA instance: %s' % instance_name, len(s), arc_e
+                        , arc_tail, arc_head, edges)
+    n_k = len(s)
+    n_a = len(arc_e)
+    n_e = len(edges)
+    loop = arc_tail == arc_head
+    mult = np.where(loop, 2., 1.)
+
+    # Vertices with incident edges have a continuity row per demand.
+    pos = -np.ones(graph.n_vertices, dtype=np.int64)
+    used = np.unique(np.concatenate((arc_tail, arc_head)))
+    pos[used] = np.arange(len(used))
+    n_v = len(used)
+    if np.any(pos[np.asarray(s)] < 0) or np.any(pos[np.asarray(d)] < 0):
+        raise ValueError("Demand end without incident edges")
+
+    ks = np.repeat(np.arange(n_k), n_a)
+    a_ids = np.tile(np.arange(n_a), n_k)
+    x_cols = ks * n_a + a_ids
+    model.families.append(('flow variables x(k,i,j,e)', 0, n_k * n_a, True))
+
+    # Flow continuity constraint
+    straight = ~loop[a_ids]
+    rows = [ks[straight] * n_v + pos[arc_tail[a_ids[straight]]]
+            , ks[straight] * n_v + pos[arc_head[a_ids[straight]]]]
+    cols = [x_cols[straight], x_cols[straight]]
+    coefs = [np.ones(straight.sum()), -np.ones(straight.sum())]
+    rhs = np.zeros(n_k * n_v)
+    rhs[np.arange(n_k) * n_v + pos[np.asarray(d)]] = -1
+    rhs[np.arange(n_k) * n_v + pos[np.asarray(s)]] = 1
+    sense = ['E'] * (n_k * n_v)
+
+    # Capacity constraint
+    rows.append(n_k * n_v + arc_e[a_ids])
+    cols.append(x_cols)
+    coefs.append(cap[ks] * mult[a_ids])
+    rhs = np.concatenate((rhs, sp))
+    sense += ['L'] * n_e
+
+    model.obj = weight[arc_e[a_ids]] * mult[a_ids]
+    model.lb = np.zeros(n_k * n_a)
+    model.ub = np.full(n_k * n_a, float(upper))
+    model.integer = np.ones(n_k * n_a, dtype=bool)
+    model.rows = rows
+    model.cols = cols
+    model.coefs = coefs
+    model.rhs = rhs
+    model.sense = sense
+    return model
+
+
+def _finish(model):
+    model.rows = np.concatenate(model.rows)
+    model.cols = np.concatenate(model.cols)
+    model.coefs = np.concatenate(model.coefs)
+    model.sense = np.array(model.sense)
+    return model
+
+
+def offline_rca_sparse(graph, s, d, c, weights=None, spare=None
+                       , instance_name="NN"):
+    """
+    Offline Route and Capacity Assignment, as a SparseModel. Same model
+    as rca.offline_rca, without creating pulp variables or expressions.
+    Args:
+        graph: A graph that represents the logical topology, or its Topology
+        s: A list of source indexes.
+        d: A list of destination indexes.
+        c: A list of capacities demanded
+        weights: A list of edge weights, a label for edge attribute or None
+        spare: A list of edge spare capacity, a label for edge attribute
+               or None (No capacity constraint)
+        instance_name: a name for the instance (LPproblem)
+
+    Returns: A SparseModel instance
+
+    Raises:
+        ValueError: If a source or destination has no incident edges.
+
+    """
+
+    graph = as_topology(graph)
+
+    return _finish(_flow_model(graph, s, d, c, weights, spare, 1
+                               , instance_name))
+
+
+def offline_1p1_rca_sparse(graph, s, d, c, weights=None, spare=None
+                           , instance_name="NN"):
+    """
+    Offline 1+1 Route and Capacity Assignment, as a SparseModel. Same model
+    as rca.offline_1p1_rca, without creating pulp variables or expressions.
+    Args:
+        graph: A graph that represents the logical topology, or its Topology
+        s: A list of source indexes.
+        d: A list of destination indexes.
+        c: A list of capacities demanded
+        weights: A list of edge weights, a label for edge attribute or None
+        spare: A list of edge spare capacity, a label for edge attribute
+               or None (No capacity constraint)
+        instance_name: a name for the instance (LPproblem)
+
+    Returns: A SparseModel instance
+
+    Raises:
+        ValueError: If a source or destination has no incident edges.
+
+    """
+
+    graph = as_topology(graph)
+
+    model = _flow_model(graph, s, d, c, weights, spare, 2, instance_name)
+    weight = edge_values(graph, weights, 1)
+    B = 10. * len(s) * sum(weight)
+
+    n_k = len(s)
+    n_a = len(model.arc_e)
+    n_e = len(model.edges)
+    n_x = n_k * n_a
+    n_r = len(model.rhs)
+
+    # Jointness variables j(k,i,j,e), one per demand and edge.
+    model.families.append(('jointness variables j(k,i,j,e)', n_x, n_k * n_e
+                           , False))
+    ks = np.repeat(np.arange(n_k), n_a)
+    a_ids = np.tile(np.arange(n_a), n_k)
+    loop = model.arc_tail == model.arc_head
+    j_rows = n_r + ks * n_e + model.arc_e[a_ids]
+    model.rows += [j_rows, n_r + np.arange(n_k * n_e)]
+    model.cols += [ks * n_a + a_ids, n_x + np.arange(n_k * n_e)]
+    model.coefs += [-np.where(loop, 2., 1.)[a_ids], np.ones(n_k * n_e)]
+    model.rhs = np.concatenate((model.rhs, -np.ones(n_k * n_e)))
+    model.sense += ['G'] * (n_k * n_e)
+
+    model.obj = np.concatenate((model.obj, np.full(n_k * n_e, B)))
+    model.lb = np.concatenate((model.lb, np.zeros(n_k * n_e)))
+    model.ub = np.concatenate((model.ub, np.ones(n_k * n_e)))
+    model.integer = np.concatenate((model.integer
+                                    , np.ones(n_k * n_e, dtype=bool)))
+    return _finish(model)
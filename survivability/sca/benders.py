@@ -0,0 +1,309 @@
+# coding=utf-8
+import math
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+from pulp import *
+
+from survivability.preproc.compute import *
+from survivability.utils.demands import as_demands
+from survivability.utils.topology import as_topology
+
+_EPS = 0.000001
+
+_data = None
+
+
+def _init_worker(data):
+    global _data
+    _data = data
+
+
+def _scenario_subproblem(task, data=None):
+    """
+    Subproblema de restauración de un escenario para una capacidad spare
+    fija: rutea las demandas afectadas sobre los arcos que sobreviven,
+    minimizando la capacidad faltante z(e) (holgura de la restricción de
+    capacidad).
+
+    Args:
+        task: Tupla (g, routed, alive, sp_g, spare, integer) con el índice
+              del escenario, las demandas a rutear, los arcos que
+              sobreviven, la capacidad disponible por arco, la capacidad
+              spare instalada (del maestro) y si las variables de flujo
+              son enteras.
+        data: Tupla (edges, inc, sources, destinations, caps, avoid, cost),
+              o None para usar la del proceso (ver _init_worker).
+
+    Returns: g, phi, duals, missing
+        phi: Capacidad faltante total (0 si el escenario es factible). Con
+             variables enteras es el costo de la capacidad faltante, no se
+             permite capacidad faltante en los arcos que no pueden crecer,
+             y phi es None si así el escenario no tiene solución.
+        duals: Diccionario e_id -> dual de la restricción de capacidad
+               (solo con variables continuas).
+        missing: Diccionario e_id -> capacidad faltante z(e) > 0.
+    """
+    if data is None:
+        data = _data
+    edges, inc, sources, destinations, caps, avoid, cost = data
+    g, routed, alive, sp_g, spare, integer = task
+    if not routed:
+        return g, 0., {}, {}
+
+    alive_set = set(alive)
+    prob = LpProblem("SCA scenario %d" % g, LpMinimize)
+    x_combs = []
+    for k in routed:
+        for e_id in alive:
+            u, v = edges[e_id]
+            x_combs.append((k, u, v, e_id))
+            x_combs.append((k, v, u, e_id))
+    x = LpVariable.dicts("x", x_combs, lowBound=0, upBound=1
+                         , cat=LpInteger if integer else LpContinuous)
+    z = LpVariable.dicts("z", alive, lowBound=0, cat=LpContinuous)
+    if integer:
+        for e_id in alive:
+            if avoid[e_id]:
+                z[e_id].upBound = 0
+
+    if integer:
+        # Capacidad faltante de menor costo
+        prob += lpSum(cost[e_id] * z[e_id] for e_id in alive)
+    else:
+        prob += lpSum(z.values())
+
+    # Continuidad de los caminos
+    for k in routed:
+        for i, inc_i in enumerate(inc):
+            coefs = {}
+            for e_id, j in inc_i:
+                if e_id not in alive_set:
+                    continue
+                out_var = x[(k, i, j, e_id)]
+                in_var = x[(k, j, i, e_id)]
+                coefs[out_var] = coefs.get(out_var, 0) + 1
+                coefs[in_var] = coefs.get(in_var, 0) - 1
+            if coefs:
+                if i == sources[k]:
+                    rhs = 1
+                elif i == destinations[k]:
+                    rhs = -1
+                else:
+                    rhs = 0
+                prob += LpConstraint(LpAffineExpression(coefs)
+                                     , LpConstraintEQ, rhs=rhs)
+
+    # Capacidad por arco
+    rows = {}
+    for e_id in alive:
+        u, v = edges[e_id]
+        coefs = {z[e_id]: -1}
+        for k in routed:
+            for var in (x[(k, u, v, e_id)], x[(k, v, u, e_id)]):
+                coefs[var] = coefs.get(var, 0) + caps[k]
+        rows[e_id] = LpConstraint(LpAffineExpression(coefs), LpConstraintLE
+                                  , rhs=sp_g[e_id] + spare[e_id])
+        prob += rows[e_id]
+
+    prob.solve(PULP_CBC_CMD(msg=False))
+    if integer and prob.status == LpStatusInfeasible:
+        return g, None, {}, {}
+    if prob.status != LpStatusOptimal:
+        raise ValueError("Subproblem of scenario %d was not solved" % g)
+    phi = sum(z[e_id].varValue or 0 for e_id in alive)
+    duals = {}
+    if not integer:
+        for e_id, row in rows.items():
+            if row.pi is not None and abs(row.pi) > _EPS:
+                duals[e_id] = row.pi
+    missing = {}
+    for e_id in alive:
+        if (z[e_id].varValue or 0) > _EPS:
+            missing[e_id] = z[e_id].varValue
+    return g, phi, duals, missing
+
+
+def sca_benders(graph, scenarios, demands, inst_s='s', e_avoid='avoid'
+                , e_cost='weight', workers=None, tol=0.001, max_iter=50
+                , solver=None, instance_name="NN"):
+    """
+    Resuelve el problema de spare capacity allocation (el de sca_lp)
+    descomponiendo por escenario (Benders). El problema maestro tiene solo
+    las variables de capacidad s(e); los subproblemas de cada escenario
+    (relajación lineal del ruteo de restauración, con holguras de
+    capacidad) se resuelven en paralelo en un pool de procesos y sus duales
+    generan cortes de factibilidad para el maestro.
+
+    El maestro da la cota inferior. La cota superior se obtiene verificando
+    la capacidad del maestro con los subproblemas enteros y, si falta
+    capacidad en algunos escenarios, agregando la capacidad faltante de
+    cada uno de ellos en secuencia. Los escenarios factibles en la
+    relajación pero no con ruteo entero agregan un corte combinatorio al
+    maestro (alguno de sus arcos debe crecer), con lo que la diferencia
+    entre cotas se cierra en una cantidad finita de iteraciones.
+
+    Args:
+        graph: Un grafo de igraph (o su Topology) que representa la
+               topología sobre la que se rutean las demandas de servicio.
+        scenarios: Es una lista de escenarios de corte (ver sca_lp).
+        demands: Es una lista de demandas (ver sca_lp).
+        inst_s: Representa a la capacidad spare pre-instalada. Puede ser una
+                lista o un label para un atributo de los arcos del grafo.
+        e_avoid: Representa a la posibilidad de instalar nueva capacidad en
+                 cada arco. Puede ser una lista o un label para un atributo
+                 de los arcos del grafo.
+        e_cost: Representa el costo de instalar una unidad de capacidad en
+                cada arco. Puede ser una lista o un label para un atributo
+                de los arcos del grafo.
+        workers: Cantidad de procesos, None para uno por CPU. Con 1 todo se
+                 resuelve en el proceso que llama.
+        tol: Diferencia relativa entre las cotas con la que se termina.
+        max_iter: Cantidad máxima de iteraciones.
+        solver: Un solver de pulp para el maestro, o None.
+        instance_name: El nombre de la instancia.
+
+    Returns: spare, history
+        spare: Lista con la capacidad a instalar en cada arco de la mejor
+               solución factible encontrada (None si no se encontró).
+        history: Lista de tuplas (cota inferior, cota superior) por
+                 iteración.
+    """
+    graph = as_topology(graph)
+    edges = graph.edges
+    n_edges = graph.n_edges
+    demands = as_demands(demands, graph)
+
+    if isinstance(inst_s, str):
+        inst_s = graph.attribute(inst_s)
+
+    if isinstance(e_avoid, str):
+        e_avoid = graph.attribute(e_avoid)
+
+    if isinstance(e_cost, str):
+        e_cost = graph.attribute(e_cost)
+
+    # Pre-procesamiento
+    kp = compute_kp(graph, scenarios, demands)
+    ks = compute_ks(scenarios, demands)
+    sp = compute_sp(scenarios, demands, inst_s)
+    sources, destinations = compute_sides(graph, demands)
+    caps = demands.caps.tolist()
+
+    routed = []
+    alive = []
+    for g, g_list in enumerate(scenarios):
+        ks_g = set(ks[g])
+        cut = set(g_list)
+        routed.append([k for k in kp[g] if k in ks_g])
+        alive.append([e_id for e_id in range(n_edges) if e_id not in cut])
+    active = [g for g in range(len(scenarios)) if routed[g]]
+
+    indptr = graph.indptr.tolist()
+    pairs = list(zip(graph.indices.tolist(), graph.neighbors.tolist()))
+    inc = [pairs[indptr[i]:indptr[i + 1]] for i in range(graph.n_vertices)]
+    data = (edges, inc, sources, destinations, caps, e_avoid, e_cost)
+
+    # Problema maestro
+    master = LpProblem("SCA master: %s" % instance_name, LpMinimize)
+    s = LpVariable.dicts("spare capacity s(e)", range(n_edges), lowBound=0
+                         , cat=LpInteger)
+    for e_id in range(n_edges):
+        if e_avoid[e_id]:
+            s[e_id].upBound = 0
+    master += lpSum(e_cost[e_id] * s[e_id] for e_id in range(n_edges))
+
+    if workers is None:
+        workers = os.cpu_count() or 1
+    pool = None
+    if workers > 1 and len(active) > 1:
+        pool = ProcessPoolExecutor(max_workers=workers
+                                   , initializer=_init_worker
+                                   , initargs=(data,))
+
+    def solve_all(spare, integer):
+        tasks = [(g, routed[g], alive[g], sp[g], spare, integer)
+                 for g in active]
+        if pool is None:
+            return [_scenario_subproblem(task, data) for task in tasks]
+        return list(pool.map(_scenario_subproblem, tasks))
+
+    def cost(spare):
+        return sum(e_cost[e_id] * spare[e_id] for e_id in range(n_edges))
+
+    best = None
+    upper = float('inf')
+    history = []
+    n_cuts = 0
+    try:
+        for _ in range(max_iter):
+            master.solve(solver or PULP_CBC_CMD(msg=False))
+            if master.status != LpStatusOptimal:
+                break
+            spare = [int(round(s[e_id].varValue or 0))
+                     for e_id in range(n_edges)]
+            lower = cost(spare)
+
+            # Cortes de factibilidad de la relajación de cada escenario:
+            # phi(s) >= phi(spare) + sum pi(e) * (s(e) - spare(e)), y phi(s)
+            # debe ser 0.
+            cuts = 0
+            relaxed = set()
+            for g, phi, duals, missing in solve_all(spare, False):
+                if phi <= _EPS:
+                    relaxed.add(g)
+                    continue
+                rhs = -phi + sum(pi * spare[e_id]
+                                 for e_id, pi in duals.items())
+                master += lpSum(pi * s[e_id]
+                                for e_id, pi in duals.items()) <= rhs
+                cuts += 1
+
+            # Cota superior: a la capacidad del maestro se le agrega la
+            # capacidad faltante de los subproblemas enteros, de a un
+            # escenario (los de mayor faltante primero), así la capacidad
+            # agregada para uno es aprovechada por los siguientes.
+            failed = []
+            infeasible = False
+            for g, phi, duals, missing in solve_all(spare, True):
+                if phi is None:
+                    infeasible = True
+                elif missing:
+                    failed.append((phi, g))
+            if not infeasible:
+                repaired = spare[:]
+                for phi, g in sorted(failed, reverse=True):
+                    task = (g, routed[g], alive[g], sp[g], repaired, True)
+                    missing = _scenario_subproblem(task, data)[3]
+                    for e_id, value in missing.items():
+                        repaired[e_id] += int(math.ceil(value - _EPS))
+                if cost(repaired) < upper:
+                    best, upper = repaired, cost(repaired)
+            failed = [g for phi, g in failed]
+
+            # Escenarios factibles en la relajación pero no con ruteo entero:
+            # como agregar capacidad nunca quita factibilidad, toda solución
+            # debe superar spare en algún arco del escenario (corte
+            # combinatorio, con binarias y(e) = 1 si s(e) >= spare(e) + 1).
+            for g in failed:
+                if g not in relaxed:
+                    continue
+                grow = [e_id for e_id in alive[g] if not e_avoid[e_id]]
+                if not grow:
+                    continue
+                n_cuts += 1
+                y = LpVariable.dicts("grow y(c,e)_%d" % n_cuts, grow
+                                     , cat=LpBinary)
+                for e_id in grow:
+                    master += s[e_id] >= (spare[e_id] + 1) * y[e_id]
+                master += lpSum(y.values()) >= 1
+                cuts += 1
+
+            history.append((lower, upper))
+            if not cuts or upper - lower <= tol * max(1., abs(upper)):
+                break
+    finally:
+        if pool is not None:
+            pool.shutdown()
+
+    return best, history
@@ -2,28 +2,34 @@
 
 from pulp import *
 from survivability.preproc.compute import *
+from survivability.preproc.compute import reduce_indices
+from survivability.utils.demands import as_demands
+from survivability.utils.topology import as_topology
 
 
 def sca_lp(graph, scenarios, demands, inst_s='s', e_avoid='avoid'
-           , e_cost='weight', instance_name="NN"):
+           , e_cost='weight', instance_name="NN", reduce=False
+           , restrict=False, max_length=None, e_length=None):
     """
     Este método crea una instancia de problema de spare capacity allocation
     para un esquema de restauración. En las demandas solo deben incluirse
     aquellas que requieran restauración.
 
     Args:
-        graph: Un grafo de igraph que representa la topología sobre la que
-               se rutean las demandas de servicio.
+        graph: Un grafo de igraph (o su Topology) que representa la
+               topología sobre la que se rutean las demandas de servicio.
         scenarios: Es una lista de escenarios de corte. Donde cada elemento
                    de la lista (escenario) es una lista con los inidices de
                    arco, e_ids, de aquellos arcos que están cortados. La
                    posición en la lista representa el número de escenario.
+                   También puede ser un ScenarioSet (ver utils.scenarios).
         demands: Es una lista de demandas. Cada demanda es una tupla de dos
                  elementos, donde el primero es la capacidad demandada y el
                  segundo es una lista de caminos. Estos caminos representan
                  a los caminos de working y protección dedicada del servicio.
                  [(3,[[0],[2,1]]),(2,[[23],[21,13],[45,20]]),(4,[[43]]),
                     ...,(cap,[epath0,epath1])]
+                 También puede ser un DemandSet (ver utils.demands).
         inst_s: Representa a la capacidad spare pre-instalada. Puede ser una
                 lista o un label para un atributo de los arcos del grafo.
         e_avoid: Representa a la posibilidad de instalar nueva capacidad en
@@ -34,28 +40,86 @@ def sca_lp(graph, scenarios, demands, inst_s='s', e_avoid='avoid'
                 arco. Puede ser una lista o un label para un atributo de los
                 arcos del grafo.
         instance_name: El nombre de la instancia.
+        reduce: Si es True, antes de armar el problema se agrupan los
+                escenarios equivalentes y se descartan los dominados (ver
+                reduce_scenarios). El índice g de las variables es entonces
+                la posición en la lista reducida.
+        restrict: Si es True, las variables de flujo de cada demanda en cada
+                  escenario se crean solo para los arcos que pueden formar
+                  parte de un camino simple entre su origen y destino (ver
+                  compute_reachable). No cambia el óptimo.
+        max_length: Longitud máxima de los caminos de restauración, o None.
+                    Implica restrict, y restringe el problema (puede
+                    cambiar su óptimo). Si alguna demanda no tiene camino
+                    dentro del límite se lanza ValueError.
+        e_length: La longitud de cada arco para max_length. Puede ser una
+                  lista, un label para un atributo de los arcos del grafo o
+                  None (cantidad de saltos).
 
     Returns: Una instancia de pulp.LpProblem que contiene la instancia del
-             problema de SCA sin resolver.
+             problema de SCA sin resolver. Con reduce, una tupla (prob,
+             mapping) donde mapping da para cada escenario original el
+             índice g del escenario que lo cubre, o None (ver
+             reduce_scenarios).
 
     """
 
-    graph = graph.copy()  # Copiar el grafo.
+    graph = as_topology(graph)  # Snapshot del grafo (no se modifica).
+    edges = graph.edges
+    demands = as_demands(demands, graph)  # Arrays e índices, una vez.
 
     if isinstance(inst_s, str):
-        inst_s = graph.es[inst_s]
+        inst_s = graph.attribute(inst_s)
 
     if isinstance(e_avoid, str):
-        e_avoid = graph.es[e_avoid]
+        e_avoid = graph.attribute(e_avoid)
 
     if isinstance(e_cost, str):
-        e_cost = graph.es[e_cost]
+        e_cost = graph.attribute(e_cost)
 
     # Pre-procesamiento
     kp = compute_kp(graph, scenarios, demands)
     ks = compute_ks(scenarios, demands)
     sp = compute_sp(scenarios, demands, inst_s)
     sources, destinations = compute_sides(graph, demands)
+    caps = [int(cap) for cap in demands.caps.tolist()]
+
+    if reduce:
+        keep, mapping = reduce_indices(scenarios, kp, ks, sp
+                                       , graph.n_edges)
+        scenarios = [scenarios[g] for g in keep]
+        kp = [kp[g] for g in keep]
+        ks = [ks[g] for g in keep]
+        sp = [sp[g] for g in keep]
+
+    # Estructuras indexadas, calculadas una sola vez: arcos que sobreviven
+    # en cada escenario, demandas a rutear (kp ∩ ks) por escenario e
+    # incidencia vertice -> (arco, vecino).
+    n_edges = graph.n_edges
+    cut = [set(g_list) for g_list in scenarios]
+    alive = [[e_id for e_id in range(n_edges) if e_id not in cut_g]
+             for cut_g in cut]
+    routed = []
+    for g in range(len(scenarios)):
+        ks_g = set(ks[g])
+        routed.append([k for k in kp[g] if k in ks_g])
+    indptr = graph.indptr.tolist()
+    pairs = list(zip(graph.indices.tolist(), graph.neighbors.tolist()))
+    inc = [pairs[indptr[i]:indptr[i + 1]] for i in range(graph.n_vertices)]
+
+    # Arcos utilizables por demanda y escenario (None: todos los que
+    # sobreviven).
+    usable = None
+    if restrict or max_length is not None:
+        kr = compute_reachable(graph, scenarios, demands, routed, max_length
+                               , e_length)
+        usable = [dict((k, set(e_ids)) for k, e_ids in kr_g.items())
+                  for kr_g in kr]
+        for g in range(len(scenarios)):
+            for k in routed[g]:
+                if not kr[g][k]:
+                    raise ValueError("Demand %d has no restoration path in"
+                                     " scenario %d" % (k, g))
 
     # Creación de la instancia
     prob = LpProblem("SCA instance: %s" % instance_name, LpMinimize)
@@ -65,23 +129,24 @@ def sca_lp(graph, scenarios, demands, inst_s='s', e_avoid='avoid'
 
     # Variables de flujo
     x_combs = []
-    for g, g_list in enumerate(scenarios):
-        for k in [ki for ki in kp[g] if ki in ks[g]]:
-            for e_id, e in [(e_i, ed) for (e_i, ed) in list(enumerate(graph.es)) if e_i not in g_list]:
-                x_combs.append((k, g, e.source, e.target, e_id))
-                x_combs.append((k, g, e.target, e.source, e_id))
+    for g in range(len(scenarios)):
+        for k in routed[g]:
+            for e_id in (alive[g] if usable is None else kr[g][k]):
+                u, v = edges[e_id]
+                x_combs.append((k, g, u, v, e_id))
+                x_combs.append((k, g, v, u, e_id))
 
     x = LpVariable.dicts("flow variables x(k,g,i,j,e)", x_combs, lowBound=0, upBound=1, cat=LpInteger)
 
     # Variables de capacidad necesaria a instalar
-    cs_combs = [e_id for e_id in range(len(graph.es))]
+    cs_combs = [e_id for e_id in range(n_edges)]
 
     s = LpVariable.dicts("spare capacity s(e)", cs_combs, lowBound=0, cat=LpInteger)
 
     # Variables de capacidad utilizada por arco por escenario
     cg_combs = []
-    for g, g_list in enumerate(scenarios):
-        for e_id in [e_i for e_i in range(len(graph.es)) if e_i not in g_list]:
+    for g in range(len(scenarios)):
+        for e_id in alive[g]:
             cg_combs.append((g, e_id))
 
     cg = LpVariable.dicts("graph capacities c(g,e)", cg_combs, lowBound=0, cat=LpInteger)
@@ -91,72 +156,86 @@ def sca_lp(graph, scenarios, demands, inst_s='s', e_avoid='avoid'
 
     # Restriccion de continuidad de los caminos  (2)
     r = 0
-    for g, g_list in enumerate(scenarios):
-        for k in [ki for ki in kp[g] if ki in ks[g]]:
-
-            for i in range(len(graph.vs)):
-                restr = ""
-                for e_id, e in [(e_i, ed) for (e_i, ed) in list(enumerate(graph.es)) if e_i not in g_list]:
-                    if e.source == i:
-                        restr += " + x[(%d,%d,%d,%d,%d)]" % (k, g, i, e.target, e_id)
-                        restr += " - x[(%d,%d,%d,%d,%d)]" % (k, g, e.target, i, e_id)
-                    elif e.target == i:
-                        restr += " + x[(%d,%d,%d,%d,%d)]" % (k, g, i, e.source, e_id)
-                        restr += " - x[(%d,%d,%d,%d,%d)]" % (k, g, e.source, i, e_id)
-                if restr:
-
+    for g in range(len(scenarios)):
+        cut_g = cut[g]
+        for k in routed[g]:
+            usable_k = None if usable is None else usable[g][k]
+            for i, inc_i in enumerate(inc):
+                coefs = {}
+                for e_id, j in inc_i:
+                    if e_id in cut_g or (usable_k is not None
+                                         and e_id not in usable_k):
+                        continue
+                    out_var = x[(k, g, i, j, e_id)]
+                    in_var = x[(k, g, j, i, e_id)]
+                    coefs[out_var] = coefs.get(out_var, 0) + 1
+                    coefs[in_var] = coefs.get(in_var, 0) - 1
+                if coefs:
                     if i == sources[k]:
-                        restr += " == 1"
+                        rhs = 1
                     elif i == destinations[k]:
-                        restr += " == -1"
+                        rhs = -1
                     else:
-                        restr += " == 0"
-                    prob += eval(restr)
+                        rhs = 0
+                    prob += LpConstraint(LpAffineExpression(coefs)
+                                         , LpConstraintEQ, rhs=rhs)
 
     # Capacidad necesaria por subgrafo (5)
-    for g, g_list in enumerate(scenarios):
-        for e_id, e in [(e_i, ed) for (e_i, ed) in list(enumerate(graph.es)) if e_i not in g_list]:
-
-            restr = ""
-            for k in [ki for ki in kp[g] if ki in ks[g]]:
-                restr += " + %d * x[(%d,%d,%d,%d,%d)]" % (demands[k][0], k, g, e.source, e.target, e_id)
-                restr += " + %d * x[(%d,%d,%d,%d,%d)]" % (demands[k][0], k, g, e.target, e.source, e_id)
-
-            restr += " - cg[(%d,%d)] == 0" % (g, e_id)
-            prob += eval(restr)
+    for g in range(len(scenarios)):
+        for e_id in alive[g]:
+            u, v = edges[e_id]
+            coefs = {}
+            for k in routed[g]:
+                if usable is not None and e_id not in usable[g][k]:
+                    continue
+                for var in (x[(k, g, u, v, e_id)], x[(k, g, v, u, e_id)]):
+                    coefs[var] = coefs.get(var, 0) + caps[k]
+            coefs[cg[(g, e_id)]] = -1
+            prob += LpConstraint(LpAffineExpression(coefs), LpConstraintEQ
+                                 , rhs=0)
 
     # Capacidad necesaria por arco por escenario (6)
-    for g, g_list in enumerate(scenarios):
-        for e_id, e in [(e_i, ed) for (e_i, ed) in list(enumerate(graph.es)) if e_i not in g_list]:
+    for g in range(len(scenarios)):
+        for e_id in alive[g]:
             prob += cg[(g, e_id)] - s[e_id] <= sp[g][e_id]
 
     # No crecer en este arco (7)
-    for e_id, e in enumerate(graph.es):
+    for e_id in range(n_edges):
         if e_avoid[e_id]:
             prob += s[e_id] == 0
 
     # Relacion entre s y los sije (es la suma de todos) (8)
-    prob += s_total + sum([- e_cost[e_id] * s[e_id] for (e_id, e) in enumerate(graph.es)]) == 0, "c%d" % (r)
+    prob += s_total + sum([- e_cost[e_id] * s[e_id] for e_id in range(n_edges)]) == 0, "c%d" % (r)
 
     # Restriccion que elimina bucles simples (3)
-    for g, g_list in enumerate(scenarios):
-        for e_id, e in [(e_i, ed) for (e_i, ed) in list(enumerate(graph.es)) if e_i not in g_list]:
-            for k in [ki for ki in kp[g] if ki in ks[g]]:
-                prob += x[(k, g, e.source, e.target, e_id)] + x[(k, g, e.target, e.source, e_id)] <= 1
+    for g in range(len(scenarios)):
+        for e_id in alive[g]:
+            u, v = edges[e_id]
+            for k in routed[g]:
+                if usable is not None and e_id not in usable[g][k]:
+                    continue
+                prob += x[(k, g, u, v, e_id)] + x[(k, g, v, u, e_id)] <= 1
 
     # Restriccion que elimina los posible bucles ocaiconados por arcos multiples (3 bis)
-    for (e_id, e) in enumerate(graph.es):
-        for e_id2 in range(e_id + 1, len(graph.es)):
-            sd = [graph.es[e_id2].source, graph.es[e_id2].target]
-            if (e.source in sd) and (e.target in sd):
+    # (los grupos de arcos paralelos vienen precalculados en el Topology, y
+    # solo se consideran los escenarios en los que ambos arcos sobreviven y
+    # pueden ser usados por la demanda)
+    for e_id, (u, v) in enumerate(edges):
+        if graph.parallel_of[e_id] < 0:
+            continue
+        for e_id2 in graph.parallel[graph.parallel_of[e_id]]:
+            if e_id2 > e_id:
                 for g in range(len(scenarios)):
-                    for k in [ki for ki in kp[g] if ki in ks[g]]:
-                        prob += x[(k, g, e.source, e.target, e_id)] + x[(k, g, e.target, e.source, e_id)] + x[
-                            (k, g, e.source, e.target, e_id2)] + x[(k, g, e.target, e.source, e_id2)] <= 1
-
+                    if e_id in cut[g] or e_id2 in cut[g]:
+                        continue
+                    for k in routed[g]:
+                        if usable is not None and (
+                                e_id not in usable[g][k]
+                                or e_id2 not in usable[g][k]):
+                            continue
+                        prob += x[(k, g, u, v, e_id)] + x[(k, g, v, u, e_id)] + x[
+                            (k, g, u, v, e_id2)] + x[(k, g, v, u, e_id2)] <= 1
+
+    if reduce:
+        return prob, mapping
     return prob
-
-
-
-
-
@@ -0,0 +1,269 @@
+# coding=utf-8
+import hashlib
+import os
+import pickle
+import time
+from collections import OrderedDict
+
+import numpy as np
+from pulp import LpProblem
+
+from survivability.utils.demands import DemandSet
+from survivability.utils.scenarios import ScenarioSet
+from survivability.utils.topology import Topology, as_topology
+
+# Cambia con el formato de las entradas guardadas.
+_FORMAT = 1
+
+# Cantidad de bytes de un array que se agregan al hash de una vez.
+_CHUNK = 1 << 24
+
+
+def _feed_array(h, array):
+    array = np.asarray(array)
+    if array.dtype == object:
+        # Los bytes de un array de objetos son punteros: se usan sus valores.
+        h.update(b"o")
+        _feed(h, array.tolist())
+        return
+    h.update(('a%s%r' % (array.dtype.str, array.shape)).encode())
+    flat = array.reshape(-1)
+    step = max(1, _CHUNK // max(1, array.itemsize))
+    for start in range(0, len(flat), step):
+        h.update(np.ascontiguousarray(flat[start:start + step]).tobytes())
+
+
+def _feed(h, value):
+    # Agrega value al hash con un prefijo por tipo, así valores distintos
+    # no producen la misma secuencia de bytes.
+    if value is None or isinstance(value, (bool, int, float, str, bytes)):
+        h.update(('v%s:%r;' % (type(value).__name__, value)).encode())
+    elif isinstance(value, np.generic):
+        _feed(h, value.item())
+    elif isinstance(value, np.ndarray):
+        _feed_array(h, value)
+    elif isinstance(value, Topology):
+        h.update(b'topology')
+        _feed_array(h, value.source)
+        _feed_array(h, value.target)
+        _feed(h, value.n_vertices)
+        for name in sorted(value.attributes):
+            _feed(h, name)
+            _feed_array(h, value.attributes[name])
+    elif isinstance(value, DemandSet):
+        h.update(b'demands')
+        for array in (value.caps, value.path_ptr, value.edge_ptr
+                      , value.edges):
+            _feed_array(h, array)
+    elif isinstance(value, ScenarioSet):
+        h.update(b'scenarios')
+        for array in (value.indptr, value.edges, value.p, value.times):
+            _feed(h, array)
+    elif isinstance(value, (list, tuple)):
+        h.update(('l%d[' % len(value)).encode())
+        for item in value:
+            _feed(h, item)
+        h.update(b']')
+    elif isinstance(value, dict):
+        h.update(('d%d{' % len(value)).encode())
+        for key in sorted(value, key=repr):
+            _feed(h, key)
+            _feed(h, value[key])
+        h.update(b'}')
+    elif hasattr(value, 'get_edgelist') and hasattr(value, 'es'):
+        # Un grafo de igraph: se usa su Topology.
+        _feed(h, as_topology(value))
+    else:
+        raise TypeError("Cannot hash a %s" % type(value).__name__)
+
+
+def model_key(builder, *args, **kwargs):
+    """
+    Clave de contenido de un modelo: el hash SHA-256 del nombre de la
+    función que lo arma y de sus argumentos. Los grafos se toman por su
+    contenido (arcos y todos sus atributos, como pesos, capacidad spare o
+    avoid), lo mismo que las demandas, los escenarios y las listas.
+
+    Args:
+        builder: La función que arma el modelo (por ejemplo sca_lp u
+                 offline_rca).
+        args, kwargs: Los argumentos de builder.
+
+    Returns: La clave, un string hexadecimal.
+    """
+    h = hashlib.sha256()
+    _feed(h, (_FORMAT, builder.__module__, builder.__qualname__))
+    _feed(h, list(args))
+    _feed(h, kwargs)
+    return h.hexdigest()
+
+
+def _dump(value):
+    # Los problemas de pulp se guardan con su propio formato (to_dict), que
+    # conserva los nombres, cotas y tipos de las variables.
+    if isinstance(value, LpProblem):
+        return 'pulp', value.to_dict()
+    if isinstance(value, tuple):
+        return 'tuple', [_dump(item) for item in value]
+    return 'object', value
+
+
+def _load(entry):
+    kind, data = entry
+    if kind == 'pulp':
+        return LpProblem.from_dict(data)[1]
+    if kind == 'tuple':
+        return tuple(_load(item) for item in data)
+    return data
+
+
+class ModelCache(object):
+    """
+    Cache de modelos armados (un LpProblem de pulp, un SparseModel o una
+    tupla como (prob, index)) por clave de contenido (ver model_key), en
+    disco y en memoria, cada uno con desalojo LRU acotado en bytes. Con un
+    acierto no se llama a la función que arma el modelo.
+
+    En disco cada modelo es un archivo <clave>.pkl en path, y el orden LRU
+    es la fecha de modificación (se actualiza en cada acierto), así el
+    cache se comparte entre procesos y ejecuciones. En memoria se guarda el
+    modelo mismo, y un acierto devuelve el mismo objeto: puede resolverse
+    de nuevo (por ejemplo con otro solver) pero no debe modificarse.
+    """
+
+    def __init__(self, path, max_bytes=1 << 30, memory_bytes=1 << 28
+                 , salt=''):
+        """
+        Args:
+            path: El directorio del cache (se crea si no existe), o None
+                  para usar solo la memoria.
+            max_bytes: Tamaño máximo del cache en disco.
+            memory_bytes: Tamaño máximo (serializado) de los modelos en
+                          memoria, 0 para no guardarlos en memoria.
+            salt: Un texto que se agrega a las claves, para invalidar las
+                  entradas (por ejemplo al cambiar una formulación).
+        """
+        self.path = path
+        self.max_bytes = max_bytes
+        self.memory_bytes = memory_bytes
+        self.salt = salt
+        self.hits = 0
+        self.misses = 0
+        self._memory = OrderedDict()  # clave -> (modelo, bytes)
+        self._memory_size = 0
+        if path is not None and not os.path.isdir(path):
+            os.makedirs(path)
+
+    def key(self, builder, *args, **kwargs):
+        """
+        Returns: La clave del modelo (ver model_key), con el salt.
+        """
+        return model_key(builder, self.salt, *args, **kwargs)
+
+    def _file(self, key):
+        return os.path.join(self.path, key + '.pkl')
+
+    def get(self, key):
+        """
+        Args:
+            key: Una clave de key o model_key.
+
+        Returns: El modelo guardado con la clave, o None.
+        """
+        if key in self._memory:
+            self._memory.move_to_end(key)
+            self._touch(key)
+            return self._memory[key][0]
+        if self.path is None:
+            return None
+        try:
+            with open(self._file(key), 'rb') as f:
+                data = f.read()
+        except (IOError, OSError):
+            return None
+        self._touch(key)
+        model = _load(pickle.loads(data))
+        self._remember(key, model, len(data))
+        return model
+
+    def _touch(self, key):
+        # Marca la entrada en disco como recién usada (orden LRU).
+        if self.path is None:
+            return
+        now = time.time()
+        try:
+            os.utime(self._file(key), (now, now))
+        except OSError:
+            pass
+
+    def put(self, key, model):
+        """
+        Guarda el modelo con la clave y desaloja los menos usados.
+        """
+        data = pickle.dumps(_dump(model), protocol=pickle.HIGHEST_PROTOCOL)
+        self._remember(key, model, len(data))
+        if self.path is None:
+            return
+        # Se escribe en un temporal y se renombra, así otro proceso nunca
+        # lee un archivo a medias.
+        tmp = self._file(key) + '.%d.tmp' % os.getpid()
+        with open(tmp, 'wb') as f:
+            f.write(data)
+        os.replace(tmp, self._file(key))
+        self._evict()
+
+    def build(self, builder, *args, **kwargs):
+        """
+        Devuelve el modelo builder(*args, **kwargs) del cache, o lo arma y
+        lo guarda si no está.
+        """
+        key = self.key(builder, *args, **kwargs)
+        model = self.get(key)
+        if model is not None:
+            self.hits += 1
+            return model
+        self.misses += 1
+        model = builder(*args, **kwargs)
+        self.put(key, model)
+        return model
+
+    def clear(self):
+        """
+        Borra todas las entradas, en memoria y en disco.
+        """
+        self._memory.clear()
+        self._memory_size = 0
+        if self.path is not None:
+            for name in os.listdir(self.path):
+                if name.endswith('.pkl'):
+                    os.remove(os.path.join(self.path, name))
+
+    def _remember(self, key, model, size):
+        if key in self._memory:
+            self._memory_size -= self._memory.pop(key)[1]
+        if size > self.memory_bytes:
+            return
+        self._memory[key] = (model, size)
+        self._memory_size += size
+        while self._memory_size > self.memory_bytes:
+            self._memory_size -= self._memory.popitem(last=False)[1][1]
+
+    def _evict(self):
+        entries = []
+        for name in os.listdir(self.path):
+            if not name.endswith('.pkl'):
+                continue
+            try:
+                stat = os.stat(os.path.join(self.path, name))
+            except OSError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, name))
+        total = sum(size for mtime, size, name in entries)
+        for mtime, size, name in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            try:
+                os.remove(os.path.join(self.path, name))
+            except OSError:
+                pass
+            total -= size
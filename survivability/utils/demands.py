@@ -0,0 +1,160 @@
+# coding=utf-8
+import numpy as np
+
+from survivability.utils.utils import _e2vpaths
+
+
+def _ptr(lengths):
+    indptr = np.zeros(len(lengths) + 1, dtype=np.int64)
+    np.cumsum(lengths, out=indptr[1:])
+    return indptr
+
+
+class DemandSet(object):
+    """
+    Conjunto de demandas guardado en arrays, construido una vez y
+    compartido por las funciones de preproc y sca en lugar de la lista de
+    tuplas (cap, [epath0, epath1, ...]). También se comporta como esa lista
+    (len, indices e iteración devuelven las tuplas), así el código que
+    recibe la lista recibe igual un DemandSet.
+
+    Atributos:
+        n_demands: Cantidad de demandas.
+        caps: Array con la capacidad de cada demanda.
+        path_ptr: Los caminos de la demanda k son los de índices
+               path_ptr[k]:path_ptr[k+1], el primero es el working.
+        edge_ptr, edges: Arcos de cada camino en formato CSR, los del
+               camino p son edges[edge_ptr[p]:edge_ptr[p+1]].
+        source, target: Arrays con el origen y el destino de cada demanda,
+               o None si el conjunto se armó sin el grafo.
+        index: El índice arco -> caminos de demand_index (bitsets por
+               camino), calculado la primera vez que se usa, o None.
+    """
+
+    __slots__ = ('n_demands', 'caps', 'path_ptr', 'edge_ptr', 'edges'
+                 , 'source', 'target', 'index')
+
+    def __init__(self, caps, path_ptr, edge_ptr, edges, source=None
+                 , target=None):
+        """
+        Args:
+            caps: Array con la capacidad de cada demanda.
+            path_ptr: Array con los límites de los caminos de cada demanda.
+            edge_ptr: Array con los límites de los arcos de cada camino.
+            edges: Array con los arcos de todos los caminos.
+            source, target: Arrays con los extremos de cada demanda, o None.
+        """
+        self.n_demands = len(caps)
+        self.caps = caps
+        self.path_ptr = path_ptr
+        self.edge_ptr = edge_ptr
+        self.edges = edges
+        self.source = source
+        self.target = target
+        self.index = None
+
+    @classmethod
+    def from_list(cls, demands, graph=None):
+        """
+        Args:
+            demands: Es una lista de demandas. Cada demanda es una tupla de
+                     dos elementos, donde el primero es la capacidad
+                     demandada y el segundo es una lista de caminos (epaths).
+            graph: Un grafo de igraph (o su Topology) para calcular los
+                   extremos de las demandas, o None.
+
+        Returns: El DemandSet de las demandas.
+        """
+        paths = [p for dem in demands for p in dem[1]]
+        path_ptr = _ptr([len(dem[1]) for dem in demands])
+        edge_ptr = _ptr([len(p) for p in paths])
+        edges = np.fromiter((e_id for p in paths for e_id in p)
+                            , dtype=np.int64, count=edge_ptr[-1])
+        caps = np.array([dem[0] for dem in demands])
+        demand_set = cls(caps, path_ptr, edge_ptr, edges)
+        if graph is not None:
+            demand_set.source, demand_set.target = demand_set.sides(graph)
+        return demand_set
+
+    def __len__(self):
+        return self.n_demands
+
+    def __getitem__(self, k):
+        return self.caps[k].item(), self.paths(k)
+
+    def __iter__(self):
+        for k in range(self.n_demands):
+            yield self[k]
+
+    def paths(self, k):
+        """
+        Args:
+            k: Un índice de demanda.
+
+        Returns: Una lista con los caminos (epaths) de la demanda.
+        """
+        bounds = self.edge_ptr[self.path_ptr[k]:self.path_ptr[k + 1] + 1]
+        edges = self.edges[bounds[0]:bounds[-1]].tolist()
+        bounds = (bounds - bounds[0]).tolist()
+        return [edges[start:end]
+                for start, end in zip(bounds[:-1], bounds[1:])]
+
+    def working(self):
+        """
+        Returns: lengths, offsets, values
+            Los caminos working de las demandas en formato CSR: el de la
+            demanda k es values[offsets[k]:offsets[k] + lengths[k]]
+            (lengths[k] es 0 si la demanda no tiene caminos).
+        """
+        first = self.path_ptr[:-1]
+        has = self.path_ptr[1:] > first
+        first = np.minimum(first, len(self.edge_ptr) - 2)
+        offsets = np.where(has, self.edge_ptr[first], 0)
+        lengths = np.where(has, self.edge_ptr[first + 1] - offsets, 0)
+        return lengths, offsets, self.edges
+
+    def sides(self, graph):
+        """
+        Args:
+            graph: Un grafo de igraph (o su Topology).
+
+        Returns: source, target
+            Arrays con el origen y el destino de cada demanda (los extremos
+            del camino working). Si el conjunto se armó con el grafo se
+            devuelven los guardados.
+
+        Raises:
+            IndexError: Si alguna demanda no tiene caminos o su camino
+                        working no es un camino.
+        """
+        if self.source is not None:
+            return self.source, self.target
+        lengths, offsets, values = self.working()
+        if np.any(lengths == 0):
+            raise IndexError("Not valid epath")
+        values = values.tolist()
+        epaths = [values[start:start + length] for start, length
+                  in zip(offsets.tolist(), lengths.tolist())]
+        indptr, vertices = _e2vpaths(graph, epaths, ragged=True)
+        return vertices[indptr[:-1]], vertices[indptr[1:] - 1]
+
+    def to_list(self):
+        """
+        Returns: La lista de tuplas (cap, [epath0, epath1, ...]).
+        """
+        return list(self)
+
+
+def as_demands(demands, graph=None):
+    """
+    Args:
+        demands: Una lista de demandas (cap, [epath0, epath1, ...]) o un
+                 DemandSet.
+        graph: Un grafo de igraph (o su Topology) para calcular los
+               extremos de las demandas, o None.
+
+    Returns: El DemandSet de las demandas (el mismo objeto si ya lo es).
+    """
+    if isinstance(demands, DemandSet):
+        return demands
+    return DemandSet.from_list(demands, graph)
@@ -0,0 +1,178 @@
+# coding=utf-8
+import os
+from array import array
+
+import numpy as np
+
+_FILES = ('indptr', 'edges', 'p', 'times')
+
+
+class ScenarioSet(object):
+    """
+    Conjunto de escenarios de corte guardado en formato CSR, con la
+    probabilidad y la cantidad de repeticiones de cada escenario, en lugar
+    de la lista de listas de e_ids (y las listas paralelas de
+    probabilidades). Se comporta como la lista de escenarios (len, índices
+    e iteración devuelven la lista de e_ids de cada escenario), así todas
+    las funciones que reciben la lista reciben igual un ScenarioSet, y los
+    arrays pueden ser arrays de NumPy mapeados a disco (ver load).
+
+    Atributos:
+        n_scenarios: Cantidad de escenarios.
+        indptr, edges: Los arcos cortados del escenario g son
+               edges[indptr[g]:indptr[g+1]].
+        p: Array con la probabilidad de cada escenario, o None.
+        times: Array con la cantidad de veces que se repite cada escenario
+               (como la de multilayer_cuts), o None.
+    """
+
+    __slots__ = ('n_scenarios', 'indptr', 'edges', 'p', 'times')
+
+    # Cantidad de escenarios que se leen juntos al iterar.
+    block = 1 << 16
+
+    def __init__(self, indptr, edges, p=None, times=None):
+        """
+        Args:
+            indptr: Array con los límites de los arcos de cada escenario.
+            edges: Array con los arcos de todos los escenarios.
+            p: Array con la probabilidad de cada escenario, o None.
+            times: Array con las repeticiones de cada escenario, o None.
+        """
+        self.n_scenarios = len(indptr) - 1
+        self.indptr = indptr
+        self.edges = edges
+        self.p = p
+        self.times = times
+
+    @classmethod
+    def from_list(cls, scenarios, p=None, times=None):
+        """
+        Args:
+            scenarios: Una lista (o un iterable) de escenarios, cada uno una
+                       lista de e_ids. Por ejemplo
+                       ScenarioSet.from_list(*multilayer_cuts(...)).
+            p: Una lista (o un iterable) con la probabilidad de cada
+               escenario, o None.
+            times: Una lista (o un iterable) con las repeticiones de cada
+                   escenario, o None.
+
+        Returns: El ScenarioSet de los escenarios.
+        """
+        indptr = array('q', [0])
+        edges = array('q')
+        for cut in scenarios:
+            edges.extend(cut)
+            indptr.append(len(edges))
+        if p is not None:
+            p = np.array(array('d', p))
+        if times is not None:
+            times = np.array(array('q', times))
+        return cls(np.array(indptr), np.array(edges), p, times)
+
+    @classmethod
+    def from_pairs(cls, items):
+        """
+        Args:
+            items: Un iterable de tuplas (cut, p, ...), como el generador de
+                   failure_scenarios, consumido una sola vez.
+
+        Returns: El ScenarioSet de los escenarios, con sus probabilidades.
+        """
+        indptr = array('q', [0])
+        edges = array('q')
+        p = array('d')
+        for item in items:
+            edges.extend(item[0])
+            indptr.append(len(edges))
+            p.append(item[1])
+        return cls(np.array(indptr), np.array(edges), np.array(p))
+
+    @classmethod
+    def load(cls, path, mmap=True):
+        """
+        Args:
+            path: El directorio escrito por save.
+            mmap: Si es True los arrays se mapean a disco (solo lectura) en
+                  lugar de leerse a memoria.
+
+        Returns: El ScenarioSet guardado.
+        """
+        arrays = {}
+        for name in _FILES:
+            filename = os.path.join(path, name + '.npy')
+            if os.path.exists(filename):
+                arrays[name] = np.load(filename
+                                       , mmap_mode='r' if mmap else None)
+        return cls(arrays['indptr'], arrays['edges'], arrays.get('p')
+                   , arrays.get('times'))
+
+    def save(self, path):
+        """
+        Guarda los arrays en el directorio path (un archivo .npy por array),
+        para leerlos con load.
+        """
+        if not os.path.isdir(path):
+            os.makedirs(path)
+        for name in _FILES:
+            filename = os.path.join(path, name + '.npy')
+            values = getattr(self, name)
+            if values is not None:
+                np.save(filename, values)
+            elif os.path.exists(filename):
+                os.remove(filename)
+
+    def __len__(self):
+        return self.n_scenarios
+
+    def __getitem__(self, g):
+        if g < 0:
+            g += self.n_scenarios
+        if not 0 <= g < self.n_scenarios:
+            raise IndexError("Scenario index out of range")
+        return self.edges[self.indptr[g]:self.indptr[g + 1]].tolist()
+
+    def __iter__(self):
+        for start in range(0, self.n_scenarios, self.block):
+            stop = min(start + self.block, self.n_scenarios)
+            bounds = np.asarray(self.indptr[start:stop + 1])
+            edges = np.asarray(self.edges[bounds[0]:bounds[-1]]).tolist()
+            bounds = (bounds - bounds[0]).tolist()
+            for g in range(stop - start):
+                yield edges[bounds[g]:bounds[g + 1]]
+
+    def take(self, ids):
+        """
+        Args:
+            ids: Una lista de índices de escenario.
+
+        Returns: Un ScenarioSet (en memoria) con los escenarios de ids, en
+                 ese orden, con sus probabilidades y repeticiones.
+        """
+        ids = np.asarray(ids, dtype=np.int64)
+        indptr = np.asarray(self.indptr)
+        lengths = indptr[ids + 1] - indptr[ids]
+        new_ptr = np.zeros(len(ids) + 1, dtype=np.int64)
+        np.cumsum(lengths, out=new_ptr[1:])
+        starts = np.repeat(indptr[ids] - new_ptr[:-1], lengths)
+        edges = np.asarray(self.edges)[starts + np.arange(new_ptr[-1])]
+        p = None if self.p is None else np.asarray(self.p)[ids]
+        times = None if self.times is None else np.asarray(self.times)[ids]
+        return ScenarioSet(new_ptr, edges, p, times)
+
+    def edge_ids(self):
+        """
+        Returns: Una lista ordenada de los arcos cortados en algún
+                 escenario, leída por bloques.
+        """
+        found = np.zeros(0, dtype=np.int64)
+        step = self.block * 16
+        for start in range(0, len(self.edges), step):
+            found = np.union1d(found, self.edges[start:start + step])
+        return found.tolist()
+
+    def to_list(self):
+        """
+        Returns: La lista de escenarios (listas de e_ids).
+        """
+        return list(self)
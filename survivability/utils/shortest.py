@@ -0,0 +1,67 @@
+# coding=utf-8
+from heapq import heappush, heappop
+
+
+def dijkstra(inc, weight, s, targets=None, allowed=None):
+    """
+    Dijkstra sobre un índice de incidencia.
+    Args:
+        inc: El índice de incidencia, una lista con los pares (e_id, vecino)
+             de cada vértice (como el de rca.builder.incidence).
+        weight: Una lista con el peso (no negativo) de cada arco.
+        s: El índice del vértice de origen.
+        targets: Un conjunto de índices de vértice, la búsqueda termina
+                 cuando todos tienen su distancia definitiva. None para
+                 recorrer todos los vértices alcanzables.
+        allowed: Una lista de booleanos por arco, False para los arcos que
+                 no pueden usarse, o None.
+
+    Returns: dist, pred
+        dist: Un diccionario con la distancia desde s a cada vértice
+              alcanzado.
+        pred: Un diccionario con el arco por el que se llega a cada vértice
+              alcanzado (None para s).
+    """
+    dist = {}
+    pred = {s: None}
+    best = {s: 0}
+    pending = None if targets is None else set(targets)
+    heap = [(0, s)]
+    while heap:
+        dist_i, i = heappop(heap)
+        if i in dist:
+            continue
+        dist[i] = dist_i
+        if pending is not None:
+            pending.discard(i)
+            if not pending:
+                break
+        for e_id, j in inc[i]:
+            if j in dist or (allowed is not None and not allowed[e_id]):
+                continue
+            dist_j = dist_i + weight[e_id]
+            if j not in best or dist_j < best[j]:
+                best[j] = dist_j
+                pred[j] = e_id
+                heappush(heap, (dist_j, j))
+    return dist, pred
+
+
+def tree_path(edges, pred, s, d):
+    """
+    Args:
+        edges: Una lista con la tupla (source, target) de cada arco.
+        pred: Los arcos predecesores, como los devuelve dijkstra.
+        s: El índice del vértice de origen.
+        d: El índice del vértice de destino.
+
+    Returns: El camino (epath) de s a d, ordenado desde s.
+    """
+    epath = []
+    v = d
+    while v != s:
+        e_id = pred[v]
+        epath.append(e_id)
+        u, w = edges[e_id]
+        v = u if w == v else w
+    return epath[::-1]
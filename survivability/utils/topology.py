@@ -0,0 +1,315 @@
+# coding=utf-8
+from types import MappingProxyType
+
+import numpy as np
+
+
+def _frozen(array):
+    array.setflags(write=False)
+    return array
+
+
+class Topology(object):
+    """
+    Snapshot de solo lectura de un grafo de igraph, construido una vez y
+    compartido por todos los modulos en lugar del grafo. Los arrays no se
+    pueden escribir, edges y parallel son tuplas y attributes es un mapeo
+    de solo lectura.
+
+    Atributos:
+        n_vertices: Cantidad de vertices.
+        n_edges: Cantidad de arcos.
+        source, target: Arrays con los extremos de cada arco.
+        edges: Tupla de tuplas (source, target) ordenada por e_id, para el
+               acceso de a un arco desde Python.
+        indptr, indices, neighbors: Incidencia vertice -> arco en formato
+               CSR. Los arcos del vertice v son indices[indptr[v]:indptr[v+1]]
+               (ordenados por e_id) y neighbors tiene el otro extremo de cada
+               uno. Los bucles (self-loops) aparecen una sola vez.
+        parallel: Tupla de grupos (tuplas de e_ids ordenados) de arcos que
+               unen el mismo par de vertices, solo grupos de 2 o mas arcos.
+        parallel_of: Array con el indice en parallel del grupo de cada arco,
+               o -1 si el arco no tiene arcos paralelos.
+        attributes: Mapeo (de solo lectura) nombre -> array con los
+               atributos de arco.
+    """
+
+    __slots__ = ('n_vertices', 'n_edges', 'source', 'target', 'edges'
+                 , 'indptr', 'indices', 'neighbors', 'parallel'
+                 , 'parallel_of', 'attributes')
+
+    def __init__(self, graph):
+        """
+        Args:
+            graph: Un grafo de igraph que representa la topología.
+        """
+        self.n_vertices = graph.vcount()
+        self.n_edges = graph.ecount()
+        self.edges = tuple(graph.get_edgelist())
+
+        ends = np.array(self.edges, dtype=np.int64).reshape(-1, 2)
+        self.source = _frozen(ends[:, 0].copy())
+        self.target = _frozen(ends[:, 1].copy())
+
+        # Incidencia en formato CSR, cada arco en ambos extremos salvo los
+        # bucles.
+        e_ids = np.arange(self.n_edges, dtype=np.int64)
+        loop = self.source == self.target
+        tails = np.concatenate([self.source, self.target[~loop]])
+        heads = np.concatenate([self.target, self.source[~loop]])
+        inc_e = np.concatenate([e_ids, e_ids[~loop]])
+        order = np.lexsort((inc_e, tails))
+        self.indptr = _frozen(np.concatenate(
+            [[0], np.cumsum(np.bincount(tails, minlength=self.n_vertices))]))
+        self.indices = _frozen(inc_e[order])
+        self.neighbors = _frozen(heads[order])
+
+        # Grupos de arcos paralelos
+        groups = {}
+        for e_id, (u, v) in enumerate(self.edges):
+            groups.setdefault((min(u, v), max(u, v)), []).append(e_id)
+        self.parallel = tuple(sorted(tuple(g) for g in groups.values()
+                                   if len(g) > 1))
+        parallel_of = -np.ones(self.n_edges, dtype=np.int64)
+        for p_id, group in enumerate(self.parallel):
+            parallel_of[list(group)] = p_id
+        self.parallel_of = _frozen(parallel_of)
+
+        attributes = {}
+        for name in graph.es.attributes():
+            attributes[name] = _frozen(np.array(graph.es[name]))
+        self.attributes = MappingProxyType(attributes)
+
+    def __getstate__(self):
+        # MappingProxyType no se puede serializar, se guarda el diccionario.
+        state = {name: getattr(self, name) for name in self.__slots__}
+        state['attributes'] = dict(self.attributes)
+        return state
+
+    def __setstate__(self, state):
+        state = dict(state)
+        attributes = state.pop('attributes')
+        for name, value in state.items():
+            if isinstance(value, np.ndarray):
+                value = _frozen(value)
+            setattr(self, name, value)
+        self.attributes = MappingProxyType(
+            {name: _frozen(array) for name, array in attributes.items()})
+
+    def vcount(self):
+        return self.n_vertices
+
+    def ecount(self):
+        return self.n_edges
+
+    def get_edgelist(self):
+        return list(self.edges)
+
+    def attribute(self, name):
+        """
+        Args:
+            name: El nombre del atributo de arco.
+
+        Returns: Una lista con el valor del atributo en cada arco.
+        """
+        return self.attributes[name].tolist()
+
+    def incident(self, v):
+        """
+        Args:
+            v: Un indice de vertice.
+
+        Returns: e_ids, neighbors
+            e_ids: Array con los arcos incidentes en v.
+            neighbors: Array con el otro extremo de cada arco.
+        """
+        start, end = self.indptr[v], self.indptr[v + 1]
+        return self.indices[start:end], self.neighbors[start:end]
+
+    def components(self, mask=None):
+        """
+        Etiqueta las componentes conexas del grafo.
+        Args:
+            mask: Array de booleanos por arco, False para los arcos que no
+                  pueden usarse (cortados), o None.
+
+        Returns: Array con la etiqueta de componente de cada vertice (el
+                 menor indice de vertice de la componente).
+        """
+        u, v = self.source, self.target
+        if mask is not None:
+            u, v = u[mask], v[mask]
+        return label_components(self.n_vertices, u, v)
+
+    def blocks(self, mask=None):
+        """
+        Componentes biconexas (bloques) del grafo, por arcos (Tarjan
+        iterativo sobre la incidencia CSR). Los bucles no pertenecen a
+        ningún bloque.
+        Args:
+            mask: Array de booleanos por arco, False para los arcos que no
+                  pueden usarse (cortados), o None.
+
+        Returns: Una lista de bloques, cada bloque es una lista de e_ids.
+        """
+        indptr = self.indptr.tolist()
+        indices = self.indices.tolist()
+        neighbors = self.neighbors.tolist()
+        usable = [True] * self.n_edges if mask is None else list(mask)
+
+        disc = [-1] * self.n_vertices
+        low = [0] * self.n_vertices
+        blocks = []
+        clock = 0
+        for root in range(self.n_vertices):
+            if disc[root] != -1:
+                continue
+            disc[root] = low[root] = clock
+            clock += 1
+            edge_stack = []
+            # (vertice, arco por el que se llegó, posición en la incidencia)
+            stack = [[root, -1, indptr[root]]]
+            while stack:
+                top = stack[-1]
+                v, parent_e, pos = top
+                if pos < indptr[v + 1]:
+                    top[2] = pos + 1
+                    e_id = indices[pos]
+                    w = neighbors[pos]
+                    if not usable[e_id] or e_id == parent_e or w == v:
+                        continue
+                    if disc[w] == -1:
+                        disc[w] = low[w] = clock
+                        clock += 1
+                        edge_stack.append(e_id)
+                        stack.append([w, e_id, indptr[w]])
+                    elif disc[w] < disc[v]:
+                        edge_stack.append(e_id)
+                        if disc[w] < low[v]:
+                            low[v] = disc[w]
+                    continue
+                stack.pop()
+                if not stack:
+                    continue
+                u = stack[-1][0]
+                if low[v] < low[u]:
+                    low[u] = low[v]
+                if low[v] >= disc[u]:
+                    block = []
+                    while True:
+                        e_id = edge_stack.pop()
+                        block.append(e_id)
+                        if e_id == parent_e:
+                            break
+                    blocks.append(sorted(block))
+        return blocks
+
+
+def label_components(n_vertices, u, v):
+    """
+    Etiqueta las componentes conexas de un grafo dado por los extremos de
+    sus arcos (propagación de la etiqueta minima con saltos de punteros,
+    todo sobre arrays).
+    Args:
+        n_vertices: Cantidad de vertices.
+        u, v: Arrays con los extremos de cada arco.
+
+    Returns: Array con la etiqueta de componente de cada vertice (el menor
+             indice de vertice de la componente).
+    """
+    labels = np.arange(n_vertices, dtype=np.int64)
+    while True:
+        low = np.minimum(labels[u], labels[v])
+        new = labels.copy()
+        np.minimum.at(new, labels[u], low)
+        np.minimum.at(new, labels[v], low)
+        new = new[new]
+        while True:
+            jump = new[new]
+            if np.array_equal(jump, new):
+                break
+            new = jump
+        if np.array_equal(new, labels):
+            return labels
+        labels = new
+
+
+def block_tree(n_vertices, edges, blocks):
+    """
+    Árbol de bloques y vértices: los nodos 0..n_vertices-1 son los vértices
+    y n_vertices + b el bloque b, unido a los vértices de sus arcos.
+    Args:
+        n_vertices: Cantidad de vertices.
+        edges: Lista de tuplas (source, target) ordenada por e_id.
+        blocks: Los bloques, como los devuelve Topology.blocks.
+
+    Returns: parent, depth, root
+        Listas con el padre, la profundidad y la raíz de cada nodo en un
+        BFS desde el menor vértice de cada componente (-1 para el padre de
+        las raíces).
+    """
+    n = n_vertices
+    adj = [[] for _ in range(n + len(blocks))]
+    for b, block in enumerate(blocks):
+        ends = set()
+        for e_id in block:
+            ends.update(edges[e_id])
+        for v in ends:
+            adj[v].append(n + b)
+            adj[n + b].append(v)
+    parent = [-1] * len(adj)
+    depth = [-1] * len(adj)
+    root = [-1] * len(adj)
+    for r in range(n):
+        if depth[r] != -1:
+            continue
+        depth[r] = 0
+        root[r] = r
+        queue = [r]
+        for node in queue:
+            for nxt in adj[node]:
+                if depth[nxt] == -1:
+                    depth[nxt] = depth[node] + 1
+                    parent[nxt] = node
+                    root[nxt] = r
+                    queue.append(nxt)
+    return parent, depth, root
+
+
+def block_path(tree, a, b):
+    """
+    Args:
+        tree: El árbol de bloques, como lo devuelve block_tree.
+        a, b: Indices de vértice.
+
+    Returns: El camino entre a y b en el árbol de bloques (lista de nodos
+             de a hasta b), o [] si a == b o están en componentes
+             distintas.
+    """
+    parent, depth, root = tree
+    if a == b or root[a] != root[b]:
+        return []
+    head = [a]
+    tail = [b]
+    while a != b:
+        if depth[a] >= depth[b]:
+            a = parent[a]
+            head.append(a)
+        else:
+            b = parent[b]
+            tail.append(b)
+    if head[-1] == tail[-1]:
+        tail.pop()
+    return head + tail[::-1]
+
+
+def as_topology(graph):
+    """
+    Args:
+        graph: Un grafo de igraph o un Topology.
+
+    Returns: El Topology del grafo (el mismo objeto si ya lo es).
+    """
+    if isinstance(graph, Topology):
+        return graph
+    return Topology(graph)
@@ -1,4 +1,19 @@
 # coding=utf-8
+from itertools import chain
+
+import numpy as np
+
+from survivability.utils.topology import Topology
+
+
+class _Ends(object):
+    # Extremos de los arcos de un grafo de igraph, con la misma interfaz
+    # que Topology.edges.
+    def __init__(self, graph):
+        self.es = graph.es
+
+    def __getitem__(self, e_id):
+        return self.es[e_id].tuple
 
 
 def _e2vpath(graph, epath, v=None):
@@ -6,30 +21,117 @@ def _e2vpath(graph, epath, v=None):
     Toma un camino en formato de secuencia de indices de arcos (epath) y
     devuelve un camino en formato de secuencia de indices de vertices (vpath).
     Al pasar al formato vpath se pierde informacion de caminos que pasan por
-    vertices conectados por múltiples arcos.
+    vertices conectados por múltiples arcos. El grafo puede ser un grafo de
+    igraph o su Topology.
     """
+    if isinstance(graph, Topology):
+        ends = graph.edges
+    else:
+        ends = _Ends(graph)
     vpath = []
 
     if len(epath) == 0:
         return []
     elif v is not None:
         vpath.append(v)
-        if v in ([graph.es[epath[-1]].source, graph.es[epath[-1]].target]):
+        if v in ends[epath[-1]]:
             epath = epath[::-1]
     elif len(epath) > 1:
-        if graph.es[epath[0]].source in ([graph.es[epath[1]].source
-                                             , graph.es[epath[1]].target]):
-            vpath.append(graph.es[epath[0]].target)
+        if ends[epath[0]][0] in ends[epath[1]]:
+            vpath.append(ends[epath[0]][1])
         else:
-            vpath.append(graph.es[epath[0]].source)
+            vpath.append(ends[epath[0]][0])
     elif len(epath) == 1:
-        vpath.append(graph.es[epath[0]].source)
+        vpath.append(ends[epath[0]][0])
 
     for eid in epath:
-        if graph.es[eid].source == vpath[-1]:
-            vpath.append(graph.es[eid].target)
-        elif graph.es[eid].target == vpath[-1]:
-            vpath.append(graph.es[eid].source)
+        source, target = ends[eid]
+        if source == vpath[-1]:
+            vpath.append(target)
+        elif target == vpath[-1]:
+            vpath.append(source)
         else:
             raise IndexError("Not valid epath")
     return vpath
+
+
+def _e2vpaths(graph, epaths, ragged=False, cache=None):
+    """
+    Versión por lotes de _e2vpath (sin v): convierte muchos epaths a vpaths
+    con operaciones de NumPy sobre los extremos de los arcos. El vértice
+    siguiente de cada salto es u + v menos el anterior, así todos los
+    vértices salen de una suma alternada acumulada sobre los epaths
+    concatenados. Los epaths repetidos se convierten una sola vez.
+
+    Args:
+        graph: Un grafo de igraph o su Topology.
+        epaths: Una lista de caminos en formato epath.
+        ragged: Si es True el resultado se devuelve en formato plano.
+        cache: Diccionario tupla(epath) -> vpath para reutilizar los
+               caminos ya convertidos entre llamadas con el mismo grafo, o
+               None.
+
+    Returns: Una lista con el vpath de cada epath (como _e2vpath), o con
+             ragged un par indptr, values de arrays donde el vpath i es
+             values[indptr[i]:indptr[i+1]].
+
+    Raises:
+        IndexError: Si alguno de los epaths no es un camino.
+    """
+    if cache is None:
+        cache = {}
+    keys = [tuple(epath) for epath in epaths]
+    missing = [key for key in dict.fromkeys(keys) if key not in cache]
+    if missing:
+        if isinstance(graph, Topology):
+            source, target = graph.source, graph.target
+        else:
+            ends = np.array(graph.get_edgelist(), dtype=np.int64)
+            source, target = ends.reshape(-1, 2).T
+        lengths = np.array([len(key) for key in missing], dtype=np.int64)
+        indptr = np.zeros(len(missing) + 1, dtype=np.int64)
+        np.cumsum(lengths, out=indptr[1:])
+        flat = np.fromiter(chain.from_iterable(missing), dtype=np.int64
+                           , count=indptr[-1])
+        u, v = source[flat], target[flat]
+
+        # Primer vértice: el extremo del primer arco que no comparte con el
+        # segundo (el source si hay un solo arco).
+        first = np.zeros(len(missing), dtype=np.int64)
+        some = lengths > 0
+        first[some] = u[indptr[:-1][some]]
+        many = lengths > 1
+        e0 = indptr[:-1][many]
+        shared = (u[e0] == u[e0 + 1]) | (u[e0] == v[e0 + 1])
+        first[many] = np.where(shared, v[e0], u[e0])
+
+        # x(i+1) = u(i) + v(i) - x(i)
+        seg = np.repeat(np.arange(len(missing)), lengths)
+        pos = np.arange(len(flat)) - indptr[seg]
+        sign = np.where(np.arange(len(flat)) % 2 == 0, 1, -1)
+        acc = np.concatenate(([0], np.cumsum(sign * (u + v))))
+        following = (sign * (acc[1:] - acc[indptr[seg]])
+                     + np.where(pos % 2 == 0, -1, 1) * first[seg])
+        previous = np.where(pos == 0, first[seg]
+                            , np.concatenate(([0], following[:-1])))
+        if not np.all((previous == u) | (previous == v)):
+            raise IndexError("Not valid epath")
+
+        out_ptr = np.zeros(len(missing) + 1, dtype=np.int64)
+        np.cumsum(lengths + some, out=out_ptr[1:])
+        values = np.zeros(out_ptr[-1], dtype=np.int64)
+        values[out_ptr[:-1][some]] = first[some]
+        values[out_ptr[seg] + pos + 1] = following
+        values = values.tolist()
+        out_ptr = out_ptr.tolist()
+        for i, key in enumerate(missing):
+            cache[key] = values[out_ptr[i]:out_ptr[i + 1]]
+
+    if not ragged:
+        return [cache[key][:] for key in keys]
+    lengths = [len(cache[key]) for key in keys]
+    indptr = np.zeros(len(keys) + 1, dtype=np.int64)
+    np.cumsum(lengths, out=indptr[1:])
+    values = np.fromiter(chain.from_iterable(cache[key] for key in keys)
+                         , dtype=np.int64, count=indptr[-1])
+    return indptr, values
@@ -0,0 +1,65 @@
+# coding=utf-8
+import random
+
+import igraph
+import pytest
+
+from survivability.rca.paths import ShortestPaths
+
+
+def _simple_paths(edges, s, d, allowed):
+    # Every loopless epath from s to d, by depth first search.
+    inc = {}
+    for e_id, (u, v) in enumerate(edges):
+        if allowed[e_id] and u != v:
+            inc.setdefault(u, []).append((e_id, v))
+            inc.setdefault(v, []).append((e_id, u))
+    found = []
+    stack = [(s, [], {s})]
+    while stack:
+        v, epath, visited = stack.pop()
+        if v == d:
+            found.append(epath)
+            continue
+        for e_id, w in inc.get(v, []):
+            if w not in visited:
+                stack.append((w, epath + [e_id], visited | {w}))
+    return found
+
+
+def _random_graph(rng):
+    n = rng.randint(4, 8)
+    edges = [(rng.randrange(n), rng.randrange(n))
+             for _ in range(rng.randint(n, 3 * n))]
+    graph = igraph.Graph(n=n, edges=edges)
+    graph.es['weight'] = [rng.randint(1, 10) for _ in edges]
+    return graph
+
+
+@pytest.mark.parametrize('seed', range(200))
+def test_k_shortest_matches_brute_force(seed):
+    rng = random.Random(seed)
+    graph = _random_graph(rng)
+    edges = graph.get_edgelist()
+    weight = graph.es['weight']
+    allowed = [rng.random() > 0.1 for _ in edges]
+    s, d = rng.sample(range(graph.vcount()), 2)
+    n = rng.randint(1, 6)
+    max_hops = rng.choice([None, 1, 2, 3])
+    max_length = rng.choice([None, 15, 25])
+
+    def length(epath):
+        return sum(weight[e_id] for e_id in epath)
+
+    expected = [p for p in _simple_paths(edges, s, d, allowed)
+                if (max_hops is None or len(p) <= max_hops)
+                and (max_length is None or length(p) <= max_length)]
+    expected = sorted(length(p) for p in expected)[:n]
+
+    paths = ShortestPaths(graph, 'weight').k_shortest(
+        s, d, n, allowed=allowed, max_length=max_length, max_hops=max_hops)
+
+    assert [length(p) for p in paths] == expected
+    assert len(set(map(tuple, paths))) == len(paths)
+    for epath in paths:
+        assert epath in _simple_paths(edges, s, d, allowed)